@@ -0,0 +1,146 @@
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from metrics import metrics
+
+# Stage name -> (concurrency variable, default concurrency)
+STAGES = {
+    'clone': ('DOCSMITH_MAX_CLONES', 2),
+    'extract': ('DOCSMITH_MAX_EXTRACTIONS', 2),
+    'analysis': ('DOCSMITH_MAX_ANALYSES', 2),
+    'llm': ('DOCSMITH_MAX_LLM_CALLS', 16),
+}
+
+MAX_RETRY_AFTER = 120
+
+
+class Overloaded(Exception):
+    """A stage is at capacity and its queue is full; retry after retry_after seconds"""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f'Server is busy ({stage}); please retry in {retry_after} seconds')
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class StageLimiter:
+    """Concurrency cap for one stage with a bounded wait queue
+
+    Up to `concurrency` callers run at once. Further callers wait for at most
+    `max_wait` seconds; when `max_queue` are already waiting, or the wait runs
+    out, Overloaded is raised with a Retry-After estimate based on how long
+    the stage's work usually takes.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._semaphore = threading.BoundedSemaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        # Moving average of how long one unit of work holds a slot
+        self._average_seconds = 1.0
+
+    def retry_after(self, queued: Optional[int] = None) -> int:
+        queued = self._waiting if queued is None else queued
+        estimate = self._average_seconds * (queued + 1) / self.concurrency
+        return int(min(MAX_RETRY_AFTER, max(1, math.ceil(estimate))))
+
+    def _reject(self, queued: Optional[int] = None) -> Overloaded:
+        metrics.inc('docsmith_admission_rejected_total', stage=self.name)
+        return Overloaded(self.name, self.retry_after(queued))
+
+    def check(self, queued: int):
+        """Reject early when work queued elsewhere for this stage already fills its queue"""
+        if queued >= self.max_queue:
+            raise self._reject(queued)
+
+    @contextmanager
+    def slot(self, max_wait: Optional[float] = None) -> Iterator[None]:
+        """Hold one of the stage's slots for the duration of a block"""
+        with self._lock:
+            if self._active >= self.concurrency and self._waiting >= self.max_queue:
+                raise self._reject()
+            self._waiting += 1
+
+        started = time.monotonic()
+        try:
+            wait = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+            acquired = self._semaphore.acquire(timeout=max(0.0, wait))
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not acquired:
+            raise self._reject()
+
+        metrics.observe('docsmith_admission_wait_seconds', time.monotonic() - started, stage=self.name)
+        with self._lock:
+            self._active += 1
+            metrics.set('docsmith_admission_active', self._active, stage=self.name)
+
+        held = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * (time.monotonic() - held)
+                metrics.set('docsmith_admission_active', self._active, stage=self.name)
+            self._semaphore.release()
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'concurrency': self.concurrency,
+                'active': self._active,
+                'waiting': self._waiting,
+                'max_queue': self.max_queue,
+                'average_seconds': round(self._average_seconds, 3)
+            }
+
+
+class AdmissionController:
+    """Per-stage limiters for clones, extractions, analyses and LLM calls"""
+
+    def __init__(self, stages: Dict[str, StageLimiter]):
+        self.stages = stages
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionController':
+        max_wait = float(os.getenv('DOCSMITH_ADMISSION_WAIT', '10'))
+        queue_factor = float(os.getenv('DOCSMITH_ADMISSION_QUEUE_FACTOR', '4'))
+        stages = {}
+        for name, (variable, default) in STAGES.items():
+            concurrency = int(os.getenv(variable, str(default)))
+            stages[name] = StageLimiter(name, concurrency, int(concurrency * queue_factor), max_wait)
+        return cls(stages)
+
+    def slot(self, stage: str, max_wait: Optional[float] = None):
+        return self.stages[stage].slot(max_wait)
+
+    def check(self, stage: str, queued: int):
+        self.stages[stage].check(queued)
+
+    def to_dict(self) -> Dict:
+        return {name: limiter.to_dict() for name, limiter in self.stages.items()}
+
+
+_admission: Optional[AdmissionController] = None
+_admission_lock = threading.Lock()
+
+
+def get_admission() -> AdmissionController:
+    """Process-wide controller, created on first use so settings from .env apply"""
+    global _admission
+    if _admission is None:
+        with _admission_lock:
+            if _admission is None:
+                _admission = AdmissionController.from_env()
+    return _admission
@@ -0,0 +1,12 @@
+"""
+Modules and data every isolated analysis needs, loaded once by the fork server
+
+Listed in the analysis runner's preload, so children forked from the server
+start with the analysis code imported and the tiktoken encoding in memory
+instead of loading both for each analysis.
+"""
+
+import doc_generator  # noqa: F401
+from code_analyzer import get_token_encoding
+
+get_token_encoding()
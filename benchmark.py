@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for DocSmith
+
+Measures import time and cold start in fresh interpreters, then generates
+synthetic repositories and times the analysis phases, ZIP ingestion, prompt
+building and end-to-end /generate-docs against the stub LLM backend.
+Results are written to bench_output.txt.
+
+    python3 benchmark.py --sizes 1000,10000,100000
+"""
+
+import os
+import io
+import sys
+import time
+import random
+import shutil
+import subprocess
+import zipfile
+import argparse
+import tempfile
+import resource
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+current_dir = Path(__file__).parent.absolute()
+sys.path.insert(0, str(current_dir))
+
+# The benchmark never talks to the network
+os.environ['DOCSMITH_LLM_BACKEND'] = 'stub'
+
+DOC_TYPES = ['architecture_overview', 'developer_guide', 'api_documentation']
+
+LANGUAGE_TEMPLATES = {
+    '.py': (
+        "import os\nfrom typing import Dict\n\n\n"
+        "class {name}Service:\n"
+        "    \"\"\"Service object number {index}\"\"\"\n\n"
+        "    def __init__(self, config: Dict):\n"
+        "        self.config = config\n\n"
+        "    def run(self, value: int) -> int:\n"
+        "        # Multiply the value by the configured factor\n"
+        "        return value * self.config.get('factor', {index})\n"
+    ),
+    '.js': (
+        "const express = require('express');\n"
+        "const router = express.Router();\n\n"
+        "// Handler number {index}\n"
+        "router.get('/{name}', (req, res) => {{\n"
+        "    res.json({{ id: {index}, name: '{name}' }});\n"
+        "}});\n\n"
+        "module.exports = router;\n"
+    ),
+    '.ts': (
+        "export interface {name}Model {{\n"
+        "    id: number;\n"
+        "    label: string;\n"
+        "}}\n\n"
+        "export function make{name}(id: number): {name}Model {{\n"
+        "    return {{ id, label: '{name}-' + {index} }};\n"
+        "}}\n"
+    ),
+    '.java': (
+        "package com.example;\n\n"
+        "public class {name} {{\n"
+        "    private final int value = {index};\n\n"
+        "    public int getValue() {{\n"
+        "        return value;\n"
+        "    }}\n"
+        "}}\n"
+    ),
+    '.go': (
+        "package main\n\n"
+        "import \"fmt\"\n\n"
+        "// {name} prints item {index}\n"
+        "func {name}() {{\n"
+        "\tfmt.Println(\"{name}\", {index})\n"
+        "}}\n"
+    ),
+    '.rs': (
+        "/// {name} returns item {index}\n"
+        "pub fn {name_lower}() -> u32 {{\n"
+        "    {index}\n"
+        "}}\n"
+    ),
+    '.md': "# {name}\n\nNotes for component {index}.\n\n- item one\n- item two\n",
+    '.json': "{{\n  \"name\": \"{name}\",\n  \"index\": {index}\n}}\n",
+    '.yml': "name: {name}\nindex: {index}\nenabled: true\n",
+}
+
+ROOT_FILES = {
+    'main.py': "from app import create_app\n\napp = create_app()\n\nif __name__ == '__main__':\n    app.run()\n",
+    'app.py': "from flask import Flask\n\n\ndef create_app():\n    app = Flask(__name__)\n\n    @app.route('/health')\n    def health():\n        return 'ok'\n\n    return app\n",
+    'requirements.txt': "flask>=2.0\nrequests>=2.31\n",
+    'package.json': '{\n  "name": "synthetic",\n  "dependencies": {"express": "^4.18.0", "react": "^18.0.0"}\n}\n',
+    'README.md': "# Synthetic Project\n\nGenerated by the DocSmith benchmark suite.\n",
+}
+
+
+def generate_synthetic_repo(root: Path, num_files: int, seed: int = 42) -> Path:
+    """Write a deterministic mixed-language repository with num_files files"""
+    rng = random.Random(seed)
+    extensions = list(LANGUAGE_TEMPLATES.keys())
+    root.mkdir(parents=True, exist_ok=True)
+
+    for name, content in ROOT_FILES.items():
+        (root / name).write_text(content, encoding='utf-8')
+
+    files_per_dir = 50
+    for index in range(max(0, num_files - len(ROOT_FILES))):
+        package = index // files_per_dir
+        directory = root / 'src' / f'pkg_{package // 20:03d}' / f'mod_{package:05d}'
+        if index % files_per_dir == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+
+        extension = extensions[rng.randrange(len(extensions))]
+        name = f"Item{index}"
+        block = LANGUAGE_TEMPLATES[extension].format(name=name, name_lower=name.lower(), index=index)
+        content = block * rng.randint(1, 6)
+
+        (directory / f"file_{index:06d}{extension}").write_text(content, encoding='utf-8')
+
+    return root
+
+
+def zip_directory(path: Path) -> bytes:
+    """Pack a directory into an in-memory ZIP archive"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for root, dirs, files in os.walk(path):
+            for file in files:
+                file_path = Path(root) / file
+                zip_file.write(file_path, os.path.relpath(file_path, path))
+    return buffer.getvalue()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(fn: Callable, repeat: int = 1, setup: Optional[Callable] = None) -> Tuple[float, object]:
+    """Run fn repeat times and return the best wall time and the last result; setup runs untimed before each run"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def traced_peak(fn: Callable) -> float:
+    """Peak Python heap allocation in MB while running fn"""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+# Each snippet runs in a fresh interpreter and prints the seconds it measured
+STARTUP_SNIPPETS = [
+    ('startup.import_flask_app', "import flask_app"),
+    ('startup.import_doc_generator', "import doc_generator"),
+    ('startup.first_request', "import flask_app; flask_app.app.test_client().get('/')"),
+    ('startup.preload', "import preload; preload.preload()"),
+]
+
+
+def bench_startup(repeat: int) -> List[Tuple[str, float]]:
+    results = []
+    for name, snippet in STARTUP_SNIPPETS:
+        code = f"import time; started = time.perf_counter(); {snippet}; print(time.perf_counter() - started)"
+        best = None
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, '-c', code], cwd=str(current_dir), env=os.environ.copy(),
+                capture_output=True, text=True, check=True
+            ).stdout
+            seconds = float(output.strip().splitlines()[-1])
+            best = seconds if best is None else min(best, seconds)
+        results.append((name, best))
+
+    # Whole process, including interpreter start-up
+    elapsed, _ = timed(lambda: subprocess.run(
+        [sys.executable, '-c', "import flask_app"], cwd=str(current_dir), env=os.environ.copy(), check=True,
+        capture_output=True
+    ), repeat)
+    results.append(('startup.cold_process', elapsed))
+    return results
+
+
+def bench_analysis(path: Path, repeat: int) -> List[Tuple[str, float]]:
+    """Analysis phases with an empty per-file stats cache, then the phases that use it with the cache filled"""
+    from code_analyzer import CodebaseAnalyzer, file_stats_cache
+
+    analyzer = CodebaseAnalyzer()
+    phases = [
+        ('analyze.structure', lambda: analyzer._analyze_structure(path)),
+        ('analyze.technologies', lambda: analyzer._detect_technologies(path)),
+        ('analyze.key_files', lambda: analyzer._extract_key_files(path)),
+        ('analyze.setup_files', lambda: analyzer._find_setup_files(path)),
+        ('analyze.statistics', lambda: analyzer._calculate_statistics(path)),
+        ('analyze.dependencies', lambda: analyzer._analyze_dependencies(path)),
+        ('analyze.total', lambda: analyzer.analyze_codebase(str(path))),
+    ]
+
+    results = []
+    for name, fn in phases:
+        elapsed, _ = timed(fn, repeat, setup=file_stats_cache.clear)
+        results.append((name, elapsed))
+
+    # Same content uploaded again: every file's statistics come from the cache
+    analyzer.analyze_codebase(str(path))
+    for name, fn in phases:
+        if name in ('analyze.statistics', 'analyze.total'):
+            elapsed, _ = timed(fn, repeat)
+            results.append((f'{name}.warm', elapsed))
+    return results
+
+
+def bench_prompts(path: Path, repeat: int) -> List[Tuple[str, float]]:
+    from code_analyzer import CodebaseAnalyzer
+    from doc_generator import DocumentationGenerator
+
+    analysis = CodebaseAnalyzer().analyze_codebase(str(path))
+    doc_generator = DocumentationGenerator()
+    claude = doc_generator.claude
+
+    builders = [
+        ('prompt.overview', lambda: claude.build_overview_prompt(analysis)),
+        ('prompt.developer_guide', lambda: claude.build_developer_guide_prompt(analysis)),
+        ('prompt.api_docs', lambda: claude.build_api_docs_prompt(doc_generator._extract_api_info(analysis))),
+    ]
+
+    results = []
+    for name, fn in builders:
+        elapsed, _ = timed(fn, repeat)
+        results.append((name, elapsed))
+    return results
+
+
+def bench_ingestion(path: Path) -> List[Tuple[str, float]]:
+    from flask_app import app
+
+    archive = zip_directory(path)
+    client = app.test_client()
+
+    def upload():
+        response = client.post(
+            '/upload-zip',
+            data={'zip_file': (io.BytesIO(archive), 'bench.zip')},
+            content_type='multipart/form-data'
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"/upload-zip failed: {response.get_json()}")
+
+    elapsed, _ = timed(upload)
+    return [('ingest.upload_zip', elapsed), ('ingest.archive_mb', len(archive) / (1024 * 1024))]
+
+
+def bench_end_to_end(path: Path) -> List[Tuple[str, float]]:
+    from flask_app import app
+
+    client = app.test_client()
+    response = client.post('/set-local-path', data={'local_path': str(path)})
+    if response.status_code != 200:
+        raise RuntimeError(f"/set-local-path failed: {response.get_json()}")
+
+    def generate():
+        response = client.post('/generate-docs', data={'doc_types': DOC_TYPES})
+        if response.status_code != 200:
+            raise RuntimeError(f"/generate-docs failed: {response.get_json()}")
+
+    elapsed, _ = timed(generate)
+    heap_peak = traced_peak(generate)
+    return [('e2e.generate_docs', elapsed), ('e2e.heap_peak_mb', heap_peak)]
+
+
+def run_benchmarks(sizes: List[int], repeat: int, workdir: Path) -> List[str]:
+    from code_analyzer import CodebaseAnalyzer, file_stats_cache
+
+    lines = [
+        f"DocSmith benchmark - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        f"python {sys.version.split()[0]}, repeat={repeat}, backend=stub",
+        ""
+    ]
+
+    lines.append("== startup ==")
+    for name, value in bench_startup(repeat):
+        lines.append(f"{name:<28} {value:>12.4f} s")
+    lines.append("")
+
+    for size in sizes:
+        repo_path = workdir / f"repo_{size}"
+        generate_elapsed, _ = timed(lambda: generate_synthetic_repo(repo_path, size))
+        print(f"Generated {size} files in {generate_elapsed:.2f}s")
+
+        results: List[Tuple[str, float]] = []
+        results.extend(bench_analysis(repo_path, repeat))
+        file_stats_cache.clear()
+        results.append(('analyze.heap_peak_mb', traced_peak(lambda: CodebaseAnalyzer().analyze_codebase(str(repo_path)))))
+        results.extend(bench_prompts(repo_path, repeat))
+        results.extend(bench_ingestion(repo_path))
+        results.extend(bench_end_to_end(repo_path))
+        results.append(('process.peak_rss_mb', peak_rss_mb()))
+
+        lines.append(f"== {size} files ==")
+        for name, value in results:
+            unit = 'MB' if name.endswith('_mb') else 's'
+            lines.append(f"{name:<28} {value:>12.4f} {unit}")
+        lines.append("")
+
+        shutil.rmtree(repo_path, ignore_errors=True)
+
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the offline DocSmith benchmark suite')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma-separated synthetic repository sizes (number of files)')
+    parser.add_argument('--repeat', type=int, default=1, help='Repetitions per measurement (best is kept)')
+    parser.add_argument('--output', default=str(current_dir / 'bench_output.txt'), help='Results file')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    workdir = Path(tempfile.mkdtemp(prefix='docsmith_bench_'))
+
+    try:
+        lines = run_benchmarks(sizes, args.repeat, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = "\n".join(lines) + "\n"
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(report)
+
+    print(report)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,115 @@
 import os
+import time
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from typing import Dict, List, Optional
-import anthropic
 from dotenv import load_dotenv
 
+from llm_backends import LLMBackend, LLMResponse, LLMTimeout, shared_backend
+from metrics import metrics, span, record_cache, record_llm_usage, current_usage
+from deadline import DeadlineExceeded, budget
+from code_chunking import CodeChunk, split_code
+from code_analyzer import count_tokens, truncate_to_tokens
+from model_router import TIERS, ModelRouter, Route, get_router
+from admission import get_admission
+
 load_dotenv()
 
+# Bump when prompt templates change so coalesced/cached generations are not reused
+PROMPT_VERSION = "2"
+
+# Snippets above this many tokens are explained in chunks
+EXPLAIN_CHUNK_TOKENS = int(os.getenv('DOCSMITH_EXPLAIN_CHUNK_TOKENS', '2000'))
+EXPLAIN_WORKERS = int(os.getenv('DOCSMITH_EXPLAIN_WORKERS', '4'))
+# Snippets that would split into more chunks are refused (one LLM call per chunk)
+EXPLAIN_MAX_CHUNKS = int(os.getenv('DOCSMITH_EXPLAIN_MAX_CHUNKS', '32'))
+# Chunk explanations merged by one synthesis call; more are merged in groups first
+SYNTHESIS_TOKENS = int(os.getenv('DOCSMITH_EXPLAIN_SYNTHESIS_TOKENS', '12000'))
+
+# Upper bound for one LLM call, further limited by the request deadline
+LLM_TIMEOUT = float(os.getenv('DOCSMITH_LLM_TIMEOUT', '120'))
+
+# A duplicate request is sent once a call runs longer than this latency
+# percentile of its route; 0 disables hedging
+HEDGE_PERCENTILE = float(os.getenv('DOCSMITH_HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_SAMPLES = int(os.getenv('DOCSMITH_HEDGE_MIN_SAMPLES', '20'))
+
+COMPLETION_CACHE_SIZE = 512
+
+# Completed responses by prompt hash, shared by all requests in the process.
+# Chunk explanations are served from here; other tasks only fall back to it on timeout.
+_completions: 'OrderedDict[str, str]' = OrderedDict()
+_completions_lock = threading.Lock()
+
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('DOCSMITH_HEDGE_WORKERS', '16')), thread_name_prefix='llm'
+)
+
+PARTIAL_NOTE = "\n\n---\n*This response was cut off at the time limit and is incomplete.*\n"
+
+
+class ExplanationTooLarge(Exception):
+    """A snippet would need more chunk explanations than EXPLAIN_MAX_CHUNKS"""
+
+
+def _group_by_tokens(sizes: List[int], budget: int) -> List[tuple]:
+    """[start, end) ranges of consecutive items whose sizes add up to at most budget (at least two per group)"""
+    groups, start, total = [], 0, 0
+    for index, size in enumerate(sizes):
+        if index - start >= 2 and total + size > budget:
+            groups.append((start, index))
+            start, total = index, 0
+        total += size
+    groups.append((start, len(sizes)))
+    return groups
+
+
+def _completion_key(route: Route, prompt: str) -> str:
+    return hashlib.sha256(f"{PROMPT_VERSION}|{route.model}|{prompt}".encode('utf-8')).hexdigest()
+
+
+def _cached_completion(key: str) -> Optional[str]:
+    with _completions_lock:
+        text = _completions.get(key)
+        if text is not None:
+            _completions.move_to_end(key)
+        return text
+
+
+def _store_completion(key: str, text: str):
+    with _completions_lock:
+        _completions[key] = text
+        while len(_completions) > COMPLETION_CACHE_SIZE:
+            _completions.popitem(last=False)
+
+
 class ClaudeDocGenerator:
-    def __init__(self):
-        self.client = anthropic.Anthropic(
-            api_key=os.getenv("ANTHROPIC_API_KEY")
-        )
+    def __init__(self, backend: Optional[LLMBackend] = None, router: Optional[ModelRouter] = None,
+                 tier: str = 'standard'):
+        self._backend = backend
+        self.router = router or get_router()
+        self.tier = tier if tier in TIERS else 'standard'
     
-    def generate_overview(self, codebase_info: Dict) -> str:
-        prompt = f"""
+    @property
+    def backend(self) -> LLMBackend:
+        # Created on first use so prompt building works without credentials
+        if self._backend is None:
+            self._backend = shared_backend()
+        return self._backend
+
+    def _related_code_section(self, related_code: str) -> str:
+        if not related_code:
+            return ""
+        return f"""
+        Relevant Code:
+        {related_code}
+"""
+
+    def build_overview_prompt(self, codebase_info: Dict, related_code: str = "") -> str:
+        return f"""
         Analyze this codebase and generate a comprehensive architecture overview:
 
         Project Structure:
@@ -23,7 +120,7 @@ class ClaudeDocGenerator:
 
         Technologies Detected:
         {codebase_info.get('technologies', '')}
-
+{self._related_code_section(related_code)}
         Please provide:
         1. High-level architecture overview
         2. Main components and their relationships
@@ -33,17 +130,9 @@ class ClaudeDocGenerator:
 
         Format the response as a professional technical document.
         """
-        
-        response = self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=4000,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        return response.content[0].text
-    
-    def generate_developer_guide(self, codebase_info: Dict) -> str:
-        prompt = f"""
+
+    def build_developer_guide_prompt(self, codebase_info: Dict, related_code: str = "") -> str:
+        return f"""
         Create a developer onboarding guide for this codebase:
 
         Project Structure:
@@ -54,7 +143,7 @@ class ClaudeDocGenerator:
 
         Key Components:
         {codebase_info.get('key_files', '')}
-
+{self._related_code_section(related_code)}
         Please provide:
         1. Getting started guide
         2. Development environment setup
@@ -65,17 +154,9 @@ class ClaudeDocGenerator:
 
         Make it beginner-friendly but comprehensive.
         """
-        
-        response = self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=4000,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        return response.content[0].text
-    
-    def generate_api_docs(self, api_info: Dict) -> str:
-        prompt = f"""
+
+    def build_api_docs_prompt(self, api_info: Dict, related_code: str = "") -> str:
+        return f"""
         Generate API documentation for this codebase:
 
         API Endpoints/Functions:
@@ -86,7 +167,7 @@ class ClaudeDocGenerator:
 
         Configuration:
         {api_info.get('config', '')}
-
+{self._related_code_section(related_code)}
         Please provide:
         1. API reference with endpoints/functions
         2. Request/response examples
@@ -96,17 +177,9 @@ class ClaudeDocGenerator:
 
         Use clear, standardized API documentation format.
         """
-        
-        response = self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=4000,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        return response.content[0].text
-    
-    def explain_code_section(self, code: str, context: str = "") -> str:
-        prompt = f"""
+
+    def build_explanation_prompt(self, code: str, context: str = "") -> str:
+        return f"""
         Explain this code section in detail:
 
         Context: {context}
@@ -125,11 +198,239 @@ class ClaudeDocGenerator:
 
         Make the explanation clear for developers at different skill levels.
         """
-        
-        response = self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=3000,
-            messages=[{"role": "user", "content": prompt}]
+
+    def build_chunk_explanation_prompt(self, chunk: CodeChunk, context: str = "") -> str:
+        return f"""
+        Explain this part of a larger source file:
+
+        Context: {context}
+
+        Code:
+        ```
+        {chunk.text}
+        ```
+
+        Please provide:
+        1. What this part does
+        2. How it works (step-by-step breakdown)
+        3. Key algorithms or patterns used
+        4. Dependencies on code outside this part
+
+        Be concise; this explanation will be combined with explanations of the other parts.
+        """
+
+    def build_synthesis_prompt(self, chunks: List[CodeChunk], explanations: List[str], context: str = "",
+                               whole_file: bool = True) -> str:
+        parts = "\n\n".join(
+            f"Lines {chunk.start_line}-{chunk.end_line}{': ' + chunk.name if chunk.name else ''}\n{explanation}"
+            for chunk, explanation in zip(chunks, explanations)
         )
-        
-        return response.content[0].text
\ No newline at end of file
+        scope = 'the whole file does' if whole_file else 'these parts do together'
+        return f"""
+        These are explanations of consecutive parts of one source file:
+
+        Context: {context}
+
+        {parts}
+
+        Please provide:
+        1. What {scope} (high-level purpose)
+        2. How the parts fit together and how data flows between them
+        3. Key algorithms or patterns used
+        4. Dependencies and relationships
+        5. Potential improvements or considerations
+
+        Make the explanation clear for developers at different skill levels.
+        """
+
+    def generate_overview(self, codebase_info: Dict) -> str:
+        return self._run('architecture_overview', self.build_overview_prompt(codebase_info))
+
+    def generate_developer_guide(self, codebase_info: Dict) -> str:
+        return self._run('developer_guide', self.build_developer_guide_prompt(codebase_info))
+
+    def generate_api_docs(self, api_info: Dict) -> str:
+        return self._run('api_documentation', self.build_api_docs_prompt(api_info))
+
+    def generate_from_prompt(self, doc_type: str, prompt: str, allow_partial: bool = True) -> str:
+        """Run a prompt that was built ahead of time (see DocumentationGenerator.prepare)
+
+        With allow_partial=False a timeout raises instead of returning fallback
+        content, so callers that share results do not share partial ones.
+        """
+        return self._run(doc_type, prompt, allow_partial)
+
+    def model_for(self, task: str, prompt: str) -> str:
+        """Model the router picks for a prompt, e.g. to key shared results"""
+        return self.route(task, prompt).model
+
+    def route(self, task: str, prompt: str) -> Route:
+        return self.router.route(task, count_tokens(prompt), self.tier)
+
+    def explain_code_section(self, code: str, context: str = "", language: str = "") -> str:
+        if count_tokens(code) <= EXPLAIN_CHUNK_TOKENS:
+            return self._run('explanation', self.build_explanation_prompt(code, context))
+        return self._explain_in_chunks(code, context, language)
+
+    def _explain_in_chunks(self, code: str, context: str, language: str) -> str:
+        """Explain syntactic chunks concurrently, then merge them with one synthesis call"""
+        with span('explain.split'):
+            chunks = split_code(code, language, EXPLAIN_CHUNK_TOKENS, count_tokens)
+        if len(chunks) > EXPLAIN_MAX_CHUNKS:
+            raise ExplanationTooLarge(
+                f"Code is too long to explain: {len(chunks)} parts of about {EXPLAIN_CHUNK_TOKENS} tokens, "
+                f"limit {EXPLAIN_MAX_CHUNKS}. Explain a smaller section."
+            )
+
+        workers = max(1, min(EXPLAIN_WORKERS, len(chunks)))
+        with span('explain.chunks', chunks=len(chunks)):
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='explain') as executor:
+                # Each chunk runs in a copy of the request context to keep its trace and deadline
+                futures = [
+                    executor.submit(contextvars.copy_context().run, self._explain_chunk, chunk, context)
+                    for chunk in chunks
+                ]
+                explanations = [future.result() for future in futures]
+
+        overview = self._synthesize(chunks, explanations, context)
+
+        sections = [overview, "## Section Details"]
+        for chunk, explanation in zip(chunks, explanations):
+            title = f"### Lines {chunk.start_line}-{chunk.end_line}"
+            if chunk.name:
+                title += f": `{chunk.name}`"
+            sections.append(f"{title}\n\n{explanation}")
+        return "\n\n".join(sections)
+
+    def _synthesize(self, chunks: List[CodeChunk], explanations: List[str], context: str) -> str:
+        """Merge chunk explanations into one overview, in rounds of groups that fit SYNTHESIS_TOKENS"""
+        # No single part may take more than a quarter of a synthesis prompt
+        explanations = [truncate_to_tokens(explanation, SYNTHESIS_TOKENS // 4) for explanation in explanations]
+        while True:
+            groups = _group_by_tokens([count_tokens(explanation) for explanation in explanations], SYNTHESIS_TOKENS)
+            if len(groups) == 1:
+                return self._run('explain_synthesis', self.build_synthesis_prompt(chunks, explanations, context))
+
+            with span('explain.synthesis_round', groups=len(groups)):
+                with ThreadPoolExecutor(max_workers=max(1, min(EXPLAIN_WORKERS, len(groups))),
+                                        thread_name_prefix='explain') as executor:
+                    futures = [
+                        executor.submit(
+                            contextvars.copy_context().run, self._run, 'explain_synthesis',
+                            self.build_synthesis_prompt(chunks[start:end], explanations[start:end], context,
+                                                        whole_file=False)
+                        )
+                        for start, end in groups
+                    ]
+                    merged = [future.result() for future in futures]
+
+            chunks = [
+                CodeChunk('', chunks[start].start_line, chunks[end - 1].end_line, '')
+                for start, end in groups
+            ]
+            explanations = [truncate_to_tokens(explanation, SYNTHESIS_TOKENS // 4) for explanation in merged]
+
+    def _explain_chunk(self, chunk: CodeChunk, context: str) -> str:
+        prompt = self.build_chunk_explanation_prompt(chunk, context)
+        route = self.route('explain_chunk', prompt)
+
+        cached = _cached_completion(_completion_key(route, prompt))
+        record_cache('explain_chunk', cached is not None)
+        if cached is not None:
+            return cached
+        return self._run_route(route, prompt, allow_partial=True)
+
+    def fallback(self, task: str, prompt: str, error: Exception) -> str:
+        """Content to use when a call times out: a cached answer, the partial text, or a notice"""
+        cached = _cached_completion(_completion_key(self.route(task, prompt), prompt))
+        record_cache('llm_fallback', cached is not None)
+        if cached is not None:
+            return cached
+
+        partial = getattr(error, 'partial', '')
+        metrics.inc('docsmith_llm_fallbacks_total', route=task, kind='partial' if partial else 'empty')
+        if partial:
+            return partial + PARTIAL_NOTE
+        return f"*This section was not generated because the request ran out of time ({error}).*\n"
+
+    def _run(self, task: str, prompt: str, allow_partial: bool = True) -> str:
+        return self._run_route(self.route(task, prompt), prompt, allow_partial)
+
+    def _run_route(self, route: Route, prompt: str, allow_partial: bool) -> str:
+        try:
+            return self._complete(prompt, route)
+        except (LLMTimeout, DeadlineExceeded) as e:
+            if not allow_partial:
+                raise
+            return self.fallback(route.task, prompt, e)
+
+    def _complete(self, prompt: str, route: Route) -> str:
+        """Call the backend within the request deadline, hedging calls slower than usual"""
+        timeout = budget(LLM_TIMEOUT)
+        hedge_after = None
+        if HEDGE_PERCENTILE > 0:
+            hedge_after = self.router.latency_percentile(route, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+
+        if hedge_after is None or hedge_after >= timeout:
+            response = self._call(prompt, route, timeout)
+        else:
+            response = self._hedged_call(prompt, route, timeout, hedge_after)
+
+        _store_completion(_completion_key(route, prompt), response.text)
+        return response.text
+
+    def _call(self, prompt: str, route: Route, timeout: float,
+              cancel: Optional[threading.Event] = None) -> LLMResponse:
+        # Waiting for a slot counts against the call's own timeout
+        queued = time.monotonic()
+        with get_admission().slot('llm', max_wait=timeout):
+            timeout -= time.monotonic() - queued
+            started = time.perf_counter()
+            with span('llm.complete', model=route.model, backend=self.backend.name):
+                try:
+                    response = self.backend.complete(
+                        prompt, model=route.model, max_tokens=route.max_tokens, timeout=timeout, cancel=cancel
+                    )
+                except LLMTimeout as e:
+                    # The prompt and the partial answer are billed even though the call failed
+                    usage = current_usage()
+                    if usage is not None:
+                        usage.add(route.model, count_tokens(prompt), count_tokens(e.partial))
+                    raise
+        record_llm_usage(route.model, response.input_tokens, response.output_tokens)
+        self.router.record(route, time.perf_counter() - started, response.input_tokens, response.output_tokens)
+        return response
+
+    def _hedged_call(self, prompt: str, route: Route, timeout: float, hedge_after: float) -> LLMResponse:
+        """Send a duplicate once the first attempt is slower than hedge_after; the first answer wins"""
+        started = time.monotonic()
+        cancels = [threading.Event()]
+        attempts = [self._submit_call(prompt, route, timeout, cancels[0])]
+
+        done, _ = wait(attempts, timeout=hedge_after)
+        if not done:
+            metrics.inc('docsmith_llm_hedges_total', route=route.task, model=route.model)
+            cancels.append(threading.Event())
+            attempts.append(self._submit_call(prompt, route, timeout - (time.monotonic() - started), cancels[1]))
+
+        pending = set(attempts)
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if len(attempts) > 1:
+                            metrics.inc('docsmith_llm_hedge_wins_total', route=route.task,
+                                        attempt='hedge' if future is attempts[1] else 'primary')
+                        return future.result()
+                    # Keep the timeout with the most partial text for the fallback
+                    if error is None or len(getattr(future.exception(), 'partial', '')) > len(getattr(error, 'partial', '')):
+                        error = future.exception()
+            raise error
+        finally:
+            for cancel in cancels:
+                cancel.set()
+
+    def _submit_call(self, prompt: str, route: Route, timeout: float, cancel: threading.Event):
+        return _hedge_executor.submit(contextvars.copy_context().run, self._call, prompt, route, timeout, cancel)
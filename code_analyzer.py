@@ -2,10 +2,51 @@ import os
 import ast
 import json
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
-import chardet
-from langdetect import detect
-import tiktoken
+from typing import Dict, List, Set, Tuple, Optional
+
+from metrics import span, record_file_read, record_cache
+from file_records import FileTable, LazyFileContents, FileStats, FileStatsCache
+from line_stats import scan_line_stats
+from file_sniffer import TEXT, GENERATED, SKIPPED_KINDS, classify_name
+
+_token_encoding = None
+_token_encoding_loaded = False
+
+# Shared by all analyses in the process; re-uploaded files reuse their stats
+file_stats_cache = FileStatsCache(int(os.getenv('DOCSMITH_FILE_STATS_CACHE', '100000')))
+
+# Skipped (binary, minified, generated) files listed by path in the analysis; all are counted
+SKIPPED_PATHS_LIMIT = 100
+
+def get_token_encoding():
+    """Load the tiktoken encoding once; None when it cannot be fetched (e.g. offline)"""
+    global _token_encoding, _token_encoding_loaded
+    if not _token_encoding_loaded:
+        try:
+            import tiktoken
+            _token_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _token_encoding = None
+        _token_encoding_loaded = True
+    return _token_encoding
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken, falling back to a four-characters-per-token estimate"""
+    encoding = get_token_encoding()
+    if encoding is None:
+        return len(text) // 4
+    with span('analyze.tokenize'):
+        return len(encoding.encode(text))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of text with at most max_tokens tokens (by the same measure as count_tokens)"""
+    encoding = get_token_encoding()
+    if encoding is None:
+        return text[:max(0, max_tokens) * 4]
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max(0, max_tokens)])
 
 class CodebaseAnalyzer:
     def __init__(self):
@@ -55,14 +96,21 @@ class CodebaseAnalyzer:
         if not path_obj.exists():
             raise ValueError(f"Path does not exist: {path}")
         
-        analysis = {
-            'structure': self._analyze_structure(path_obj),
-            'technologies': self._detect_technologies(path_obj),
-            'key_files': self._extract_key_files(path_obj),
-            'setup_files': self._find_setup_files(path_obj),
-            'statistics': self._calculate_statistics(path_obj),
-            'dependencies': self._analyze_dependencies(path_obj)
-        }
+        with span('analyze.total'):
+            analysis = {}
+            with span('analyze.structure'):
+                analysis['structure'] = self._analyze_structure(path_obj)
+            with span('analyze.technologies'):
+                analysis['technologies'] = self._detect_technologies(path_obj)
+            with span('analyze.key_files'):
+                analysis['key_files'] = self._extract_key_files(path_obj)
+            with span('analyze.setup_files'):
+                analysis['setup_files'] = self._find_setup_files(path_obj)
+            with span('analyze.statistics'):
+                analysis['files'] = FileTable(str(path_obj))
+                analysis['statistics'] = self._calculate_statistics(path_obj, analysis['files'])
+            with span('analyze.dependencies'):
+                analysis['dependencies'] = self._analyze_dependencies(path_obj)
         
         return analysis
     
@@ -111,41 +159,44 @@ class CodebaseAnalyzer:
                 if self._should_ignore(file):
                     continue
                 
-                file_path = Path(root) / file
-                
-                if file == 'package.json':
-                    technologies.update(self._analyze_package_json(file_path))
-                elif file == 'requirements.txt':
-                    technologies.add('Python')
-                elif file == 'Cargo.toml':
-                    technologies.add('Rust')
-                elif file == 'go.mod':
-                    technologies.add('Go')
-                elif file == 'pom.xml':
-                    technologies.add('Java/Maven')
-                elif file.endswith('.py'):
-                    technologies.add('Python')
-                elif file.endswith(('.js', '.jsx')):
-                    technologies.add('JavaScript')
-                elif file.endswith(('.ts', '.tsx')):
-                    technologies.add('TypeScript')
-                elif file.endswith('.java'):
-                    technologies.add('Java')
-                elif file.endswith('.cpp'):
-                    technologies.add('C++')
-                elif file.endswith('.cs'):
-                    technologies.add('C#')
-                elif file.endswith('.php'):
-                    technologies.add('PHP')
-                elif file.endswith('.rb'):
-                    technologies.add('Ruby')
-                elif file.endswith('.go'):
-                    technologies.add('Go')
-                elif file.endswith('.rs'):
-                    technologies.add('Rust')
+                technologies.update(self._file_technologies(file, Path(root) / file))
         
         return list(technologies)
     
+    def _file_technologies(self, file: str, file_path: Path) -> List[str]:
+        """Technologies indicated by a single file's name (and package.json contents)"""
+        if file == 'package.json':
+            return self._analyze_package_json(file_path)
+        elif file == 'requirements.txt':
+            return ['Python']
+        elif file == 'Cargo.toml':
+            return ['Rust']
+        elif file == 'go.mod':
+            return ['Go']
+        elif file == 'pom.xml':
+            return ['Java/Maven']
+        elif file.endswith('.py'):
+            return ['Python']
+        elif file.endswith(('.js', '.jsx')):
+            return ['JavaScript']
+        elif file.endswith(('.ts', '.tsx')):
+            return ['TypeScript']
+        elif file.endswith('.java'):
+            return ['Java']
+        elif file.endswith('.cpp'):
+            return ['C++']
+        elif file.endswith('.cs'):
+            return ['C#']
+        elif file.endswith('.php'):
+            return ['PHP']
+        elif file.endswith('.rb'):
+            return ['Ruby']
+        elif file.endswith('.go'):
+            return ['Go']
+        elif file.endswith('.rs'):
+            return ['Rust']
+        return []
+    
     def _analyze_package_json(self, file_path: Path) -> List[str]:
         technologies = ['JavaScript']
         try:
@@ -175,8 +226,8 @@ class CodebaseAnalyzer:
         
         return technologies
     
-    def _extract_key_files(self, path: Path, max_files: int = 10) -> Dict[str, str]:
-        key_files = {}
+    def _extract_key_files(self, path: Path, max_files: int = 10) -> LazyFileContents:
+        key_files = LazyFileContents(str(path), self._read_file_safely)
         
         priority_files = [
             'main.py', 'app.py', 'index.js', 'index.ts',
@@ -186,10 +237,8 @@ class CodebaseAnalyzer:
         
         for priority_file in priority_files:
             file_path = path / priority_file
-            if file_path.exists():
-                content = self._read_file_safely(file_path)
-                if content:
-                    key_files[priority_file] = content[:2000]
+            if file_path.exists() and self._is_readable(file_path) and self._is_source(file_path):
+                key_files.add(priority_file, 2000)
         
         if len(key_files) < max_files:
             for root, dirs, files in os.walk(path):
@@ -203,45 +252,48 @@ class CodebaseAnalyzer:
                         continue
                     
                     file_path = Path(root) / file
-                    if file_path.suffix.lower() in self.supported_extensions:
-                        content = self._read_file_safely(file_path)
-                        if content:
-                            relative_path = os.path.relpath(file_path, path)
-                            key_files[relative_path] = content[:2000]
+                    if (file_path.suffix.lower() in self.supported_extensions and self._is_readable(file_path)
+                            and self._is_source(file_path)):
+                        relative_path = os.path.relpath(file_path, path)
+                        key_files.add(relative_path, 2000)
         
         return key_files
     
-    def _find_setup_files(self, path: Path) -> Dict[str, str]:
-        setup_files = {}
+    def _find_setup_files(self, path: Path) -> LazyFileContents:
+        setup_files = LazyFileContents(str(path), self._read_file_safely)
         
         for file_name in self.config_files:
             file_path = path / file_name
-            if file_path.exists():
-                content = self._read_file_safely(file_path)
-                if content:
-                    setup_files[file_name] = content
+            if file_path.exists() and self._is_readable(file_path):
+                kind = self._file_kind(file_path)
+                # Generated configs are kept but shortened; binary or minified ones say nothing useful
+                if kind == TEXT:
+                    setup_files.add(file_name)
+                elif kind == GENERATED:
+                    setup_files.add(file_name, 2000)
         
         readme_files = ['README.md', 'README.txt', 'readme.md']
         for readme in readme_files:
             file_path = path / readme
             if file_path.exists():
-                content = self._read_file_safely(file_path)
-                if content:
-                    setup_files[readme] = content[:3000]
+                if self._is_readable(file_path):
+                    setup_files.add(readme, 3000)
                 break
         
         return setup_files
     
-    def _calculate_statistics(self, path: Path) -> Dict:
+    def _calculate_statistics(self, path: Path, file_table: Optional[FileTable] = None) -> Dict:
         stats = {
             'total_lines': 0,
             'lines_by_language': {},
             'file_count_by_language': {},
-            'estimated_tokens': 0
+            'estimated_tokens': 0,
+            'blank_lines': 0,
+            'comment_lines': 0,
+            'skipped_files': {kind: 0 for kind in SKIPPED_KINDS},
+            'skipped_paths': []
         }
         
-        encoding = tiktoken.get_encoding("cl100k_base")
-        
         for root, dirs, files in os.walk(path):
             dirs[:] = [d for d in dirs if not self._should_ignore(d)]
             
@@ -254,11 +306,22 @@ class CodebaseAnalyzer:
                 
                 if extension in self.supported_extensions:
                     language = self.supported_extensions[extension]
-                    content = self._read_file_safely(file_path)
+                    file_stats = self._file_stats(file_path, language)
                     
-                    if content:
-                        lines = content.count('\n') + 1
+                    if file_stats and file_stats.kind != TEXT:
+                        # Binary, minified and generated files would only inflate lines and tokens
+                        stats['skipped_files'][file_stats.kind] += 1
+                        if len(stats['skipped_paths']) < SKIPPED_PATHS_LIMIT:
+                            stats['skipped_paths'].append({
+                                'path': os.path.relpath(file_path, path),
+                                'kind': file_stats.kind,
+                                'size': file_stats.size
+                            })
+                    elif file_stats:
+                        lines = file_stats.lines
                         stats['total_lines'] += lines
+                        stats['blank_lines'] += file_stats.blank_lines
+                        stats['comment_lines'] += file_stats.comment_lines
                         
                         if language not in stats['lines_by_language']:
                             stats['lines_by_language'][language] = 0
@@ -266,12 +329,13 @@ class CodebaseAnalyzer:
                         
                         stats['lines_by_language'][language] += lines
                         stats['file_count_by_language'][language] += 1
+                        stats['estimated_tokens'] += file_stats.tokens
                         
-                        try:
-                            tokens = len(encoding.encode(content[:4000]))
-                            stats['estimated_tokens'] += tokens
-                        except:
-                            pass
+                        if file_table is not None:
+                            file_table.add(
+                                os.path.relpath(file_path, path), language,
+                                file_stats.size, lines, file_stats.tokens
+                            )
         
         return stats
     
@@ -313,20 +377,117 @@ class CodebaseAnalyzer:
         
         return dependencies
     
-    def _read_file_safely(self, file_path: Path, max_size: int = 1024*1024) -> Optional[str]:
+    def _file_stats(self, file_path: Path, language: str) -> Optional[FileStats]:
+        """Line and token statistics for a file, from the per-file cache when its inode is unchanged"""
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        
+        # Lockfiles, bundles and generated stubs are known by name and never read
+        name_kind = classify_name(file_path.name)
+        if name_kind != TEXT:
+            return FileStats(0, 0, 0, stat.st_size, 0, name_kind)
+        
+        key = FileStatsCache.key(stat, language)
+        cached = file_stats_cache.get(key)
+        record_cache('file_stats', cached is not None)
+        if cached is not None:
+            return cached
+        
+        line_stats = self._scan_file(file_path, language)
+        if not line_stats:
+            return None
+        if line_stats.kind != TEXT:
+            file_stats = FileStats(0, 0, 0, stat.st_size, 0, line_stats.kind)
+            file_stats_cache.put(key, file_stats)
+            return file_stats
+        
+        tokens = 0
+        try:
+            # Only the head is decoded; the token estimate needs 4000 characters
+            content = self._decode_bytes(line_stats.head)
+            tokens = count_tokens(content[:4000])
+        except:
+            pass
+        
+        file_stats = FileStats(line_stats.lines, line_stats.blank_lines, line_stats.comment_lines,
+                               line_stats.bytes_read, tokens)
+        file_stats_cache.put(key, file_stats)
+        return file_stats
+    
+    def _scan_file(self, file_path: Path, language: str, max_size: int = 1024*1024):
+        """Byte-level line statistics for a file, or None if it is empty, too large or unreadable"""
+        try:
+            size = file_path.stat().st_size
+            if size == 0 or size > max_size:
+                return None
+            
+            line_stats = scan_line_stats(file_path, size, language)
+            record_file_read(line_stats.bytes_read)
+            return line_stats
+        except Exception:
+            return None
+    
+    def _file_kind(self, file_path: Path) -> str:
+        """file_sniffer kind of a file, shared with the statistics pass through the stats cache"""
+        language = self.supported_extensions.get(file_path.suffix.lower(), 'text')
+        file_stats = self._file_stats(file_path, language)
+        return file_stats.kind if file_stats else TEXT
+    
+    def _is_source(self, file_path: Path) -> bool:
+        return self._file_kind(file_path) == TEXT
+    
+    def _is_readable(self, file_path: Path, max_size: int = 1024*1024) -> bool:
+        """Cheap stand-in for a successful _read_file_safely: non-empty and under the size cap"""
+        try:
+            return 0 < file_path.stat().st_size <= max_size
+        except OSError:
+            return False
+    
+    def _read_file_safely(self, file_path: Path, max_chars: Optional[int] = None,
+                          max_size: int = 1024*1024) -> Optional[str]:
         try:
             if file_path.stat().st_size > max_size:
                 return None
             
             with open(file_path, 'rb') as f:
-                raw_data = f.read()
+                # A character never takes more than four bytes, so a prefix is enough
+                raw_data = f.read(max_chars * 4) if max_chars else f.read()
+            record_file_read(len(raw_data))
             
-            detected = chardet.detect(raw_data)
-            encoding = detected.get('encoding', 'utf-8')
-            
-            return raw_data.decode(encoding, errors='ignore')
+            return self._decode_bytes(raw_data)
         except Exception:
             return None
     
+    def _decode_bytes(self, raw_data: bytes) -> str:
+        # Most source is ASCII/UTF-8; only fall back to detection when that fails
+        try:
+            return raw_data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # A prefix read may cut a multi-byte character at the very end
+            if e.start >= len(raw_data) - 3 and e.reason == 'unexpected end of data':
+                return raw_data[:e.start].decode('utf-8', errors='ignore')
+        
+        import chardet
+        with span('analyze.chardet'):
+            detected = chardet.detect(raw_data)
+        encoding = detected.get('encoding') or 'utf-8'
+        
+        return raw_data.decode(encoding, errors='ignore')
+    
+    def file_inodes(self, path: str) -> Set[Tuple[int, int]]:
+        """(device, inode) of every file analysis would visit, to pick its per-file cache entries"""
+        inodes = set()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not self._should_ignore(d)]
+            for file in files:
+                try:
+                    stat = os.stat(os.path.join(root, file))
+                except OSError:
+                    continue
+                inodes.add((stat.st_dev, stat.st_ino))
+        return inodes
+    
     def _should_ignore(self, name: str) -> bool:
         return any(pattern in name for pattern in self.ignore_patterns)
\ No newline at end of file
@@ -0,0 +1,138 @@
+import ast
+import re
+from typing import Callable, List, NamedTuple
+
+# Languages whose blocks are delimited by braces; everything else is split on indentation
+BRACE_LANGUAGES = {
+    'javascript', 'typescript', 'java', 'c', 'c++', 'cpp', 'c#', 'csharp', 'go', 'rust',
+    'php', 'swift', 'kotlin', 'scala', 'css'
+}
+
+# Strings and comments are blanked out before counting braces
+_BRACE_NOISE = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`',
+    re.DOTALL
+)
+
+_NAME = re.compile(
+    r'(?:def|class|function|func|fn|interface|struct|impl|enum|trait|module|type)\s+([A-Za-z_][A-Za-z0-9_]*)'
+    r'|([A-Za-z_][A-Za-z0-9_]*)\s*(?:=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*=>)|\([^)]*\)\s*\{)'
+)
+
+
+class CodeChunk(NamedTuple):
+    name: str
+    start_line: int
+    end_line: int
+    text: str
+
+
+def _chunk_name(lines: List[str]) -> str:
+    for line in lines:
+        match = _NAME.search(line)
+        if match:
+            return match.group(1) or match.group(2)
+    return ''
+
+
+def _python_units(code: str) -> List[int]:
+    """Line numbers where top-level statements and class members start, decorators included"""
+    starts = []
+
+    def visit(body):
+        for node in body:
+            decorators = getattr(node, 'decorator_list', [])
+            starts.append(min([node.lineno] + [decorator.lineno for decorator in decorators]) - 1)
+            # Methods are boundaries too so large classes split between them
+            if isinstance(node, ast.ClassDef):
+                visit(node.body[1:])
+
+    visit(ast.parse(code).body)
+    return starts
+
+
+def _brace_units(code: str) -> List[int]:
+    """Line numbers where a new top-level block can start (brace depth back to zero)"""
+    stripped = _BRACE_NOISE.sub(lambda match: '\n' * match.group(0).count('\n'), code)
+    starts = [0]
+    depth = 0
+    for number, line in enumerate(stripped.split('\n')):
+        if depth == 0 and line.strip() and number > starts[-1]:
+            starts.append(number)
+        depth = max(0, depth + line.count('{') - line.count('}'))
+    return starts
+
+
+def _indent_units(code: str) -> List[int]:
+    """Line numbers of unindented lines that follow an indented block"""
+    starts = [0]
+    indented = False
+    for number, line in enumerate(code.split('\n')):
+        if not line.strip():
+            continue
+        if line[0] in ' \t':
+            indented = True
+        elif indented:
+            starts.append(number)
+            indented = False
+    return starts
+
+
+def _boundaries(code: str, language: str) -> List[int]:
+    language = language.lower()
+    if language == 'python':
+        try:
+            return _python_units(code) or [0]
+        except (SyntaxError, ValueError):
+            # Partial snippets often do not parse; fall back to indentation
+            return _indent_units(code)
+    if language in BRACE_LANGUAGES:
+        return _brace_units(code)
+    return _indent_units(code)
+
+
+def split_code(code: str, language: str, max_tokens: int,
+               count_tokens: Callable[[str], int]) -> List[CodeChunk]:
+    """Split code at function/class boundaries into chunks of at most about max_tokens
+
+    Adjacent small definitions are packed together; a single definition larger
+    than max_tokens is cut on line boundaries.
+    """
+    lines = code.split('\n')
+    starts = sorted(set(_boundaries(code, language)) | {0})
+    units = [
+        (start, starts[index + 1] if index + 1 < len(starts) else len(lines))
+        for index, start in enumerate(starts)
+    ]
+
+    # Oversized units are cut into line windows of roughly max_tokens
+    pieces = []
+    for start, end in units:
+        tokens = count_tokens('\n'.join(lines[start:end]))
+        if tokens <= max_tokens:
+            pieces.append((start, end, tokens))
+            continue
+        step = max(1, (end - start) * max_tokens // tokens)
+        for piece_start in range(start, end, step):
+            piece_end = min(end, piece_start + step)
+            pieces.append((piece_start, piece_end, count_tokens('\n'.join(lines[piece_start:piece_end]))))
+
+    chunks = []
+    chunk_start, chunk_end, chunk_tokens = None, None, 0
+    for start, end, tokens in pieces:
+        if chunk_start is not None and chunk_tokens + tokens > max_tokens:
+            chunks.append(_make_chunk(lines, chunk_start, chunk_end))
+            chunk_start, chunk_tokens = None, 0
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+        chunk_tokens += tokens
+    if chunk_start is not None:
+        chunks.append(_make_chunk(lines, chunk_start, chunk_end))
+
+    return [chunk for chunk in chunks if chunk.text.strip()]
+
+
+def _make_chunk(lines: List[str], start: int, end: int) -> CodeChunk:
+    chunk_lines = lines[start:end]
+    return CodeChunk(_chunk_name(chunk_lines), start + 1, end, '\n'.join(chunk_lines))
@@ -0,0 +1,115 @@
+"""
+Negotiated gzip/brotli compression of HTTP responses
+
+Generated documentation travels as JSON and markdown, which compresses about
+5-10x. Brotli is used when the optional `brotli` package is installed and the
+client accepts it; gzip otherwise.
+"""
+
+import os
+import gzip
+from typing import Optional
+
+from metrics import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'text/markdown', 'text/html',
+    'text/css', 'text/plain', 'text/javascript', 'image/svg+xml'
+}
+
+
+def available_encodings():
+    """Encodings this process can produce, preferred first"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encodings, encodings=None) -> Optional[str]:
+    """Best encoding the client accepts (werkzeug Accept header), or None"""
+    best, best_quality = None, 0
+    for encoding in encodings or available_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=5 if level is None else level)
+    # mtime=0 so identical bodies compress to identical bytes
+    return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+
+
+class ResponseCompressor:
+    """Compresses text responses of at least min_bytes for clients that accept it
+
+    Streamed responses (NDJSON events, large ZIP exports) are left alone so
+    they are not buffered. Files sent with send_file are compressed up to
+    max_bytes. Strong ETags become weak, which conditional requests still
+    match, and range responses are not touched.
+    """
+
+    def __init__(self, enabled: bool = True, min_bytes: int = 1024, max_bytes: int = 32 * 1024 * 1024,
+                 gzip_level: int = 6, brotli_quality: int = 5):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    @classmethod
+    def from_env(cls) -> 'ResponseCompressor':
+        return cls(
+            enabled=os.getenv('DOCSMITH_COMPRESSION', '1').lower() not in ('0', 'false', 'no'),
+            min_bytes=int(os.getenv('DOCSMITH_COMPRESS_MIN_BYTES', '1024')),
+            max_bytes=int(float(os.getenv('DOCSMITH_COMPRESS_MAX_MB', '32')) * 1024 * 1024),
+            gzip_level=int(os.getenv('DOCSMITH_GZIP_LEVEL', '6')),
+            brotli_quality=int(os.getenv('DOCSMITH_BROTLI_QUALITY', '5'))
+        )
+
+    def apply(self, request, response):
+        if not self.enabled or response.status_code != 200 or request.method == 'HEAD':
+            return response
+        if response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers:
+            return response
+        if 'Content-Range' in response.headers:
+            return response
+
+        # Clients and caches must not get a body encoded for someone else
+        response.vary.add('Accept-Encoding')
+
+        if response.direct_passthrough:
+            # send_file: read the file if it is not too large to hold in memory
+            length = response.content_length
+            if length is None or length > self.max_bytes:
+                return response
+            response.direct_passthrough = False
+        elif response.is_streamed:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_bytes:
+            return response
+
+        encoding = negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        level = self.brotli_quality if encoding == 'br' else self.gzip_level
+        compressed = compress(data, encoding, level)
+        metrics.inc('docsmith_compression_bytes_total', len(data), encoding=encoding, stage='original')
+        metrics.inc('docsmith_compression_bytes_total', len(compressed), encoding=encoding, stage='compressed')
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # Byte ranges would refer to the uncompressed file
+        response.headers.pop('Accept-Ranges', None)
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
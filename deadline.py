@@ -0,0 +1,55 @@
+import time
+import contextvars
+from typing import Optional
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar('docsmith_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the work started"""
+
+
+class deadline:
+    """Give the enclosed work a time budget that nested calls can read with remaining()
+
+        with deadline(120):
+            ...
+
+    A nested deadline never extends an outer one.
+    """
+
+    __slots__ = ('seconds', 'token')
+
+    def __init__(self, seconds: Optional[float]):
+        self.seconds = seconds
+        self.token = None
+
+    def __enter__(self):
+        if self.seconds is not None and self.seconds > 0:
+            expires = time.monotonic() + self.seconds
+            outer = _deadline.get()
+            self.token = _deadline.set(expires if outer is None else min(outer, expires))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is not None:
+            _deadline.reset(self.token)
+        return False
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget, or None without a deadline"""
+    expires = _deadline.get()
+    if expires is None:
+        return None
+    return expires - time.monotonic()
+
+
+def budget(limit: Optional[float] = None) -> Optional[float]:
+    """The smaller of the remaining budget and limit; raises once the budget is spent"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    if left is None:
+        return limit
+    return left if limit is None else min(left, limit)
@@ -1,30 +1,148 @@
 import os
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
 import json
+import hashlib
 
-from code_analyzer import CodebaseAnalyzer
-from claude_integration import ClaudeDocGenerator
+from code_analyzer import CodebaseAnalyzer, count_tokens, file_stats_cache
+from claude_integration import ClaudeDocGenerator, PROMPT_VERSION
+from metrics import span
+from deadline import DeadlineExceeded
+from llm_backends import LLMTimeout
+from retrieval_index import RetrievalIndex, index_path_for
+from project_preview import ProjectPreviewer
+from preflight import PreflightPlanner
+
+# Written next to the documents by publish_markdown_docs
+OUTPUT_MANIFEST = 'manifest.json'
+OUTPUT_INDEX = 'index.md'
+
+# Key files quoted in the API documentation prompt, per category, and characters kept of each
+API_INFO_MAX_ENTRIES = int(os.getenv('DOCSMITH_API_INFO_MAX_ENTRIES', '8'))
+API_INFO_MAX_CHARS = int(os.getenv('DOCSMITH_API_INFO_MAX_CHARS', '4000'))
+
+# Retrieval queries used to pick relevant definitions for each doc section
+SECTION_QUERIES = {
+    'architecture_overview': 'main app application server service config init create_app router handler model manager',
+    'developer_guide': 'setup install config settings test main cli run build script env',
+    'api_documentation': 'route endpoint api get post put delete request response handler schema model serializer'
+}
+
+def prepare_isolated(codebase_path: str, known_file_stats: List, persist_index: bool = True) -> Tuple[Dict, List]:
+    """Child-process entry point: prepare a codebase reusing the parent's per-file stats
+
+    Returns the prepared analysis and the stats entries computed here, for the
+    parent to keep.
+    """
+    file_stats_cache.update(known_file_stats)
+    known = {key for key, _ in known_file_stats}
+    prepared = DocumentationGenerator().prepare(codebase_path, persist_index=persist_index)
+    return prepared, [(key, stats) for key, stats in file_stats_cache.items() if key not in known]
 
 class DocumentationGenerator:
-    def __init__(self):
+    def __init__(self, tier: str = 'standard'):
         self.analyzer = CodebaseAnalyzer()
-        self.claude = ClaudeDocGenerator()
+        self.claude = ClaudeDocGenerator(tier=tier)
     
     def generate_full_documentation(self, codebase_path: str, doc_types: List[str]) -> Dict[str, str]:
-        analysis = self.analyzer.analyze_codebase(codebase_path)
+        prepared = self.prepare(codebase_path)
+        return self.generate_from_prepared(prepared, doc_types)
+    
+    def prepare(self, codebase_path: str, persist_index: bool = True) -> Dict:
+        """Analyze a codebase once and build every documentation prompt with its token count
+
+        persist_index saves the retrieval index for other workers; only worth
+        it for workspaces, whose contents never change.
+        """
+        with span('docs.prepare'):
+            analysis = self.analyzer.analyze_codebase(codebase_path)
+            api_info = self._extract_api_info(analysis)
+            index = self.build_index(codebase_path, analysis, persist=persist_index)
+            
+            related = {
+                doc_type: self.retrieve_related_code(index, query)
+                for doc_type, query in SECTION_QUERIES.items()
+            }
+            
+            with span('docs.build_prompts'):
+                prompts = {
+                    'architecture_overview': self.claude.build_overview_prompt(analysis, related['architecture_overview']),
+                    'developer_guide': self.claude.build_developer_guide_prompt(analysis, related['developer_guide']),
+                    'api_documentation': self.claude.build_api_docs_prompt(api_info, related['api_documentation'])
+                }
+            
+            with span('docs.estimate_tokens'):
+                prompt_tokens = {doc_type: count_tokens(prompt) for doc_type, prompt in prompts.items()}
+            
+            return {
+                'analysis': analysis,
+                'index': index,
+                'project_summary': self.summarize_analysis(codebase_path, analysis),
+                'prompts': prompts,
+                'prompt_tokens': prompt_tokens
+            }
+    
+    def build_index(self, codebase_path: str, analysis: Dict, persist: bool = True) -> RetrievalIndex:
+        """Build the codebase's retrieval index from the analyzed file table, optionally persisting it"""
+        files = [(record.path, record.language) for record in analysis['files']]
+        index = RetrievalIndex.build(codebase_path, files, self.analyzer._read_file_safely)
+        if not persist:
+            return index
+        try:
+            index.save(index_path_for(codebase_path))
+        except OSError as e:
+            print(f"Could not persist retrieval index: {str(e)}")
+        return index
+    
+    def retrieve_related_code(self, index: Optional[RetrievalIndex], query: str,
+                              token_budget: Optional[int] = None) -> str:
+        if index is None or not len(index):
+            return ""
+        if token_budget is None:
+            token_budget = int(os.getenv('DOCSMITH_RETRIEVAL_BUDGET', '1500'))
+        return index.retrieve(query, token_budget, self.analyzer._read_file_safely, count_tokens)
+    
+    def plan_generation(self, prepared: Dict, doc_types: List[str], tenant_remaining: Optional[Dict] = None) -> Dict:
+        """Pre-flight estimate of tokens, latency and cost, trimming or rejecting over-budget prompts"""
+        with span('docs.preflight'):
+            planner = PreflightPlanner.from_env(self.claude.router)
+            return planner.plan(prepared['prompts'], doc_types, self.claude.route, tenant_remaining)
+    
+    def generate_from_prepared(self, prepared: Dict, doc_types: List[str], singleflight=None,
+                               source_key: Optional[str] = None,
+                               prompts: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Generate each doc type from prepared prompts, or from planned ones (see plan_generation)
+
+        With a SingleFlight and a source_key identifying the exact code (repo URL
+        and commit), identical concurrent generations share one LLM call. Sections
+        that time out get fallback content, which is never shared.
+        """
         documentation = {}
+        prompts = prepared['prompts'] if prompts is None else prompts
         
-        if 'architecture_overview' in doc_types:
-            documentation['architecture_overview'] = self.claude.generate_overview(analysis)
-        
-        if 'developer_guide' in doc_types:
-            documentation['developer_guide'] = self.claude.generate_developer_guide(analysis)
-        
-        if 'api_documentation' in doc_types:
-            api_info = self._extract_api_info(analysis)
-            documentation['api_documentation'] = self.claude.generate_api_docs(api_info)
+        for doc_type in doc_types:
+            prompt = prompts.get(doc_type)
+            if prompt is None:
+                continue
+            
+            print(f"Generating {doc_type}...")
+            with span('docs.generate', doc_type=doc_type):
+                try:
+                    if singleflight is not None and source_key:
+                        # Trimmed prompts differ with the budget, so they are part of the key
+                        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+                        documentation[doc_type] = singleflight.do(
+                            f"{source_key}|{doc_type}|{PROMPT_VERSION}|{self.claude.model_for(doc_type, prompt)}|{prompt_hash}",
+                            lambda: self.claude.generate_from_prompt(doc_type, prompt, allow_partial=False)
+                        )
+                    else:
+                        documentation[doc_type] = self.claude.generate_from_prompt(doc_type, prompt, allow_partial=False)
+                except (LLMTimeout, DeadlineExceeded) as e:
+                    print(f"Timed out generating {doc_type}: {str(e)}")
+                    documentation[doc_type] = self.claude.fallback(doc_type, prompt, e)
+                    continue
+            print(f"Generated {doc_type} successfully")
         
         return documentation
     
@@ -32,7 +150,12 @@ class DocumentationGenerator:
         context = f"File: {file_path}, Language: {language}" if file_path else f"Language: {language}"
         return self.claude.explain_code_section(code, context)
     
-    def generate_markdown_docs(self, documentation: Dict[str, str], output_dir: str) -> Dict[str, str]:
+    def generate_markdown_docs(self, documentation: Dict[str, str], output_dir: str,
+                               incremental: bool = False) -> Dict[str, str]:
+        """Write one markdown file per doc type; incremental=True uses publish_markdown_docs"""
+        if incremental:
+            return self.publish_markdown_docs(documentation, output_dir)['files']
+        
         output_path = Path(output_dir)
         output_path.mkdir(exist_ok=True)
         
@@ -43,7 +166,7 @@ class DocumentationGenerator:
             filename = f"{doc_type}_{timestamp}.md"
             file_path = output_path / filename
             
-            markdown_content = self._format_as_markdown(content, doc_type)
+            markdown_content = self._format_as_markdown(content, doc_type, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
             
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(markdown_content)
@@ -52,7 +175,81 @@ class DocumentationGenerator:
         
         return generated_files
     
+    def publish_markdown_docs(self, documentation: Dict[str, str], output_dir: str) -> Dict:
+        """Write documents to stable {doc_type}.md files, touching only those whose content changed
+
+        A manifest records each document's SHA-256; documents whose hash is
+        unchanged are not rewritten, so their mtimes stay put for static-site
+        builds and rsync. index.md is rebuilt only when a member changes.
+        Doc types missing from `documentation` keep their previous files.
+        """
+        output_path = Path(output_dir)
+        output_path.mkdir(parents=True, exist_ok=True)
+        manifest_path = output_path / OUTPUT_MANIFEST
+        
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            manifest = {'documents': {}}
+        documents = manifest.setdefault('documents', {})
+        
+        written, unchanged = [], []
+        for doc_type, content in documentation.items():
+            filename = f"{doc_type}.md"
+            if self._write_if_changed(output_path / filename, self._format_as_markdown(content, doc_type),
+                                      documents.get(doc_type), documents, doc_type):
+                written.append(doc_type)
+            else:
+                unchanged.append(doc_type)
+        
+        index_changed = self._write_if_changed(output_path / OUTPUT_INDEX, self._format_index(documents),
+                                               manifest.get('index'), manifest, 'index')
+        if written or index_changed:
+            temp_path = manifest_path.with_suffix(f'.{os.getpid()}.tmp')
+            temp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+            os.replace(temp_path, manifest_path)
+        
+        return {
+            'files': {doc_type: str(output_path / entry['file']) for doc_type, entry in documents.items()},
+            'written': written,
+            'unchanged': unchanged,
+            'index': str(output_path / OUTPUT_INDEX),
+            'index_changed': index_changed,
+            'manifest': str(manifest_path)
+        }
+    
+    def _write_if_changed(self, file_path: Path, content: str, entry: Optional[Dict],
+                          entries: Dict, key: str) -> bool:
+        """Atomically write content unless the manifest entry shows the file already holds it"""
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if entry and entry.get('sha256') == digest and file_path.exists() and file_path.stat().st_size == len(data):
+            return False
+        
+        temp_path = file_path.with_suffix(f'.{os.getpid()}.tmp')
+        temp_path.write_bytes(data)
+        os.replace(temp_path, file_path)
+        entries[key] = {
+            'file': file_path.name,
+            'sha256': digest,
+            'size': len(data),
+            'updated': datetime.now().isoformat(timespec='seconds')
+        }
+        return True
+    
+    def _format_index(self, documents: Dict[str, Dict]) -> str:
+        """Index page linking every published document (depends only on their names and hashes)"""
+        lines = ["# Documentation", ""]
+        for doc_type in sorted(documents):
+            entry = documents[doc_type]
+            lines.append(f"- [{self._get_title_for_doc_type(doc_type)}]({entry['file']}) `{entry['sha256'][:12]}`")
+        return "\n".join(lines) + "\n"
+    
     def _extract_api_info(self, analysis: Dict) -> Dict:
+        with span('docs.extract_api_info'):
+            return self._collect_api_info(analysis)
+    
+    def _collect_api_info(self, analysis: Dict) -> Dict:
         api_info = {
             'endpoints': [],
             'models': [],
@@ -63,11 +260,17 @@ class DocumentationGenerator:
         
         for file_path, content in key_files.items():
             if self._looks_like_api_file(file_path, content):
-                api_info['endpoints'].append(f"File: {file_path}\n{content}")
+                category = 'endpoints'
             elif self._looks_like_model_file(file_path, content):
-                api_info['models'].append(f"File: {file_path}\n{content}")
+                category = 'models'
             elif self._looks_like_config_file(file_path):
-                api_info['config'].append(f"File: {file_path}\n{content}")
+                category = 'config'
+            else:
+                continue
+            
+            # Bounded so a codebase with many or large key files cannot blow up the prompt
+            if len(api_info[category]) < API_INFO_MAX_ENTRIES:
+                api_info[category].append(f"File: {file_path}\n{content[:API_INFO_MAX_CHARS]}")
         
         return api_info
     
@@ -91,13 +294,14 @@ class DocumentationGenerator:
         config_files = ['config', 'settings', '.env', 'constants']
         return any(config in file_path.lower() for config in config_files)
     
-    def _format_as_markdown(self, content: str, doc_type: str) -> str:
+    def _format_as_markdown(self, content: str, doc_type: str, timestamp: Optional[str] = None) -> str:
+        """Wrap a document with its title and footer (byte-for-byte stable unless a timestamp is given)"""
         title = self._get_title_for_doc_type(doc_type)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        generated = f"Generated on {timestamp} by DocSmith" if timestamp else "Generated by DocSmith"
         
         markdown = f"""# {title}
 
-*Generated on {timestamp} by DocSmith*
+*{generated}*
 
 ---
 
@@ -118,15 +322,35 @@ class DocumentationGenerator:
         return titles.get(doc_type, doc_type.replace('_', ' ').title())
     
     def get_project_summary(self, codebase_path: str) -> Dict:
-        analysis = self.analyzer.analyze_codebase(codebase_path)
+        with span('docs.project_summary'):
+            analysis = self.analyzer.analyze_codebase(codebase_path)
+            return self.summarize_analysis(codebase_path, analysis)
+    
+    def get_project_preview(self, codebase_path: str) -> Dict:
+        """Project summary estimated from a sample of files, within DOCSMITH_PREVIEW_BUDGET_MS"""
+        with span('docs.project_preview'):
+            preview = ProjectPreviewer.from_env(self.analyzer).preview(codebase_path)
         
+        statistics = {'total_lines': preview['total_lines'], 'lines_by_language': preview['lines_by_language']}
+        return {
+            'project_name': Path(codebase_path).name,
+            'total_files': preview['total_files'],
+            'total_lines': preview['total_lines'],
+            'technologies': preview['technologies'],
+            'main_languages': list(preview['lines_by_language'].keys())[:5],
+            'estimated_complexity': self._estimate_complexity({'statistics': statistics, 'technologies': preview['technologies']}),
+            'preview': preview
+        }
+    
+    def summarize_analysis(self, codebase_path: str, analysis: Dict) -> Dict:
         return {
             'project_name': Path(codebase_path).name,
             'total_files': analysis['structure']['total_files'],
             'total_lines': analysis['statistics']['total_lines'],
             'technologies': analysis['technologies'],
             'main_languages': list(analysis['statistics']['lines_by_language'].keys())[:5],
-            'estimated_complexity': self._estimate_complexity(analysis)
+            'estimated_complexity': self._estimate_complexity(analysis),
+            'skipped_files': analysis['statistics'].get('skipped_files', {})
         }
     
     def _estimate_complexity(self, analysis: Dict) -> str:
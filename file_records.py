@@ -0,0 +1,236 @@
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+
+class FileRecord:
+    """Read-only view of one row of a FileTable"""
+
+    __slots__ = ('path_id', 'language_id', 'size', 'line_count', 'token_count', '_table')
+
+    def __init__(self, table: 'FileTable', index: int):
+        self._table = table
+        self.path_id = table.path_ids[index]
+        self.language_id = table.language_ids[index]
+        self.size = table.sizes[index]
+        self.line_count = table.line_counts[index]
+        self.token_count = table.token_counts[index]
+
+    @property
+    def path(self) -> str:
+        return self._table.paths[self.path_id]
+
+    @property
+    def language(self) -> str:
+        return self._table.languages[self.language_id]
+
+    def __repr__(self) -> str:
+        return (f"FileRecord(path={self.path!r}, language={self.language!r}, size={self.size}, "
+                f"lines={self.line_count}, tokens={self.token_count})")
+
+
+class FileTable:
+    """Per-file statistics stored as typed array columns
+
+    Paths and language names are interned once; every other column costs a
+    few bytes per file, so a 100k-file repository stays in the low megabytes.
+    File contents are never kept; use read_text() to load them on demand.
+    """
+
+    def __init__(self, root: str):
+        self.root = str(root)
+        self.paths: List[str] = []
+        self.languages: List[str] = []
+        self._language_ids: Dict[str, int] = {}
+
+        self.path_ids = array('I')
+        self.language_ids = array('H')
+        self.sizes = array('Q')
+        self.line_counts = array('I')
+        self.token_counts = array('I')
+
+    def add(self, relative_path: str, language: str, size: int, line_count: int, token_count: int) -> int:
+        language_id = self._language_ids.get(language)
+        if language_id is None:
+            language_id = self._language_ids[language] = len(self.languages)
+            self.languages.append(language)
+
+        path_id = len(self.paths)
+        self.paths.append(relative_path)
+
+        self.path_ids.append(path_id)
+        self.language_ids.append(language_id)
+        self.sizes.append(size)
+        self.line_counts.append(line_count)
+        self.token_counts.append(token_count)
+        return path_id
+
+    def __len__(self) -> int:
+        return len(self.path_ids)
+
+    def __iter__(self) -> Iterator[FileRecord]:
+        for index in range(len(self.path_ids)):
+            yield FileRecord(self, index)
+
+    def record(self, index: int) -> FileRecord:
+        return FileRecord(self, index)
+
+    def language_id(self, language: str) -> Optional[int]:
+        return self._language_ids.get(language)
+
+    def read_text(self, path_id: int, reader: Callable[[Path, Optional[int]], Optional[str]],
+                  max_chars: Optional[int] = None) -> Optional[str]:
+        """Load a file's text on demand through the analyzer's reader"""
+        return reader(Path(self.root) / self.paths[path_id], max_chars)
+
+    def largest(self, limit: int = 10) -> List[FileRecord]:
+        order = sorted(range(len(self.sizes)), key=self.sizes.__getitem__, reverse=True)
+        return [FileRecord(self, index) for index in order[:limit]]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the numeric columns"""
+        return sum(column.itemsize * len(column) for column in
+                   (self.path_ids, self.language_ids, self.sizes, self.line_counts, self.token_counts))
+
+    def to_dict(self) -> Dict:
+        return {
+            'root': self.root,
+            'files': [
+                {
+                    'path': self.paths[self.path_ids[index]],
+                    'language': self.languages[self.language_ids[index]],
+                    'size': self.sizes[index],
+                    'lines': self.line_counts[index],
+                    'tokens': self.token_counts[index]
+                }
+                for index in range(len(self.path_ids))
+            ]
+        }
+
+
+class FileStats(NamedTuple):
+    lines: int
+    blank_lines: int
+    comment_lines: int
+    size: int
+    tokens: int
+    # 'text', or the file_sniffer kind of a file that analysis skips
+    kind: str = 'text'
+
+
+class FileStatsCache:
+    """Per-file statistics keyed by (device, inode, size, mtime, language)
+
+    Uploaded files are hard links to shared content-addressed blobs, so the
+    same content uploaded again has the same inode and is not rescanned.
+    Editing a file changes its mtime, which invalidates the entry.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple, FileStats]' = OrderedDict()
+        # (device, inode) -> keys of that file, so one codebase's entries are found without a full scan
+        self._by_inode: Dict[Tuple[int, int], Set[Tuple]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(stat: os.stat_result, language: str) -> Tuple:
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, language)
+
+    def get(self, key: Tuple) -> Optional[FileStats]:
+        with self._lock:
+            stats = self._entries.get(key)
+            if stats is not None:
+                self._entries.move_to_end(key)
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_inode.clear()
+
+    def put(self, key: Tuple, stats: FileStats):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = stats
+            self._entries.move_to_end(key)
+            self._by_inode.setdefault(key[:2], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                keys = self._by_inode.get(evicted[:2])
+                if keys is not None:
+                    keys.discard(evicted)
+                    if not keys:
+                        del self._by_inode[evicted[:2]]
+
+    def items(self) -> List[Tuple[Tuple, FileStats]]:
+        with self._lock:
+            return list(self._entries.items())
+
+    def items_for(self, inodes: Set[Tuple[int, int]]) -> List[Tuple[Tuple, FileStats]]:
+        """Entries for the given (device, inode) pairs, e.g. the files of one codebase"""
+        with self._lock:
+            return [
+                (key, self._entries[key])
+                for inode in inodes if inode in self._by_inode
+                for key in self._by_inode[inode]
+            ]
+
+    def update(self, entries: List[Tuple[Tuple, FileStats]]):
+        for key, stats in entries:
+            self.put(key, stats)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LazyFileContents(Mapping):
+    """Mapping of relative path to file text that reads files only when accessed
+
+    Each entry has its own character limit. Rendering the mapping (as the
+    prompt f-strings do) produces the same text as the equivalent dict.
+    """
+
+    def __init__(self, root: str, reader: Callable[[Path, Optional[int]], Optional[str]]):
+        self.root = str(root)
+        self._reader = reader
+        self._limits: Dict[str, Optional[int]] = {}
+
+    def add(self, relative_path: str, max_chars: Optional[int] = None):
+        self._limits[relative_path] = max_chars
+
+    def __getitem__(self, relative_path: str) -> str:
+        max_chars = self._limits[relative_path]
+        content = self._reader(Path(self.root) / relative_path, max_chars)
+        if content is None:
+            return ''
+        return content[:max_chars] if max_chars else content
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._limits)
+
+    def __len__(self) -> int:
+        return len(self._limits)
+
+    def __contains__(self, relative_path) -> bool:
+        return relative_path in self._limits
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __getstate__(self):
+        # The reader is a bound analyzer method; rebuild it on unpickle
+        return {'root': self.root, 'limits': self._limits}
+
+    def __setstate__(self, state):
+        from code_analyzer import CodebaseAnalyzer
+        self.root = state['root']
+        self._limits = state['limits']
+        self._reader = CodebaseAnalyzer()._read_file_safely
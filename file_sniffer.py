@@ -0,0 +1,108 @@
+"""
+Classify files as text, binary, minified or generated from their first few KB
+
+Supported extensions are not a guarantee of hand-written source: bundles
+(`app.min.js`), lockfiles, protobuf stubs and data fixtures share them. These
+inflate line and token counts and waste prompt space, so the analyzer checks
+each file's head before counting it: NUL bytes and byte entropy for binary
+data, line lengths for minified code, and well-known names and header markers
+for generated files.
+"""
+
+import os
+import re
+import math
+from collections import Counter
+
+TEXT = 'text'
+BINARY = 'binary'
+MINIFIED = 'minified'
+GENERATED = 'generated'
+
+SKIPPED_KINDS = (BINARY, MINIFIED, GENERATED)
+
+# Bytes looked at per file
+SNIFF_BYTES = int(os.getenv('DOCSMITH_SNIFF_BYTES', '8192'))
+
+# A line longer than this, or an average line longer than a third of it, means minified code
+MAX_LINE_LENGTH = int(os.getenv('DOCSMITH_SNIFF_MAX_LINE', '1000'))
+
+# Bits per byte; compressed or encrypted data is close to 8, source code around 4.5-5.5
+BINARY_ENTROPY = 7.0
+# Text denser than this is embedded data (base64, hashes, serialized blobs)
+DATA_ENTROPY = 5.9
+
+GENERATED_NAMES = {
+    'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'composer.lock',
+    'Gemfile.lock', 'Cargo.lock', 'poetry.lock', 'Pipfile.lock', 'go.sum', 'bun.lockb'
+}
+
+MINIFIED_NAME_PATTERN = re.compile(r'(?:\.min\.(?:js|css)|\.bundle\.js)$', re.IGNORECASE)
+GENERATED_NAME_PATTERN = re.compile(
+    r'(?:\.pb\.go|_pb2(?:_grpc)?\.py|\.pb\.(?:cc|h)|\.g\.dart|\.freezed\.dart|\.designer\.cs'
+    r'|\.generated\.\w+|\.gen\.\w+|-lock\.\w+|\.lock)$',
+    re.IGNORECASE
+)
+
+# Searched in the first KB only, where tools put their headers
+GENERATED_MARKERS = re.compile(
+    rb'@generated|(?-i:DO NOT EDIT)|auto-?generated|automatically generated|this file (?:was|is) generated',
+    re.IGNORECASE
+)
+MARKER_BYTES = 1024
+
+# Control bytes other than whitespace; a few are tolerated in text (form feeds, ANSI escapes)
+_CONTROL_BYTES = bytes(range(0, 8)) + bytes(range(14, 27)) + bytes(range(28, 32))
+
+
+def _entropy(data: bytes) -> float:
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+
+def classify_name(name: str) -> str:
+    """Kind implied by a file name alone (lockfiles, bundles, generated stubs), else TEXT"""
+    if MINIFIED_NAME_PATTERN.search(name):
+        return MINIFIED
+    if name in GENERATED_NAMES or GENERATED_NAME_PATTERN.search(name):
+        return GENERATED
+    return TEXT
+
+
+def classify(head: bytes, name: str = '', truncated: bool = False) -> str:
+    """Kind of a file from its name and first bytes
+
+    truncated says whether head is only the start of the file, in which case
+    its last line may be cut short and is not counted as a full line.
+    """
+    kind = classify_name(name)
+    if kind != TEXT or not head:
+        return kind
+
+    head = head[:SNIFF_BYTES]
+    if b'\0' in head:
+        return BINARY
+    if len(head.translate(None, _CONTROL_BYTES)) < len(head) * 0.9:
+        return BINARY
+
+    # No line can be longer than the head itself
+    if len(head) > MAX_LINE_LENGTH:
+        lines = head.split(b'\n')
+        complete = lines[:-1] if truncated and len(lines) > 1 else lines
+        if max(map(len, complete)) > MAX_LINE_LENGTH or len(head) / len(lines) > MAX_LINE_LENGTH / 3:
+            return MINIFIED
+
+    # Every marker contains one of these, and substring tests are much cheaper than the regex
+    header = head[:MARKER_BYTES]
+    if (b'DO NOT EDIT' in header or b'generated' in header.lower()) and GENERATED_MARKERS.search(header):
+        return GENERATED
+
+    # Entropy needs enough bytes to be meaningful
+    if len(head) >= 1024:
+        entropy = _entropy(head)
+        if entropy > BINARY_ENTROPY:
+            return BINARY
+        if entropy > DATA_ENTROPY:
+            return GENERATED
+
+    return TEXT
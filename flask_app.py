@@ -1,30 +1,520 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, send_from_directory, jsonify, Response, g, stream_with_context
 import os
-import tempfile
-import shutil
+import hmac
+import uuid
 import zipfile
 from pathlib import Path
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional
 from werkzeug.utils import secure_filename
-import io
+import time
+import mimetypes
+from contextlib import closing, nullcontext
 
 from doc_generator import DocumentationGenerator
 from code_analyzer import CodebaseAnalyzer
 from github_handler import GitHubHandler
+from workspace import WorkspaceManager
+from metrics import metrics, span, start_trace, end_trace, current_trace, record_cache, meter_usage, UsageMeter, MetricsStore
+from preanalysis import PreAnalysisPool
+from singleflight import SingleFlight
+from retrieval_index import RetrievalIndex, index_path_for
+from deadline import deadline
+from profiling import ProfileRun, list_profiles, profile_summary, profile_path, SORT_KEYS
+from preload import preload, preload_requested
+from result_store import ResultStore, ARCHIVE_NAME
+from markdown_renderer import render_markdown, render_all, load_rendered, is_valid_digest
+from upload_store import UploadStore, UploadConflict, safe_relative_path
+from admission import get_admission, Overloaded
+from isolation import IsolatedRunner, ResourceLimitExceeded
+from doc_generator import prepare_isolated
+from code_analyzer import file_stats_cache
+from snapshot_store import SnapshotStore
+from preflight import TenantLedger
+from model_router import estimate_cost
+from compression import ResponseCompressor
+from static_assets import StaticAssets, ASSET_MAX_AGE
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
 app.config['UPLOAD_FOLDER'] = 'temp_uploads'
 
+# Number of reverse proxies in front of the app; their X-Forwarded-For gives the real client address
+TRUSTED_PROXIES = int(os.getenv('DOCSMITH_TRUSTED_PROXIES', '0'))
+if TRUSTED_PROXIES:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Check if API key is configured
+# Clone and upload directories shared by all requests of this process
+workspaces = WorkspaceManager.from_env()
+
+# Analyses run in a child process with memory and time limits
+analysis_runner = IsolatedRunner.from_env('analysis', preload=['analysis_warmup'])
+
+# Each worker's metrics, summed across workers on /metrics
+metrics_store = MetricsStore.from_env(metrics)
+
+def prepare_codebase(codebase_path: str) -> Dict:
+    """Analyze a codebase within the analysis concurrency cap, in an isolated child process"""
+    with get_admission().slot('analysis'):
+        # Only this codebase's cached stats go to the child, not the whole cache
+        known_file_stats = file_stats_cache.items_for(CodebaseAnalyzer().file_inodes(codebase_path)) \
+            if len(file_stats_cache) else []
+        # Local directories can change, so only workspace indexes are saved for reuse
+        prepared, new_file_stats = analysis_runner.run(prepare_isolated, codebase_path, known_file_stats,
+                                                       workspaces.owns(codebase_path))
+    # Keep the child's per-file stats so the next upload of the same files skips them
+    file_stats_cache.update(new_file_stats)
+    return prepared
+
+# Analysis starts in the background as soon as a codebase is ingested
+preanalysis = PreAnalysisPool.from_env(prepare_codebase)
+
+# Identical generations for the same repo commit share one LLM call, across threads and worker processes
+generation_flight = SingleFlight.from_env('generation')
+
+# Generated documents live on disk; the session only keeps the result id
+results = ResultStore.from_env()
+
+# Uploaded files are stored once by content hash and hard-linked into workspaces
+uploads = UploadStore.from_env()
+
+# Analyses of GitHub commits are kept in SQLite for summaries and cross-repo rollups
+snapshots = SnapshotStore.from_env()
+
+# JSON and markdown responses are gzip/brotli compressed for clients that accept it
+compressor = ResponseCompressor.from_env()
+
+# Static files are linked under content-hashed names with precompressed variants
+static_assets = StaticAssets.from_env(Path(app.static_folder)).load()
+
+# Daily token and cost budgets per tenant, reserved with each request's pre-flight estimate and settled against actual usage
+tenant_ledger = TenantLedger.from_env()
+
+# Time budgets (seconds) shared by all LLM calls of one request
+GENERATE_DEADLINE = float(os.getenv('DOCSMITH_GENERATE_DEADLINE', '300'))
+EXPLAIN_DEADLINE = float(os.getenv('DOCSMITH_EXPLAIN_DEADLINE', '90'))
+
+# Largest snippet /explain-code accepts
+EXPLAIN_MAX_CHARS = int(os.getenv('DOCSMITH_EXPLAIN_MAX_CHARS', '400000'))
+
+# Check if API key is configured (the offline stub backend needs none)
 def check_api_key():
+    if os.getenv("DOCSMITH_LLM_BACKEND", "").lower() == "stub":
+        return True
     return os.getenv("ANTHROPIC_API_KEY") is not None
 
+def start_preanalysis(codebase_path: str, workspace=None) -> Dict:
+    """Kick off background analysis and return the fields to add to the upload response"""
+    held = workspaces.acquire(workspace.id) if workspace is not None else None
+    # Workspaces never change once ingested; a local directory may have been edited since its last analysis
+    job = preanalysis.submit(
+        workspace.id if workspace is not None else codebase_path,
+        codebase_path,
+        on_finish=lambda: workspaces.release(held),
+        reuse_finished=workspace is not None
+    )
+    session['analysis_job_id'] = job.id
+    
+    if workspace is not None and workspace.key and not snapshots.has(workspace.repo_url, workspace.commit):
+        job.future.add_done_callback(lambda future: save_snapshot(workspace, future))
+    
+    # Small repositories finish almost immediately; include their stats right away
+    try:
+        job.future.result(timeout=float(os.getenv('DOCSMITH_PREANALYSIS_WAIT', '0.25')))
+    except Exception:
+        pass
+    
+    return job.status()
+
+def save_snapshot(workspace, future):
+    """Persist a finished analysis of a repository commit (runs on the analysis thread)"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    prepared = future.result()
+    try:
+        snapshots.save(workspace.repo_url, workspace.commit, prepared['analysis'], prepared['project_summary'])
+    except Exception as e:
+        print(f"Could not save analysis snapshot: {str(e)}")
+
+def session_snapshot_summary() -> Optional[Dict]:
+    """Stored summary of the session's repository commit, if it was analyzed before"""
+    workspace = workspaces.get(session.get('workspace_id'))
+    if workspace is None or not workspace.key:
+        return None
+    return snapshots.summary(workspace.repo_url, workspace.commit)
+
+def admit_codebase():
+    """Turn new codebases away while the analysis queue is full (raises Overloaded)"""
+    get_admission().check('analysis', preanalysis.queued())
+
+def acquire_session_codebase():
+    """Hold the session's codebase (re-cloning GitHub repos whose workspace is gone)
+
+    Returns (codebase_path, workspace); the caller releases the workspace.
+    Raises ValueError with a user-facing message when the codebase is gone.
+    """
+    codebase_path = session['codebase_path']
+    
+    # Hold the workspace so it cannot be evicted while we read it
+    workspace = workspaces.acquire(session.get('workspace_id'))
+    if workspace is not None:
+        codebase_path = workspace.path
+    print(f"Codebase path: {codebase_path}")
+    
+    if os.path.exists(codebase_path):
+        return codebase_path, workspace
+    
+    if session.get('upload_type') != 'github' or not session.get('github_url'):
+        raise ValueError('Codebase path no longer exists. Please re-upload your codebase.')
+    
+    print("GitHub repo path missing, attempting to re-clone...")
+    try:
+        github_url = session.get('github_url')
+        branch = session.get('github_branch', 'main')
+        with get_admission().slot('clone'):
+            workspace = workspaces.acquire_github(GitHubHandler(), github_url, branch)
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"Failed to re-clone: {str(e)}")
+        raise ValueError('Codebase path no longer exists and failed to re-clone. Please re-upload your codebase.')
+    
+    session['codebase_path'] = workspace.path
+    session['workspace_id'] = workspace.id
+    print(f"Successfully re-cloned to: {workspace.path}")
+    return workspace.path, workspace
+
+def prepared_analysis(doc_generator: DocumentationGenerator, codebase_path: str, use_background: bool = True) -> Dict:
+    """Attach to the background analysis started at upload time, or analyze inline"""
+    job = preanalysis.get(session.get('analysis_job_id')) if use_background else None
+    if job is not None and job.codebase_path == codebase_path:
+        try:
+            with span('preanalysis.wait'):
+                prepared = job.result()
+            record_cache('preanalysis', True)
+            return prepared
+        except ResourceLimitExceeded:
+            # Analyzing again would hit the same limit
+            raise
+        except Exception as e:
+            print(f"Background analysis failed, analyzing inline: {str(e)}")
+    
+    record_cache('preanalysis', False)
+    print("Analyzing codebase...")
+    if not use_background:
+        # Profiled runs analyze in this process so the profile covers the analysis
+        with get_admission().slot('analysis'):
+            return doc_generator.prepare(codebase_path, persist_index=workspaces.owns(codebase_path))
+    return prepare_codebase(codebase_path)
+
+def source_key_for(workspace) -> Optional[str]:
+    """Identity of the exact code in a workspace (repo URL and commit), if known"""
+    if workspace is not None and workspace.key:
+        return f"{workspace.repo_url}@{workspace.commit}"
+    return None
+
+def codebase_context(code: str) -> str:
+    """Definitions and call sites from the session's codebase that relate to a snippet"""
+    if request.form.get('use_codebase', '').lower() not in ('1', 'true', 'yes', 'on'):
+        return ""
+    
+    codebase_path = session.get('codebase_path')
+    if not codebase_path:
+        return ""
+    
+    index = None
+    job = preanalysis.get(session.get('analysis_job_id'))
+    if job is not None and job.state == 'done' and job.codebase_path == codebase_path:
+        index = job.result().get('index')
+    if index is None and workspaces.owns(codebase_path):
+        index = RetrievalIndex.load(index_path_for(codebase_path))
+    
+    # Long snippets only need their first part to find related code
+    return DocumentationGenerator().retrieve_related_code(index, code[:20000])
+
+def timings_requested() -> bool:
+    flag = request.values.get('include_timings', '')
+    return flag.lower() in ('1', 'true', 'yes')
+
+def admin_authorized() -> bool:
+    """Admin access needs DOCSMITH_ADMIN_TOKEN; without one, only local clients and only when safe
+
+    Behind a reverse proxy every request arrives from loopback, so without a
+    token loopback clients are trusted only by the debug server or when
+    DOCSMITH_TRUSTED_PROXIES makes remote_addr the real client address.
+    """
+    token = os.getenv('DOCSMITH_ADMIN_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+    if not (app.debug or TRUSTED_PROXIES):
+        return False
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+def user_tier() -> str:
+    """Tier used for model routing; only trusted from a gateway holding the admin token"""
+    tier = request.headers.get('X-DocSmith-Tier')
+    if tier and admin_authorized():
+        return tier
+    return os.getenv('DOCSMITH_DEFAULT_TIER', 'standard')
+
+def tenant_id() -> str:
+    """Tenant charged for LLM usage
+
+    The X-DocSmith-Tenant header is trusted only from a gateway holding the
+    admin token. Otherwise the client address is used when
+    DOCSMITH_TRUSTED_PROXIES says how to find it. Without that setting,
+    remote_addr may be a reverse proxy shared by every user, so each browser
+    session is charged separately instead.
+    """
+    tenant = request.headers.get('X-DocSmith-Tenant')
+    if tenant and admin_authorized():
+        return tenant
+    if TRUSTED_PROXIES:
+        return request.remote_addr or 'unknown'
+    if 'tenant_id' not in session:
+        session['tenant_id'] = uuid.uuid4().hex
+    return f"session:{session['tenant_id']}"
+
+def tenant_budget_response(remaining: Dict):
+    """429 response when the tenant has no tokens or budget left today, else None"""
+    if remaining['tokens'] != 0 and remaining['cost_usd'] != 0:
+        return None
+    # Budgets reset at midnight UTC
+    retry_after = 86400 - int(time.time()) % 86400
+    response = jsonify({'error': 'Daily token or cost budget exhausted', 'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def preflight_report(plan: Dict) -> Dict:
+    return {'doc_types': plan['doc_types'], 'sections': plan['sections'], 'totals': plan['totals']}
+
+def reserve_plan(doc_generator: DocumentationGenerator, prepared: Dict, doc_types: List[str], tenant: str) -> Optional[Dict]:
+    """Plan against the tenant's remaining budget and reserve the plan's forecast in one step
+
+    Returns None when concurrent requests spent the budget between planning
+    and reserving, even after planning again.
+    """
+    for _ in range(3):
+        plan = doc_generator.plan_generation(prepared, doc_types, tenant_ledger.remaining(tenant))
+        totals = plan['totals']
+        if not plan['doc_types'] or tenant_ledger.reserve(
+                tenant, totals['input_tokens'] + totals['output_tokens'], totals['cost_usd']):
+            return plan
+    return None
+
+def settle_section(tenant: str, forecast: Dict, usage: Optional[UsageMeter]):
+    """Settle one section's reservation against the LLM usage metered while generating it
+
+    Sections served by a coalesced request or a cache make no LLM call and
+    are refunded in full, as are sections that never started (usage None).
+    """
+    calls = usage.calls if usage is not None else []
+    tenant_ledger.settle(
+        tenant, forecast['input_tokens'] + forecast['output_tokens'], forecast['cost_usd'],
+        sum(input_tokens + output_tokens for _, input_tokens, output_tokens in calls),
+        sum(estimate_cost(model, input_tokens, output_tokens) for model, input_tokens, output_tokens in calls)
+    )
+
+def generate_planned(doc_generator: DocumentationGenerator, prepared: Dict, plan: Dict, tenant: str, workspace):
+    """Generate a plan's sections in order, yielding (doc_type, documentation) and settling each one
+
+    Closing the generator early refunds the sections that were not generated.
+    """
+    pending = list(plan['doc_types'])
+    try:
+        for doc_type in plan['doc_types']:
+            with meter_usage() as usage:
+                try:
+                    section = doc_generator.generate_from_prepared(
+                        prepared, [doc_type], singleflight=generation_flight, source_key=source_key_for(workspace),
+                        prompts=plan['prompts']
+                    )
+                finally:
+                    pending.remove(doc_type)
+                    settle_section(tenant, plan['sections'][doc_type], usage)
+            yield doc_type, section
+    finally:
+        for doc_type in pending:
+            settle_section(tenant, plan['sections'][doc_type], None)
+
+def profile_requested() -> bool:
+    flag = request.values.get('profile', '')
+    return flag.lower() in ('1', 'true', 'yes') and admin_authorized()
+
+@app.before_request
+def begin_request_trace():
+    g.request_started = time.perf_counter()
+    start_trace()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe(
+            'docsmith_http_request_duration_seconds',
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unknown',
+            status=response.status_code
+        )
+    return response
+
+@app.after_request
+def compress_response(response):
+    return compressor.apply(request, response)
+
+@app.context_processor
+def asset_helpers():
+    def asset_url(filename: str) -> str:
+        """Fingerprinted URL of a static file, or its plain static URL if it was not built"""
+        path = static_assets.fingerprinted(filename)
+        if path is None:
+            return url_for('static', filename=filename)
+        return url_for('fingerprinted_asset', path=path)
+    return {'asset_url': asset_url}
+
+@app.route('/assets/<path:path>')
+def fingerprinted_asset(path):
+    """Content-hashed static file, precompressed when the client accepts it, cached for a year"""
+    variant = static_assets.variant(path, request.accept_encodings)
+    if variant is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    
+    filename, encoding = variant
+    response = send_from_directory(
+        str(static_assets.output_dir), filename,
+        mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        max_age=ASSET_MAX_AGE
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    end_trace()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of the metrics of every worker process"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return Response(metrics_store.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/profiles')
+def admin_profiles():
+    """List saved profiling runs"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return jsonify({'profiles': list_profiles()})
+
+@app.route('/admin/profiles/<run_id>')
+def admin_profile_summary(run_id):
+    """Top-N hot functions of a profiling run"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    try:
+        top = int(request.args.get('top', 20))
+    except ValueError:
+        return jsonify({'error': 'top must be an integer'}), 400
+    
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        return jsonify({'error': f'sort must be one of {sorted(SORT_KEYS)}'}), 400
+    
+    summary = profile_summary(run_id, top=top, sort=sort)
+    if summary is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    return jsonify(summary)
+
+@app.route('/admin/profiles/<run_id>/download')
+def admin_profile_download(run_id):
+    """Download the raw cProfile artifact"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    path = profile_path(run_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    return send_file(
+        str(path.absolute()),
+        as_attachment=True,
+        download_name=f'{run_id}.prof',
+        mimetype='application/octet-stream'
+    )
+
+@app.route('/admin/workspaces')
+def admin_workspaces():
+    """List managed clone and upload workspaces"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return jsonify({
+        'workspaces': workspaces.list(),
+        'total_bytes': workspaces.total_bytes(),
+        'quota_bytes': workspaces.quota_bytes
+    })
+
+@app.route('/admin/admission')
+def admin_admission():
+    """Active and waiting work per admission stage"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    return jsonify({
+        'stages': get_admission().to_dict(),
+        'queued_analyses': preanalysis.queued()
+    })
+
+@app.route('/admin/snapshots')
+def admin_snapshots():
+    """Analyzed repositories (newest snapshot each) and totals across them"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    offset = request.args.get('offset', 0, type=int)
+    return jsonify({
+        'repos': snapshots.repos(limit, offset),
+        'rollup': snapshots.rollup()
+    })
+
+@app.route('/admin/snapshots/<query>')
+def admin_snapshot_query(query):
+    """Summary, language breakdown or largest files of ?repo= at ?commit= (default: newest)"""
+    if not admin_authorized():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    repo = request.args.get('repo')
+    commit = request.args.get('commit')
+    if not repo:
+        return jsonify({'error': 'repo is required'}), 400
+    
+    if query == 'summary':
+        result = snapshots.summary(repo, commit)
+    elif query == 'languages':
+        result = snapshots.languages(repo, commit)
+    elif query == 'largest-files':
+        result = snapshots.largest_files(repo, commit, min(request.args.get('limit', 10, type=int), 1000))
+    else:
+        return jsonify({'error': f'Unknown query: {query}'}), 404
+    
+    if result is None:
+        return jsonify({'error': 'No snapshot for this repository'}), 404
+    return jsonify({'repo': repo, 'commit': commit, query.replace('-', '_'): result})
+
 @app.route('/')
 def index():
     """Main page with mode selection"""
@@ -47,7 +537,7 @@ def code_explanation():
         flash('API key not configured. Please set ANTHROPIC_API_KEY environment variable.', 'error')
         return redirect(url_for('index'))
     
-    return render_template('code_explanation.html')
+    return render_template('code_explanation.html', codebase_available='codebase_path' in session)
 
 @app.route('/upload-github', methods=['POST'])
 def upload_github():
@@ -64,11 +554,17 @@ def upload_github():
         if not github_handler.is_valid_github_url(github_url):
             return jsonify({'error': 'Invalid GitHub repository URL'}), 400
         
-        temp_dir = github_handler.clone_repository(github_url, branch)
-        repo_info = github_handler.get_repository_info(temp_dir)
+        admit_codebase()
+        with get_admission().slot('clone'):
+            workspace = workspaces.acquire_github(github_handler, github_url, branch)
+        try:
+            repo_info = github_handler.get_repository_info(workspace.path)
+        finally:
+            workspaces.release(workspace)
         
         # Store in session with additional metadata
-        session['codebase_path'] = temp_dir
+        session['codebase_path'] = workspace.path
+        session['workspace_id'] = workspace.id
         session['repo_info'] = repo_info
         session['upload_type'] = 'github'
         session['github_url'] = github_url
@@ -78,12 +574,29 @@ def upload_github():
             'success': True,
             'repo_info': repo_info,
             'message': f'Repository {repo_info["owner"]}/{repo_info["repo_name"]} cloned successfully',
-            'upload_type': 'github'
+            'upload_type': 'github',
+            'analysis': start_preanalysis(workspace.path, workspace)
         })
         
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({'error': f'Failed to clone repository: {str(e)}'}), 500
 
+def store_upload(workspace, name: str, stream) -> Optional[str]:
+    """Store one uploaded file in a workspace under its relative path; the reason if it was rejected"""
+    try:
+        relative_path = safe_relative_path(name)
+    except ValueError as e:
+        return str(e)
+    digest, _ = uploads.store_stream(stream)
+    try:
+        uploads.link_blob(digest, Path(workspace.path) / relative_path)
+    except OSError as e:
+        # Names the filesystem refuses, or a file where another upload needs a directory
+        return f'Cannot store {relative_path}: {e.strerror or e}'
+    return None
+
 @app.route('/upload-zip', methods=['POST'])
 def upload_zip():
     """Handle ZIP file upload"""
@@ -97,32 +610,52 @@ def upload_zip():
     if not file.filename.lower().endswith('.zip'):
         return jsonify({'error': 'Please upload a ZIP file'}), 400
     
+    admit_codebase()
+    workspace = None
     try:
-        temp_dir = tempfile.mkdtemp()
+        workspace = workspaces.create('zip')
         filename = secure_filename(file.filename)
-        zip_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         
-        file.save(zip_path)
+        # The upload stream is seekable, so extract without saving the archive first.
+        # Members go through the blob store, so files seen before are linked, not stored again
+        rejected = []
+        with get_admission().slot('extract'), span('ingest.extract_zip'):
+            with zipfile.ZipFile(file.stream, 'r') as zip_ref:
+                for member in zip_ref.infolist():
+                    if member.is_dir():
+                        continue
+                    with zip_ref.open(member) as member_stream:
+                        error = store_upload(workspace, member.filename, member_stream)
+                    if error:
+                        rejected.append({'path': member.filename, 'error': error})
         
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        os.unlink(zip_path)  # Clean up the zip file
+        workspaces.finalize(workspace)
+        workspaces.release(workspace)
         
         # Store in session
-        session['codebase_path'] = temp_dir
+        session['codebase_path'] = workspace.path
+        session['workspace_id'] = workspace.id
         session['repo_info'] = None
         session['upload_type'] = 'zip'
         session['uploaded_filename'] = filename
         
+        message = f'ZIP file {filename} uploaded and extracted successfully'
+        if rejected:
+            message += f' ({len(rejected)} files skipped)'
         return jsonify({
             'success': True,
-            'message': f'ZIP file {filename} uploaded and extracted successfully',
+            'message': message,
             'upload_type': 'zip',
-            'filename': filename
+            'filename': filename,
+            'rejected_files': rejected,
+            'analysis': start_preanalysis(workspace.path, workspace)
         })
         
     except Exception as e:
+        if workspace is not None:
+            workspaces.remove(workspace, force=True)
+        if isinstance(e, Overloaded):
+            raise
         return jsonify({'error': f'Failed to process ZIP file: {str(e)}'}), 500
 
 @app.route('/upload-files', methods=['POST'])
@@ -135,32 +668,126 @@ def upload_files():
     if not files or files[0].filename == '':
         return jsonify({'error': 'No files selected'}), 400
     
+    admit_codebase()
+    workspace = None
     try:
-        temp_dir = tempfile.mkdtemp()
+        workspace = workspaces.create('files')
         
-        for file in files:
-            if file.filename:
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(temp_dir, filename)
-                
-                # Ensure directory exists
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                file.save(file_path)
+        rejected = []
+        with get_admission().slot('extract'):
+            for file in files:
+                if file.filename:
+                    # Keep the relative path, which folder uploads send
+                    error = store_upload(workspace, file.filename, file.stream)
+                    if error:
+                        rejected.append({'path': file.filename, 'error': error})
+        stored = len(files) - len(rejected)
+        
+        workspaces.finalize(workspace)
+        workspaces.release(workspace)
         
         # Store in session
-        session['codebase_path'] = temp_dir
+        session['codebase_path'] = workspace.path
+        session['workspace_id'] = workspace.id
         session['repo_info'] = None
         session['upload_type'] = 'files'
-        session['uploaded_files_count'] = len(files)
+        session['uploaded_files_count'] = stored
         
+        message = f'{stored} files uploaded successfully'
+        if rejected:
+            message += f' ({len(rejected)} files skipped)'
         return jsonify({
             'success': True,
-            'message': f'{len(files)} files uploaded successfully',
+            'message': message,
             'upload_type': 'files',
-            'files_count': len(files)
+            'files_count': stored,
+            'rejected_files': rejected,
+            'analysis': start_preanalysis(workspace.path, workspace)
         })
         
     except Exception as e:
+        if workspace is not None:
+            workspaces.remove(workspace, force=True)
+        if isinstance(e, Overloaded):
+            raise
+        return jsonify({'error': f'Failed to upload files: {str(e)}'}), 500
+
+@app.route('/uploads', methods=['POST'])
+def begin_upload():
+    """Start a resumable upload from a manifest of {path, size, sha256}; returns the blobs to send"""
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        status = uploads.begin(data.get('files'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'success': True, **status})
+
+@app.route('/uploads/<upload_id>')
+def upload_status(upload_id):
+    """Blobs still missing from an upload and how much of each arrived, for resuming"""
+    try:
+        return jsonify(uploads.status(upload_id))
+    except KeyError:
+        return jsonify({'error': 'Upload not found'}), 404
+
+@app.route('/uploads/<upload_id>/blobs/<digest>', methods=['PUT'])
+def upload_chunk(upload_id, digest):
+    """Store one chunk of a blob at the byte offset given by ?offset="""
+    try:
+        offset = int(request.args.get('offset', '0'))
+    except ValueError:
+        return jsonify({'error': 'Invalid offset'}), 400
+    
+    try:
+        return jsonify(uploads.write_chunk(upload_id, digest, offset, request.get_data()))
+    except KeyError:
+        return jsonify({'error': 'Upload or file not found'}), 404
+    except UploadConflict as e:
+        return jsonify({'error': str(e), 'received': e.received}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Assemble a finished upload into a workspace and start analyzing it"""
+    admit_codebase()
+    workspace = None
+    try:
+        workspace = workspaces.create('files')
+        with span('ingest.link_blobs'):
+            files_count = uploads.complete(upload_id, workspace.path)
+        
+        workspaces.finalize(workspace)
+        workspaces.release(workspace)
+        
+        # Store in session
+        session['codebase_path'] = workspace.path
+        session['workspace_id'] = workspace.id
+        session['repo_info'] = None
+        session['upload_type'] = 'files'
+        session['uploaded_files_count'] = files_count
+        
+        return jsonify({
+            'success': True,
+            'message': f'{files_count} files uploaded successfully',
+            'upload_type': 'files',
+            'files_count': files_count,
+            'analysis': start_preanalysis(workspace.path, workspace)
+        })
+        
+    except KeyError:
+        if workspace is not None:
+            workspaces.remove(workspace, force=True)
+        return jsonify({'error': 'Upload not found'}), 404
+    except ValueError as e:
+        if workspace is not None:
+            workspaces.remove(workspace, force=True)
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        if workspace is not None:
+            workspaces.remove(workspace, force=True)
         return jsonify({'error': f'Failed to upload files: {str(e)}'}), 500
 
 @app.route('/set-local-path', methods=['POST'])
@@ -177,15 +804,53 @@ def set_local_path():
     if not os.path.isdir(local_path):
         return jsonify({'error': 'Path is not a directory'}), 400
     
+    admit_codebase()
+    
     # Store in session
     session['codebase_path'] = local_path
+    session.pop('workspace_id', None)
     session['repo_info'] = None
     
     return jsonify({
         'success': True,
-        'message': f'Local directory set: {local_path}'
+        'message': f'Local directory set: {local_path}',
+        'analysis': start_preanalysis(local_path)
     })
 
+@app.route('/analysis-status/<job_id>')
+def analysis_status(job_id):
+    """State of a background analysis, with project stats once it is done"""
+    job = preanalysis.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Analysis job not found'}), 404
+    
+    return jsonify(job.status())
+
+@app.route('/project-preview')
+def project_preview():
+    """Estimated project summary from sampled files, available before the full analysis finishes"""
+    if 'codebase_path' not in session:
+        return jsonify({'error': 'No codebase uploaded'}), 400
+    
+    # The exact summary is free once the background analysis is done, or if this commit was analyzed before
+    job = preanalysis.get(session.get('analysis_job_id'))
+    if job is not None and job.state == 'done':
+        return jsonify({'project_summary': job.status()['project_summary'], 'exact': True})
+    
+    stored_summary = session_snapshot_summary()
+    if stored_summary is not None:
+        return jsonify({'project_summary': stored_summary, 'exact': True})
+    
+    try:
+        codebase_path, workspace = acquire_session_codebase()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        return jsonify({'project_summary': DocumentationGenerator().get_project_preview(codebase_path), 'exact': False})
+    finally:
+        workspaces.release(workspace)
+
 @app.route('/generate-docs', methods=['POST'])
 def generate_docs():
     """Generate documentation"""
@@ -235,81 +900,86 @@ This is a demonstration guide. A real developer guide would include:
             'estimated_complexity': 'Demo'
         }
         
-        session['documentation'] = demo_documentation
+        session['result_id'] = results.save(demo_documentation, demo_project_summary)
         session['project_summary'] = demo_project_summary
         
         return jsonify({
             'success': True,
             'project_summary': demo_project_summary,
             'documentation': demo_documentation,
+            'rendered': render_all(demo_documentation),
+            'result_id': session['result_id'],
             'demo_mode': True
         })
     
+    workspace = None
     try:
         print(f"Starting documentation generation for: {doc_types}")
         
         # Import and initialize components
-        doc_generator = DocumentationGenerator()
-        codebase_path = session['codebase_path']
-        print(f"Codebase path: {codebase_path}")
-        
-        # Check if path exists, if not try to re-clone for GitHub repos
-        if not os.path.exists(codebase_path):
-            if session.get('upload_type') == 'github' and session.get('github_url'):
-                print("GitHub repo path missing, attempting to re-clone...")
-                try:
-                    github_handler = GitHubHandler()
-                    github_url = session.get('github_url')
-                    branch = session.get('github_branch', 'main')
-                    temp_dir = github_handler.clone_repository(github_url, branch)
-                    session['codebase_path'] = temp_dir
-                    codebase_path = temp_dir
-                    print(f"Successfully re-cloned to: {temp_dir}")
-                except Exception as e:
-                    print(f"Failed to re-clone: {str(e)}")
-                    return jsonify({'error': 'Codebase path no longer exists and failed to re-clone. Please re-upload your codebase.'}), 400
-            else:
-                return jsonify({'error': 'Codebase path no longer exists. Please re-upload your codebase.'}), 400
-        
-        # Get project summary
-        print("Getting project summary...")
-        project_summary = doc_generator.get_project_summary(codebase_path)
-        print(f"Project summary: {project_summary}")
-        
-        # Generate documentation
-        documentation = {}
-        
-        for doc_type in doc_types:
-            print(f"Generating {doc_type}...")
-            if doc_type == "architecture_overview":
-                analyzer = CodebaseAnalyzer()
-                analysis = analyzer.analyze_codebase(codebase_path)
-                documentation[doc_type] = doc_generator.claude.generate_overview(analysis)
-            elif doc_type == "developer_guide":
-                analyzer = CodebaseAnalyzer()
-                analysis = analyzer.analyze_codebase(codebase_path)
-                documentation[doc_type] = doc_generator.claude.generate_developer_guide(analysis)
-            elif doc_type == "api_documentation":
-                analyzer = CodebaseAnalyzer()
-                analysis = analyzer.analyze_codebase(codebase_path)
-                api_info = doc_generator._extract_api_info(analysis)
-                documentation[doc_type] = doc_generator.claude.generate_api_docs(api_info)
-            print(f"Generated {doc_type} successfully")
+        doc_generator = DocumentationGenerator(tier=user_tier())
+        try:
+            codebase_path, workspace = acquire_session_codebase()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        tenant = tenant_id()
+        remaining = tenant_ledger.remaining(tenant)
+        exhausted = tenant_budget_response(remaining)
+        if exhausted is not None:
+            return exhausted
+        
+        profiler = ProfileRun('generate-docs', metadata={'doc_types': doc_types}) if profile_requested() else None
+        
+        with profiler or nullcontext(), deadline(GENERATE_DEADLINE):
+            # Profiled runs analyze inline so the profile covers the analysis
+            prepared = prepared_analysis(doc_generator, codebase_path, use_background=profiler is None)
+            project_summary = prepared['project_summary']
+            print(f"Project summary: {project_summary}")
+            
+            plan = reserve_plan(doc_generator, prepared, doc_types, tenant)
+            if plan is None:
+                return tenant_budget_response({'tokens': 0, 'cost_usd': 0})
+            if not plan['doc_types']:
+                return jsonify({
+                    'error': 'The selected documentation does not fit the token or cost budget',
+                    'preflight': preflight_report(plan)
+                }), 413
+            
+            # Generate documentation
+            documentation = {}
+            for _, section in generate_planned(doc_generator, prepared, plan, tenant, workspace):
+                documentation.update(section)
         
         # Store results in session
-        session['documentation'] = documentation
+        result_id = results.save(documentation, project_summary)
+        session['result_id'] = result_id
         session['project_summary'] = project_summary
         
-        return jsonify({
+        result = {
             'success': True,
             'project_summary': project_summary,
-            'documentation': documentation
-        })
+            'documentation': documentation,
+            'rendered': render_all(documentation),
+            'result_id': result_id,
+            'preflight': preflight_report(plan)
+        }
+        
+        trace = current_trace()
+        if timings_requested() and trace is not None:
+            result['timings'] = trace.to_dict()
+        
+        if profiler is not None and profiler.run_id:
+            result['profile_run_id'] = profiler.run_id
+        
+        return jsonify(result)
         
     except ImportError as e:
         error_msg = f"Missing dependency: {str(e)}. Please install required packages."
         print(f"Import error: {error_msg}")
         return jsonify({'error': error_msg}), 500
+    except (Overloaded, ResourceLimitExceeded):
+        raise
     except Exception as e:
         import traceback
         print(f"Error generating documentation: {str(e)}")
@@ -320,6 +990,106 @@ This is a demonstration guide. A real developer guide would include:
             return jsonify({'error': 'API authentication failed. Please check your ANTHROPIC_API_KEY.'}), 500
         
         return jsonify({'error': f'Error generating documentation: {str(e)}'}), 500
+    finally:
+        workspaces.release(workspace)
+
+@app.route('/generate-docs/estimate', methods=['POST'])
+def estimate_docs():
+    """Pre-flight token, latency and cost estimate for generating the selected documentation"""
+    if 'codebase_path' not in session:
+        return jsonify({'error': 'No codebase uploaded'}), 400
+    
+    doc_types = request.form.getlist('doc_types')
+    if not doc_types:
+        return jsonify({'error': 'Please select at least one documentation type'}), 400
+    
+    workspace = None
+    try:
+        doc_generator = DocumentationGenerator(tier=user_tier())
+        try:
+            codebase_path, workspace = acquire_session_codebase()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        remaining = tenant_ledger.remaining(tenant_id())
+        prepared = prepared_analysis(doc_generator, codebase_path)
+        plan = doc_generator.plan_generation(prepared, doc_types, remaining)
+        return jsonify({'preflight': preflight_report(plan), 'tenant_remaining': remaining})
+    finally:
+        workspaces.release(workspace)
+
+@app.route('/generate-docs/stream', methods=['POST'])
+def generate_docs_stream():
+    """Generate documentation, streaming each section as newline-delimited JSON when it is ready"""
+    if 'codebase_path' not in session:
+        return jsonify({'error': 'No codebase uploaded'}), 400
+    
+    doc_types = request.form.getlist('doc_types')
+    if not doc_types:
+        return jsonify({'error': 'Please select at least one documentation type'}), 400
+    
+    if not check_api_key():
+        return jsonify({'error': 'Streaming needs a configured LLM backend; use /generate-docs for demo mode'}), 400
+    
+    tenant = tenant_id()
+    remaining = tenant_ledger.remaining(tenant)
+    exhausted = tenant_budget_response(remaining)
+    if exhausted is not None:
+        return exhausted
+    
+    doc_generator = DocumentationGenerator(tier=user_tier())
+    try:
+        codebase_path, workspace = acquire_session_codebase()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def events():
+        try:
+            with deadline(GENERATE_DEADLINE):
+                prepared = prepared_analysis(doc_generator, codebase_path)
+                documentation = {}
+                yield json.dumps({'event': 'analysis', 'project_summary': prepared['project_summary']}) + "\n"
+                
+                plan = reserve_plan(doc_generator, prepared, doc_types, tenant)
+                if plan is None:
+                    yield json.dumps({'event': 'error', 'error': 'Daily token or cost budget exhausted'}) + "\n"
+                    return
+                yield json.dumps({'event': 'preflight', 'preflight': preflight_report(plan)}) + "\n"
+                if not plan['doc_types']:
+                    yield json.dumps({
+                        'event': 'error',
+                        'error': 'The selected documentation does not fit the token or cost budget'
+                    }) + "\n"
+                    return
+                
+                with closing(generate_planned(doc_generator, prepared, plan, tenant, workspace)) as sections:
+                    for doc_type, section in sections:
+                        if doc_type in section:
+                            yield json.dumps({
+                                'event': 'section',
+                                'doc_type': doc_type,
+                                'content': section[doc_type],
+                                'rendered': render_markdown(section[doc_type])
+                            }) + "\n"
+                        documentation.update(section)
+            
+            # The session cookie was sent with the first event, so the result id goes in the stream
+            yield json.dumps({'event': 'done', 'result_id': results.save(documentation, prepared['project_summary'])}) + "\n"
+        except Overloaded as e:
+            yield json.dumps({'event': 'error', 'error': str(e), 'retry_after': e.retry_after}) + "\n"
+        except Exception as e:
+            print(f"Error streaming documentation: {str(e)}")
+            yield json.dumps({'event': 'error', 'error': f'Error generating documentation: {str(e)}'}) + "\n"
+    
+    # Sent as soon as each section is generated; proxies must not buffer the body
+    response = Response(
+        stream_with_context(events()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # The server closes the response even if the client left before the generator started
+    response.call_on_close(lambda: workspaces.release(workspace))
+    return response
 
 @app.route('/explain-code', methods=['POST'])
 def explain_code():
@@ -330,6 +1100,10 @@ def explain_code():
     if not code:
         return jsonify({'error': 'Code is required'}), 400
     
+    # Checked before tokenizing; the chunk limit below is the precise one
+    if len(code) > EXPLAIN_MAX_CHARS:
+        return jsonify({'error': f'Code is too long to explain (limit {EXPLAIN_MAX_CHARS} characters). Explain a smaller section.'}), 413
+    
     # Check if API key is configured - if not, return demo explanation
     if not check_api_key():
         demo_explanation = f"""# Code Explanation (Demo Mode)
@@ -357,73 +1131,138 @@ This is a demonstration of the code explanation feature. In a real scenario with
         return jsonify({
             'success': True,
             'explanation': demo_explanation,
+            'rendered': render_markdown(demo_explanation),
             'demo_mode': True
         })
     
+    from claude_integration import ClaudeDocGenerator, ExplanationTooLarge
     try:
-        from claude_integration import ClaudeDocGenerator
-        claude = ClaudeDocGenerator()
+        claude = ClaudeDocGenerator(tier=user_tier())
+        
+        context = f"Language: {language}"
+        related_code = codebase_context(code)
+        if related_code:
+            context += f"\n\nRelated code from the uploaded codebase:\n{related_code}"
         
-        explanation = claude.explain_code_section(code, language)
+        with deadline(EXPLAIN_DEADLINE):
+            explanation = claude.explain_code_section(code, context, language)
         
         return jsonify({
             'success': True,
-            'explanation': explanation
+            'explanation': explanation,
+            'rendered': render_markdown(explanation)
         })
         
+    except ExplanationTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({'error': f'Error explaining code: {str(e)}'}), 500
 
-@app.route('/download/<doc_type>')
-def download_doc(doc_type):
-    """Download individual documentation file"""
-    if 'documentation' not in session:
+@app.route('/rendered/<digest>')
+def rendered_markdown(digest):
+    """Server-rendered HTML sections and table of contents for generated markdown"""
+    if not is_valid_digest(digest):
+        return jsonify({'error': 'Invalid document id'}), 400
+    
+    rendered = load_rendered(digest)
+    if rendered is None:
+        return jsonify({'error': 'Rendered document not found'}), 404
+    
+    # The URL is the content hash, so the response never changes
+    response = jsonify(rendered)
+    response.set_etag(digest)
+    response.cache_control.private = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+def send_document(result_id: Optional[str], doc_type: str):
+    """Serve one stored document with a strong ETag (304 when the client has it)"""
+    manifest = results.manifest(result_id)
+    if manifest is None:
         flash('No documentation available', 'error')
         return redirect(url_for('documentation_generator'))
     
-    documentation = session['documentation']
-    if doc_type not in documentation:
+    document = manifest['documents'].get(doc_type)
+    if document is None:
         flash('Documentation type not found', 'error')
         return redirect(url_for('documentation_generator'))
     
-    content = documentation[doc_type]
-    
-    # Create a temporary file
-    temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.md', delete=False)
-    temp_file.write(content)
-    temp_file.close()
-    
-    return send_file(
-        temp_file.name,
+    response = send_file(
+        results.document_path(result_id, doc_type),
         as_attachment=True,
         download_name=f'{doc_type}.md',
-        mimetype='text/markdown'
+        mimetype='text/markdown',
+        etag=document['sha256'],
+        conditional=True
     )
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
-@app.route('/download-all')
-def download_all():
-    """Download all documentation as ZIP"""
-    if 'documentation' not in session:
+def send_archive(result_id: Optional[str]):
+    """Serve the ZIP of a result, built once and then sent from disk"""
+    manifest = results.manifest(result_id)
+    if manifest is None:
         flash('No documentation available', 'error')
         return redirect(url_for('documentation_generator'))
     
-    documentation = session['documentation']
-    
-    # Create ZIP file in memory
-    zip_buffer = io.BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for doc_type, content in documentation.items():
-            zip_file.writestr(f'{doc_type}.md', content)
+    etag = results.archive_etag(manifest)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
     
-    zip_buffer.seek(0)
+    archive = results.cached_archive(result_id)
+    if archive is None and results.should_stream(manifest):
+        # Large exports start downloading while the archive is compressed and cached
+        response = Response(results.stream_archive(result_id), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename={ARCHIVE_NAME}'
+        response.set_etag(etag)
+    else:
+        response = send_file(
+            archive or results.build_archive(result_id),
+            as_attachment=True,
+            download_name=ARCHIVE_NAME,
+            mimetype='application/zip',
+            etag=etag,
+            conditional=True
+        )
     
-    return send_file(
-        zip_buffer,
-        as_attachment=True,
-        download_name='documentation.zip',
-        mimetype='application/zip'
-    )
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/download/<doc_type>')
+def download_doc(doc_type):
+    """Download individual documentation file"""
+    return send_document(session.get('result_id'), doc_type)
+
+@app.route('/download-all')
+def download_all():
+    """Download all documentation as ZIP"""
+    return send_archive(session.get('result_id'))
+
+@app.route('/results/<result_id>/<doc_type>.md')
+def download_result_doc(result_id, doc_type):
+    """Download a document of a specific result (e.g. from a streamed generation)"""
+    return send_document(result_id, doc_type)
+
+@app.route('/results/<result_id>/documentation.zip')
+def download_result_archive(result_id):
+    return send_archive(result_id)
+
+@app.errorhandler(Overloaded)
+def overloaded(error):
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+@app.errorhandler(ResourceLimitExceeded)
+def resource_limit_exceeded(error):
+    return jsonify({'error': f'{str(error)}. The codebase is too large or complex to analyze.'}), 422
 
 @app.errorhandler(404)
 def not_found(error):
@@ -433,5 +1272,9 @@ def not_found(error):
 def internal_error(error):
     return render_template('500.html'), 500
 
+# Pre-forking servers import this module in the master; warm up there so workers share it
+if preload_requested():
+    print(f"Preloaded: {preload()}")
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -3,29 +3,52 @@ import tempfile
 import shutil
 from pathlib import Path
 from typing import Optional, Dict
-import git
 import re
 from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from metrics import span
+
+def local_repos_allowed() -> bool:
+    """Test hook: accept file:// URLs and local repository paths as well as GitHub URLs
+
+    Used by the load-test harness and offline tests to clone local bare
+    repositories; never enable it on a server that untrusted users can reach,
+    as it lets them clone any repository on the host.
+    """
+    return os.getenv('DOCSMITH_ALLOW_LOCAL_REPOS', '').lower() in ('1', 'true', 'yes')
 
 class GitHubHandler:
-    def __init__(self):
+    def __init__(self, allow_local: Optional[bool] = None):
         self.temp_dirs = []
+        self.allow_local = local_repos_allowed() if allow_local is None else allow_local
     
-    def clone_repository(self, repo_url: str, branch: str = "main") -> Optional[str]:
-        """Clone a GitHub repository to a temporary directory"""
+    def clone_repository(self, repo_url: str, branch: str = "main", dest_dir: Optional[str] = None) -> Optional[str]:
+        """Clone a GitHub repository to a temporary directory (or dest_dir, which the caller owns)"""
+        import git
+        
+        temp_dir = None
         try:
             # Validate and normalize the URL
             normalized_url = self._normalize_github_url(repo_url)
             if not normalized_url:
                 raise ValueError("Invalid GitHub repository URL")
+            if normalized_url.startswith('file://'):
+                # git only accepts a plain path for local clones
+                normalized_url = url2pathname(urlparse(normalized_url).path)
             
             # Create temporary directory
-            temp_dir = tempfile.mkdtemp(prefix="github_repo_")
-            self.temp_dirs.append(temp_dir)
+            if dest_dir:
+                target_dir = dest_dir
+            else:
+                temp_dir = tempfile.mkdtemp(prefix="github_repo_")
+                self.temp_dirs.append(temp_dir)
+                target_dir = temp_dir
             
             # Clone the repository
             try:
-                repo = git.Repo.clone_from(normalized_url, temp_dir)
+                with span('github.clone'):
+                    repo = git.Repo.clone_from(normalized_url, target_dir)
                 
                 # Try to checkout the specified branch
                 try:
@@ -46,17 +69,58 @@ class GitHubHandler:
                 else:
                     raise ValueError(f"Failed to clone repository: {str(e)}")
             
-            return temp_dir
+            return target_dir
             
         except Exception as e:
             if temp_dir and os.path.exists(temp_dir):
                 shutil.rmtree(temp_dir, ignore_errors=True)
             raise e
     
+    def resolve_commit(self, repo_url: str, branch: str = "main") -> Optional[str]:
+        """Look up the commit a branch points to without cloning (None if it cannot be resolved)"""
+        import git
+        
+        normalized_url = self._normalize_github_url(repo_url)
+        if not normalized_url:
+            return None
+        if normalized_url.startswith('file://'):
+            normalized_url = url2pathname(urlparse(normalized_url).path)
+        
+        candidates = [branch, "master"] if branch == "main" else [branch]
+        try:
+            with span('github.ls_remote'):
+                output = git.cmd.Git().ls_remote(normalized_url, *[f"refs/heads/{name}" for name in candidates])
+        except git.exc.GitCommandError:
+            return None
+        
+        refs = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                refs[parts[1]] = parts[0]
+        
+        for name in candidates:
+            if f"refs/heads/{name}" in refs:
+                return refs[f"refs/heads/{name}"]
+        return None
+    
+    def get_head_commit(self, repo_path: str) -> Optional[str]:
+        """Full SHA of the checked-out commit"""
+        try:
+            import git
+            return git.Repo(repo_path).head.commit.hexsha
+        except Exception:
+            return None
+    
     def _normalize_github_url(self, url: str) -> Optional[str]:
-        """Normalize GitHub URL to HTTPS format"""
+        """Normalize GitHub URL to HTTPS format (local repositories to file:// URLs when allowed)"""
         url = url.strip()
         
+        if self.allow_local:
+            local_url = self._normalize_local_url(url)
+            if local_url:
+                return local_url
+        
         # Handle various GitHub URL formats
         patterns = [
             r"https://github\.com/([^/]+)/([^/]+)(?:\.git)?/?$",
@@ -76,9 +140,26 @@ class GitHubHandler:
         
         return None
     
+    def _normalize_local_url(self, url: str) -> Optional[str]:
+        """file:// URL of a local bare or working repository given as a path or file:// URL"""
+        path = url2pathname(urlparse(url).path) if url.startswith('file://') else url
+        if not os.path.isabs(path):
+            return None
+        
+        repo_path = Path(path).resolve()
+        is_bare = (repo_path / 'HEAD').is_file() and (repo_path / 'objects').is_dir()
+        if not is_bare and not (repo_path / '.git').exists():
+            return None
+        return repo_path.as_uri()
+    
     def get_repository_info(self, repo_path: str) -> Dict:
         """Extract repository information"""
+        with span('github.repo_info'):
+            return self._read_repository_info(repo_path)
+    
+    def _read_repository_info(self, repo_path: str) -> Dict:
         try:
+            import git
             repo = git.Repo(repo_path)
             
             # Get remote URL
@@ -113,7 +194,10 @@ class GitHubHandler:
             
             # Parse owner/repo from URL
             owner, repo_name = "unknown", "unknown"
-            if remote_url:
+            if remote_url and (remote_url.startswith('/') or remote_url.startswith('file://')):
+                # Local repositories (see local_repos_allowed) have no owner
+                owner, repo_name = "local", Path(url2pathname(urlparse(remote_url).path)).name
+            elif remote_url:
                 try:
                     parts = remote_url.replace('https://github.com/', '').split('/')
                     if len(parts) >= 2:
@@ -0,0 +1,63 @@
+"""
+Gunicorn settings for running DocSmith in production
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Threaded workers (gthread) let one process serve many slow LLM-bound and
+streaming requests at once, while idle keep-alive connections wait in the
+worker's poller instead of occupying a thread. All values can be
+overridden through DOCSMITH_* environment variables.
+"""
+
+import os
+import multiprocessing
+
+bind = os.getenv('DOCSMITH_BIND', '0.0.0.0:5001')
+
+# Requests mostly wait on the LLM, so a few processes with many threads each
+workers = int(os.getenv('DOCSMITH_WORKERS', str(multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.getenv('DOCSMITH_THREADS', '16'))
+
+keepalive = int(os.getenv('DOCSMITH_KEEPALIVE', '5'))
+
+# A silent worker is restarted only after the longest generation could have finished
+timeout = int(float(os.getenv('DOCSMITH_GENERATE_DEADLINE', '300'))) + 60
+
+# On SIGTERM workers stop accepting connections and get this long to drain in-flight requests
+graceful_timeout = int(os.getenv('DOCSMITH_GRACEFUL_TIMEOUT', str(timeout)))
+
+# Recycle workers now and then to bound memory growth from large analyses
+max_requests = int(os.getenv('DOCSMITH_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+
+# Import the app (and warm heavy dependencies) once in the master, shared copy-on-write
+preload_app = True
+os.environ.setdefault('DOCSMITH_PRELOAD', '1')
+
+accesslog = os.getenv('DOCSMITH_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def on_starting(server):
+    if not os.getenv('DOCSMITH_ADMIN_TOKEN'):
+        server.log.warning("DOCSMITH_ADMIN_TOKEN is not set; admin endpoints and gateway headers are disabled")
+
+
+def post_fork(server, worker):
+    """Reclaim workspaces left by recycled workers, keep sweeping, start this worker's analysis fork server
+    and share its metrics"""
+    from flask_app import workspaces, analysis_runner, metrics, metrics_store
+    workspaces.sweep()
+    workspaces.start_sweeper()
+    analysis_runner.warm()
+    # Whatever the master recorded while preloading is not this worker's
+    metrics.reset()
+    metrics_store.start_flusher()
+
+
+def worker_exit(server, worker):
+    """Let background analyses finish and keep the worker's metrics before the process goes away"""
+    from flask_app import preanalysis, metrics_store
+    preanalysis.shutdown(wait=True)
+    metrics_store.flush()
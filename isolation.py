@@ -0,0 +1,173 @@
+"""
+Run work in a child process with memory and time limits
+
+A pathological codebase (huge generated files, deeply nested trees) can make
+analysis use unbounded memory or time. Running it in a separate process means
+the limits can be enforced by the kernel and the process killed, while the
+web worker that asked for it only sees an exception.
+
+Children are forked from a fork server (where the platform has one) that has
+already imported the preload modules, so each run costs a fork instead of a
+new interpreter. Call warm() in each worker process, never before forking
+workers: a fork server belongs to the process that started it.
+
+Like spawn, the fork server imports the __main__ script of the process that
+starts it. Scripts that run isolated work must therefore keep their
+top-level code under `if __name__ == '__main__':`, or multiprocessing stops
+with a bootstrapping error. gunicorn and server.py already do this.
+"""
+
+import os
+import signal
+import multiprocessing
+import multiprocessing.forkserver
+from typing import Any, Callable, Optional, Sequence
+
+from metrics import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Fork servers exist on POSIX only
+DEFAULT_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class ResourceLimitExceeded(Exception):
+    """The isolated work was killed for exceeding its memory or time limit"""
+
+
+def _set_limits(memory_bytes: Optional[int], cpu_seconds: Optional[int]):
+    if resource is None:
+        return
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+
+
+def _child_main(connection, func: Callable, args: tuple, memory_bytes: Optional[int], cpu_seconds: Optional[int]):
+    """Entry point of the child process: apply limits, run func and send back its outcome"""
+    # Forked children inherit the counters of their parent or fork server; only report our own
+    metrics.reset()
+    try:
+        _set_limits(memory_bytes, cpu_seconds)
+        result = ('ok', func(*args))
+    except MemoryError:
+        result = ('limit', f'ran out of memory (limit {(memory_bytes or 0) // (1024 * 1024)} MB)')
+    except BaseException as e:
+        result = ('error', e)
+
+    # Counters recorded in the child are added to the parent's metrics
+    try:
+        connection.send(result + (metrics.snapshot(),))
+    except Exception as e:
+        # The result or the exception could not be pickled
+        connection.send(('error', RuntimeError(str(e)), metrics.snapshot()))
+    connection.close()
+
+
+class IsolatedRunner:
+    """Runs module-level functions in a fresh process under rlimits and a wall-clock timeout
+
+    Disabled runners call the function in-process, which is useful where
+    processes cannot be spawned. Arguments and results must be picklable.
+    preload names the modules the fork server imports once for every child.
+    """
+
+    def __init__(self, name: str, enabled: bool = True, timeout: float = 600,
+                 memory_bytes: Optional[int] = 2 * 1024**3, start_method: str = DEFAULT_START_METHOD,
+                 preload: Sequence[str] = ()):
+        self.name = name
+        self.enabled = enabled
+        self.timeout = timeout
+        self.memory_bytes = memory_bytes
+        self.start_method = start_method
+        self.preload = list(preload)
+
+    @classmethod
+    def from_env(cls, name: str, preload: Sequence[str] = ()) -> 'IsolatedRunner':
+        memory_mb = float(os.getenv('DOCSMITH_ANALYSIS_MEMORY_MB', '2048'))
+        return cls(
+            name,
+            enabled=os.getenv('DOCSMITH_ANALYSIS_ISOLATION', '1').lower() not in ('0', 'false', 'no'),
+            timeout=float(os.getenv('DOCSMITH_ANALYSIS_TIMEOUT', '600')),
+            memory_bytes=int(memory_mb * 1024 * 1024) if memory_mb > 0 else None,
+            start_method=os.getenv('DOCSMITH_ANALYSIS_START_METHOD', DEFAULT_START_METHOD),
+            preload=preload
+        )
+
+    def _context(self):
+        context = multiprocessing.get_context(self.start_method)
+        if self.start_method == 'forkserver' and self.preload:
+            # Only takes effect when the fork server starts
+            context.set_forkserver_preload(self.preload)
+        return context
+
+    def warm(self):
+        """Start the fork server now, so the first run does not wait for it to import the preload modules"""
+        if self.enabled and self.start_method == 'forkserver':
+            self._context()
+            multiprocessing.forkserver.ensure_running()
+
+    def run(self, func: Callable, *args) -> Any:
+        """Return func(*args) from a child process
+
+        Raises ResourceLimitExceeded if the child is killed or runs out of
+        memory or time; exceptions raised by func are re-raised as they are.
+        """
+        if not self.enabled:
+            return func(*args)
+
+        context = self._context()
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_child_main,
+            args=(sender, func, args, self.memory_bytes, int(self.timeout) + 1),
+            name=f'docsmith-{self.name}',
+            daemon=True
+        )
+        process.start()
+        sender.close()
+
+        try:
+            # The result must be received before joining, or a large one blocks the child
+            if not receiver.poll(self.timeout):
+                self._kill(process)
+                raise self._limit_exceeded(f'took longer than {self.timeout:g} seconds')
+            try:
+                outcome, payload, child_metrics = receiver.recv()
+            except EOFError:
+                process.join(5)
+                raise self._limit_exceeded(self._describe_exit(process.exitcode))
+        finally:
+            receiver.close()
+            if process.is_alive():
+                process.join(5)
+                self._kill(process)
+
+        metrics.merge(child_metrics)
+        if outcome == 'ok':
+            return payload
+        if outcome == 'limit':
+            raise self._limit_exceeded(payload)
+        raise payload
+
+    def _limit_exceeded(self, reason: str) -> ResourceLimitExceeded:
+        metrics.inc('docsmith_isolated_kills_total', runner=self.name)
+        return ResourceLimitExceeded(f'{self.name.capitalize()} stopped: it {reason}')
+
+    def _describe_exit(self, exitcode: Optional[int]) -> str:
+        if exitcode is not None and exitcode < 0:
+            if -exitcode == getattr(signal, 'SIGXCPU', None):
+                return 'used more than its CPU time limit'
+            if -exitcode == getattr(signal, 'SIGKILL', None):
+                return 'was killed, most likely for using too much memory'
+            return f'was killed by signal {-exitcode}'
+        return f'exited unexpectedly with code {exitcode}'
+
+    def _kill(self, process):
+        if process.is_alive():
+            process.kill()
+        process.join()
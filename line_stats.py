@@ -0,0 +1,113 @@
+import re
+import mmap
+from pathlib import Path
+from typing import NamedTuple
+
+from file_sniffer import TEXT, SNIFF_BYTES, classify
+
+# Files at least this large are memory-mapped instead of read into a buffer
+MMAP_THRESHOLD = 64 * 1024
+
+# Bytes kept from the start of each file for encoding detection and tokenization.
+# Four bytes per character covers the 4000-character token sample.
+HEAD_BYTES = 16000
+
+# Memory-mapped files are counted in slices of this size
+COUNT_CHUNK = 1024 * 1024
+
+BLANK_LINE = re.compile(rb'^[ \t\r\f\v]*$', re.MULTILINE)
+
+_HASH_COMMENT = re.compile(rb'^[ \t]*#', re.MULTILINE)
+_SLASH_COMMENT = re.compile(rb'^[ \t]*(?://|/\*|\*)', re.MULTILINE)
+_SQL_COMMENT = re.compile(rb'^[ \t]*(?:--|/\*|\*)', re.MULTILINE)
+_MARKUP_COMMENT = re.compile(rb'^[ \t]*<!--', re.MULTILINE)
+_CSS_COMMENT = re.compile(rb'^[ \t]*(?:/\*|\*)', re.MULTILINE)
+
+COMMENT_PATTERNS = {
+    'python': _HASH_COMMENT,
+    'ruby': _HASH_COMMENT,
+    'shell': _HASH_COMMENT,
+    'yaml': _HASH_COMMENT,
+    'javascript': _SLASH_COMMENT,
+    'typescript': _SLASH_COMMENT,
+    'react': _SLASH_COMMENT,
+    'react-typescript': _SLASH_COMMENT,
+    'java': _SLASH_COMMENT,
+    'cpp': _SLASH_COMMENT,
+    'c': _SLASH_COMMENT,
+    'csharp': _SLASH_COMMENT,
+    'php': _SLASH_COMMENT,
+    'go': _SLASH_COMMENT,
+    'rust': _SLASH_COMMENT,
+    'swift': _SLASH_COMMENT,
+    'kotlin': _SLASH_COMMENT,
+    'scala': _SLASH_COMMENT,
+    'sql': _SQL_COMMENT,
+    'css': _CSS_COMMENT,
+    'html': _MARKUP_COMMENT,
+    'markdown': _MARKUP_COMMENT,
+}
+
+
+class LineStats(NamedTuple):
+    lines: int
+    blank_lines: int
+    comment_lines: int
+    bytes_read: int
+    head: bytes
+    kind: str = TEXT
+
+
+def _count_newlines(data: mmap.mmap) -> int:
+    """Newlines in a memory map, which only has count() from Python 3.13"""
+    count = 0
+    view = memoryview(data)
+    try:
+        for start in range(0, len(view), COUNT_CHUNK):
+            count += view[start:start + COUNT_CHUNK].tobytes().count(b'\n')
+    finally:
+        view.release()
+    return count
+
+
+def _count(pattern, data) -> int:
+    count = 0
+    for _ in pattern.finditer(data):
+        count += 1
+    return count
+
+
+def scan_line_stats(file_path: Path, size: int, language: str, sniff: bool = True) -> LineStats:
+    """Count lines, blank lines and comment lines on raw bytes without decoding
+
+    Line counts match the previous text path (newlines + 1) for any
+    ASCII-compatible encoding. Only the first HEAD_BYTES are returned for
+    callers that need text. With sniff, binary, minified and generated files
+    (see file_sniffer) are recognized from their head and not counted; only
+    their first pages of a memory-mapped file are read.
+    """
+    comment_pattern = COMMENT_PATTERNS.get(language)
+
+    with open(file_path, 'rb') as f:
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                kind = classify(data[:SNIFF_BYTES], file_path.name, truncated=size > SNIFF_BYTES) if sniff else TEXT
+                if kind != TEXT:
+                    return LineStats(0, 0, 0, min(size, SNIFF_BYTES), b'', kind)
+                newlines = _count_newlines(data)
+                blank = _count(BLANK_LINE, data)
+                comments = _count(comment_pattern, data) if comment_pattern else 0
+                head = data[:HEAD_BYTES]
+                length = len(data)
+        else:
+            data = f.read()
+            kind = classify(data[:SNIFF_BYTES], file_path.name, truncated=len(data) > SNIFF_BYTES) if sniff else TEXT
+            if kind != TEXT:
+                return LineStats(0, 0, 0, len(data), b'', kind)
+            newlines = data.count(b'\n')
+            blank = _count(BLANK_LINE, data)
+            comments = _count(comment_pattern, data) if comment_pattern else 0
+            head = data[:HEAD_BYTES]
+            length = len(data)
+
+    return LineStats(newlines + 1, blank, comments, length, head)
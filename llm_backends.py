@@ -0,0 +1,224 @@
+import os
+import time
+import random
+import hashlib
+import threading
+from typing import Optional
+
+# How often a streaming call checks whether it was cancelled or ran out of time
+STREAM_WATCH_INTERVAL = 0.1
+
+
+class LLMResponse:
+    """Normalized completion result returned by every backend"""
+
+    __slots__ = ('text', 'model', 'input_tokens', 'output_tokens')
+
+    def __init__(self, text: str, model: str, input_tokens: int = 0, output_tokens: int = 0):
+        self.text = text
+        self.model = model
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class LLMTimeout(Exception):
+    """A completion ran past its timeout; partial holds any text received so far"""
+
+    def __init__(self, message: str, partial: str = ""):
+        super().__init__(message)
+        self.partial = partial
+
+
+class LLMCancelled(Exception):
+    """A completion was abandoned because another attempt already answered"""
+
+
+class LLMBackend:
+    """Interface for the completion backends used by ClaudeDocGenerator
+
+    timeout bounds the whole call in seconds and cancel lets another thread
+    stop it early; backends check both while the response is streaming.
+    """
+
+    name = 'base'
+
+    def complete(self, prompt: str, model: str, max_tokens: int, timeout: Optional[float] = None,
+                 cancel: Optional[threading.Event] = None) -> LLMResponse:
+        raise NotImplementedError
+
+
+class AnthropicBackend(LLMBackend):
+    """Backend that sends prompts to the Anthropic Messages API"""
+
+    name = 'anthropic'
+
+    def __init__(self, api_key: Optional[str] = None):
+        # Imported here because the SDK takes about a second to import
+        import anthropic
+        self._anthropic = anthropic
+        self.client = anthropic.Anthropic(
+            api_key=api_key or os.getenv("ANTHROPIC_API_KEY")
+        )
+
+    def complete(self, prompt: str, model: str, max_tokens: int, timeout: Optional[float] = None,
+                 cancel: Optional[threading.Event] = None) -> LLMResponse:
+        # Streaming lets a stalled or cancelled call be closed and keeps the text received so far
+        started = time.monotonic()
+        parts = []
+        closed = []
+        finished = threading.Event()
+        try:
+            with self.client.messages.stream(
+                model=model,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=timeout if timeout is not None else self._anthropic.NOT_GIVEN
+            ) as stream:
+                if cancel is not None or timeout is not None:
+                    threading.Thread(
+                        target=self._watch, args=(stream, started, timeout, cancel, finished, closed),
+                        name='llm-stream-watch', daemon=True
+                    ).start()
+                try:
+                    for text in stream.text_stream:
+                        parts.append(text)
+                        if cancel is not None and cancel.is_set():
+                            raise LLMCancelled("Completion cancelled")
+                        if timeout is not None and time.monotonic() - started > timeout:
+                            raise LLMTimeout(f"Completion exceeded {timeout:.1f}s", ''.join(parts))
+                    response = stream.get_final_message()
+                except (LLMCancelled, LLMTimeout):
+                    raise
+                except Exception as e:
+                    # Reading from a stream the watcher closed fails with whatever the transport raises
+                    if not closed:
+                        raise
+                    if closed[0] == 'cancel':
+                        raise LLMCancelled("Completion cancelled") from e
+                    raise LLMTimeout(f"Completion exceeded {timeout:.1f}s", ''.join(parts)) from e
+        except self._anthropic.APITimeoutError as e:
+            raise LLMTimeout(str(e), ''.join(parts)) from e
+        finally:
+            finished.set()
+
+        usage = getattr(response, 'usage', None)
+        return LLMResponse(
+            text=''.join(parts) or response.content[0].text,
+            model=model,
+            input_tokens=getattr(usage, 'input_tokens', 0) or 0,
+            output_tokens=getattr(usage, 'output_tokens', 0) or 0
+        )
+
+
+    @staticmethod
+    def _watch(stream, started: float, timeout: Optional[float], cancel: Optional[threading.Event],
+               finished: threading.Event, closed: list):
+        """Close the stream once cancel is set or timeout passes, without waiting for the next chunk
+
+        The SDK timeout only bounds each read, so a server that trickles or
+        stalls would otherwise hold the caller's thread and admission slot.
+        """
+        while not finished.wait(STREAM_WATCH_INTERVAL):
+            if cancel is not None and cancel.is_set():
+                closed.append('cancel')
+            elif timeout is not None and time.monotonic() - started > timeout:
+                closed.append('timeout')
+            else:
+                continue
+            try:
+                stream.close()
+            except Exception:
+                pass
+            return
+
+
+class StubBackend(LLMBackend):
+    """Deterministic offline backend with configurable latency and token throughput
+
+    stall_rate adds stall_seconds to that fraction of calls to reproduce tail latency.
+    """
+
+    name = 'stub'
+
+    def __init__(self, latency: float = 0.0, tokens_per_second: float = 0.0, output_tokens: int = 400,
+                 stall_rate: float = 0.0, stall_seconds: float = 0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+
+    def complete(self, prompt: str, model: str, max_tokens: int, timeout: Optional[float] = None,
+                 cancel: Optional[threading.Event] = None) -> LLMResponse:
+        input_tokens = max(1, len(prompt) // 4)
+        output_tokens = max(1, min(max_tokens, self.output_tokens))
+        text = self._render(prompt, output_tokens)
+
+        delay = self.latency
+        if self.tokens_per_second > 0:
+            delay += output_tokens / self.tokens_per_second
+        if self.stall_rate > 0 and random.random() < self.stall_rate:
+            delay += self.stall_seconds
+
+        if delay > 0:
+            wait = delay if timeout is None else min(delay, timeout)
+            if cancel is not None and cancel.wait(wait):
+                raise LLMCancelled("Completion cancelled")
+            if cancel is None:
+                time.sleep(wait)
+            if wait < delay:
+                # Text "streamed" so far, in proportion to the elapsed time
+                raise LLMTimeout(f"Completion exceeded {timeout:.1f}s", text[:int(len(text) * wait / delay)])
+
+        return LLMResponse(
+            text=text,
+            model=model,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens
+        )
+
+    def _render(self, prompt: str, output_tokens: int) -> str:
+        """Build a markdown answer that only depends on the prompt text"""
+        digest = hashlib.sha256(prompt.encode('utf-8', errors='ignore')).hexdigest()
+        title = next((line.strip() for line in prompt.splitlines() if line.strip()), 'Response')
+
+        words = []
+        seed = digest
+        # Roughly four characters per token, five-ish characters per word
+        while len(words) < output_tokens * 3 // 4:
+            seed = hashlib.sha256(seed.encode('ascii')).hexdigest()
+            words.extend(seed[i:i + 5] for i in range(0, 60, 6))
+
+        body = ' '.join(words[:max(1, output_tokens * 3 // 4)])
+        return f"# {title.rstrip(':')}\n\n*Stub response {digest[:12]}*\n\n{body}\n"
+
+
+_shared_backend: Optional[LLMBackend] = None
+_shared_lock = threading.Lock()
+
+
+def shared_backend() -> LLMBackend:
+    """Process-wide backend from the environment, so every request reuses one client and its connections"""
+    global _shared_backend
+    with _shared_lock:
+        if _shared_backend is None:
+            _shared_backend = get_backend()
+        return _shared_backend
+
+
+def get_backend(name: Optional[str] = None) -> LLMBackend:
+    """Create the backend selected by name or the DOCSMITH_LLM_BACKEND environment variable"""
+    name = (name or os.getenv('DOCSMITH_LLM_BACKEND', 'anthropic')).lower()
+
+    if name == 'anthropic':
+        return AnthropicBackend()
+    if name == 'stub':
+        return StubBackend(
+            latency=float(os.getenv('DOCSMITH_STUB_LATENCY', '0')),
+            tokens_per_second=float(os.getenv('DOCSMITH_STUB_TOKENS_PER_SECOND', '0')),
+            output_tokens=int(os.getenv('DOCSMITH_STUB_OUTPUT_TOKENS', '400')),
+            stall_rate=float(os.getenv('DOCSMITH_STUB_STALL_RATE', '0')),
+            stall_seconds=float(os.getenv('DOCSMITH_STUB_STALL_SECONDS', '0'))
+        )
+
+    raise ValueError(f"Unknown LLM backend: {name}")
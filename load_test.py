@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Offline load test for DocSmith
+
+Builds synthetic repositories as local bare git repositories and ZIP archives,
+starts the app with the stub LLM backend (gunicorn when it is installed, else
+a threaded development server) and drives /upload-github, /upload-zip,
+/generate-docs and /explain-code at each concurrency level in turn. Every
+stage reports throughput, latency percentiles, errors, the server's peak RSS
+(all its processes) and disk usage, so saturation points and scaling
+regressions show up without network access.
+
+    python3 load_test.py --levels 1,4,16 --files 500 --iterations 3
+    python3 load_test.py --levels 8 --json run.json --baseline previous.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+current_dir = Path(__file__).parent.absolute()
+sys.path.insert(0, str(current_dir))
+
+from benchmark import DOC_TYPES, generate_synthetic_repo, zip_directory
+
+STAGES = ['upload-github', 'upload-zip', 'generate-docs', 'explain-code']
+
+# Throughput must grow by this much from one level to the next, or the stage is saturated
+SATURATION_GAIN = 1.1
+
+EXPLAIN_SNIPPET_LINES = 80
+
+# Fixture commits must not depend on the user's git configuration
+COMMIT_IDENTITY = {
+    'GIT_AUTHOR_NAME': 'DocSmith Load Test', 'GIT_AUTHOR_EMAIL': 'load-test@localhost',
+    'GIT_COMMITTER_NAME': 'DocSmith Load Test', 'GIT_COMMITTER_EMAIL': 'load-test@localhost'
+}
+
+
+def build_fixtures(root: Path, count: int, num_files: int) -> List[Dict]:
+    """Synthetic repositories as bare git repositories plus their ZIP archives"""
+    import git
+
+    fixtures = []
+    for index in range(count):
+        source = generate_synthetic_repo(root / f'src_{index}', num_files, seed=index)
+        repo = git.Repo.init(source)
+        repo.git.checkout('-b', 'main')
+        repo.git.add('-A')
+        with repo.git.custom_environment(**COMMIT_IDENTITY):
+            repo.git.commit('-m', 'Synthetic fixture')
+        bare = root / f'repo_{index}.git'
+        git.Repo.clone_from(str(source), str(bare), bare=True)
+        shutil.rmtree(source / '.git')
+
+        snippet_file = next(source.rglob('*.py'))
+        snippet = "\n".join(snippet_file.read_text(encoding='utf-8').splitlines()[:EXPLAIN_SNIPPET_LINES])
+        fixtures.append({
+            'url': bare.as_uri(),
+            'zip': zip_directory(source),
+            'snippet': snippet
+        })
+        shutil.rmtree(source)
+    return fixtures
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir: Path, port: int, server: str, env: Dict[str, str]) -> subprocess.Popen:
+    """Start the app in its own process group, with all its relative temp dirs under workdir"""
+    env = {**os.environ, **env, 'PYTHONPATH': str(current_dir), 'DOCSMITH_BIND': f'127.0.0.1:{port}',
+           'DOCSMITH_ACCESS_LOG': os.devnull}
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', str(current_dir / 'gunicorn.conf.py'), 'wsgi:app']
+    else:
+        command = [sys.executable, '-c',
+                   "import sys; from werkzeug.serving import run_simple; from flask_app import app; "
+                   "run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=True)", str(port)]
+
+    log = open(workdir / 'server.log', 'wb')
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}; see {workdir / 'server.log'}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError('Server did not start within 60 seconds')
+
+
+def stop_server(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def process_tree_rss_mb(root_pid: int) -> Optional[float]:
+    """Resident memory of a process and all its descendants (Linux /proc only)"""
+    proc = Path('/proc')
+    if not proc.exists():
+        return None
+
+    children: Dict[int, List[int]] = {}
+    rss_pages: Dict[int, int] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+            statm = (entry / 'statm').read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces; fields after it are fixed
+        fields = stat[stat.rfind(')') + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(entry.name))
+        rss_pages[int(entry.name)] = int(statm.split()[1])
+
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def disk_usage_mb(path: Path) -> float:
+    total = 0
+    seen = set()
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            try:
+                stat = os.lstat(os.path.join(root, file))
+            except OSError:
+                continue
+            # Workspaces hard-link uploaded blobs; count each inode once
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total / (1024 * 1024)
+
+
+class RssSampler:
+    """Peak RSS of the server's process tree while a stage runs"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            rss = process_tree_rss_mb(self.pid)
+            if rss is not None:
+                self.peak = rss if self.peak is None else max(self.peak, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self) -> 'RssSampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def run_stage(users: List, iterations: int, request: Callable) -> Tuple[float, List[float], Dict[int, int]]:
+    """Every user sends `iterations` requests one after another; returns wall time, latencies, status counts"""
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+
+    def user_loop(index: int):
+        for iteration in range(iterations):
+            started = time.perf_counter()
+            try:
+                status = request(index, users[index], iteration)
+            except Exception as e:
+                print(f"Request failed: {str(e)}")
+                status = 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(users)) as pool:
+        list(pool.map(user_loop, range(len(users))))
+    return time.perf_counter() - started, latencies, statuses
+
+
+def stage_requests(base_url: str, fixtures: List[Dict]) -> Dict[str, Callable]:
+    def fixture(index: int) -> Dict:
+        return fixtures[index % len(fixtures)]
+
+    def upload_github(index, session, iteration):
+        return session.post(f'{base_url}/upload-github',
+                            data={'github_url': fixture(index)['url'], 'branch': 'main'}).status_code
+
+    def upload_zip(index, session, iteration):
+        files = {'zip_file': ('fixture.zip', fixture(index)['zip'], 'application/zip')}
+        return session.post(f'{base_url}/upload-zip', files=files).status_code
+
+    def generate_docs(index, session, iteration):
+        return session.post(f'{base_url}/generate-docs', data={'doc_types': DOC_TYPES}).status_code
+
+    def explain_code(index, session, iteration):
+        # A different suffix per request so the explanation cache does not answer
+        code = f"{fixture(index)['snippet']}\n# request {index}-{iteration}-{time.time_ns()}\n"
+        return session.post(f'{base_url}/explain-code', data={'code': code, 'language': 'Python'}).status_code
+
+    return {
+        'upload-github': upload_github,
+        'upload-zip': upload_zip,
+        'generate-docs': generate_docs,
+        'explain-code': explain_code
+    }
+
+
+def run_level(base_url: str, server_pid: int, workdir: Path, fixtures: List[Dict], concurrency: int,
+              iterations: int, stages: List[str]) -> Dict[str, Dict]:
+    import requests
+
+    # One session per virtual user, so uploads and generations share its cookie
+    users = [requests.Session() for _ in range(concurrency)]
+    handlers = stage_requests(base_url, fixtures)
+    results = {}
+
+    for stage in stages:
+        with RssSampler(server_pid) as sampler:
+            wall, latencies, statuses = run_stage(users, iterations, handlers[stage])
+        total = sum(statuses.values())
+        results[stage] = {
+            'requests': total,
+            'errors': total - statuses.get(200, 0),
+            'rejected': statuses.get(429, 0),
+            'throughput_rps': round(statuses.get(200, 0) / wall, 3) if wall > 0 else 0.0,
+            'p50_s': round(percentile(latencies, 50), 4),
+            'p95_s': round(percentile(latencies, 95), 4),
+            'p99_s': round(percentile(latencies, 99), 4),
+            'max_s': round(max(latencies), 4) if latencies else 0.0,
+            'peak_rss_mb': round(sampler.peak, 1) if sampler.peak is not None else None,
+            'disk_mb': round(disk_usage_mb(workdir), 1)
+        }
+        print(f"  c={concurrency:<4} {stage:<14} {results[stage]['throughput_rps']:>8.2f} req/s  "
+              f"p95 {results[stage]['p95_s']:.3f}s  errors {results[stage]['errors']}")
+
+    for session in users:
+        session.close()
+    return results
+
+
+def saturation_points(levels: Dict[int, Dict[str, Dict]], stages: List[str]) -> Dict[str, Optional[int]]:
+    """Per stage, the first concurrency level after which throughput stops growing"""
+    points = {}
+    ordered = sorted(levels)
+    for stage in stages:
+        points[stage] = None
+        for lower, higher in zip(ordered, ordered[1:]):
+            if levels[higher][stage]['throughput_rps'] < levels[lower][stage]['throughput_rps'] * SATURATION_GAIN:
+                points[stage] = lower
+                break
+    return points
+
+
+def compare_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Stages whose throughput fell, or whose p95 latency rose, by more than tolerance"""
+    regressions = []
+    for level, stages in report['levels'].items():
+        for stage, result in stages.items():
+            previous = baseline.get('levels', {}).get(level, {}).get(stage)
+            if previous is None:
+                continue
+            if previous['throughput_rps'] and result['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+                regressions.append(f"c={level} {stage}: throughput {previous['throughput_rps']} -> {result['throughput_rps']} req/s")
+            if previous['p95_s'] and result['p95_s'] > previous['p95_s'] * (1 + tolerance):
+                regressions.append(f"c={level} {stage}: p95 {previous['p95_s']} -> {result['p95_s']} s")
+    return regressions
+
+
+def format_report(report: Dict) -> List[str]:
+    settings = report['settings']
+    lines = [
+        f"DocSmith load test - {report['started']}",
+        f"python {sys.version.split()[0]}, server={settings['server']}, backend=stub "
+        f"(latency {settings['llm_latency']}s), {settings['files']} files x {settings['repos']} repos, "
+        f"{settings['iterations']} requests per user per stage",
+        ""
+    ]
+    header = f"{'stage':<14} {'req':>5} {'err':>4} {'429':>4} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'rss MB':>8} {'disk MB':>8}"
+    for level, stages in report['levels'].items():
+        lines.append(f"== concurrency {level} ==")
+        lines.append(header)
+        for stage, r in stages.items():
+            rss = f"{r['peak_rss_mb']:.1f}" if r['peak_rss_mb'] is not None else 'n/a'
+            lines.append(
+                f"{stage:<14} {r['requests']:>5} {r['errors']:>4} {r['rejected']:>4} {r['throughput_rps']:>8.2f} "
+                f"{r['p50_s']:>8.3f} {r['p95_s']:>8.3f} {r['p99_s']:>8.3f} {rss:>8} {r['disk_mb']:>8.1f}"
+            )
+        lines.append("")
+
+    lines.append("== saturation (last level before throughput stopped growing) ==")
+    for stage, level in report['saturation'].items():
+        lines.append(f"{stage:<14} {level if level is not None else 'not reached'}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run an offline load test against a local DocSmith server')
+    parser.add_argument('--levels', default='1,4,16', help='Comma-separated concurrency levels (virtual users)')
+    parser.add_argument('--iterations', type=int, default=3, help='Requests per user per stage')
+    parser.add_argument('--files', type=int, default=500, help='Files per synthetic repository')
+    parser.add_argument('--repos', type=int, default=4, help='Distinct synthetic repositories')
+    parser.add_argument('--stages', default=','.join(STAGES), help='Comma-separated stages to run, in order')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'threaded'], default='auto',
+                        help='gunicorn with gunicorn.conf.py, or the threaded development server')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='Seconds the stub LLM takes per call')
+    parser.add_argument('--output', default=str(current_dir / 'load_test_output.txt'), help='Results file')
+    parser.add_argument('--json', help='Also write the results as JSON (usable as a later --baseline)')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative throughput drop or p95 increase against the baseline')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+    stages = [stage for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    server = args.server
+    if server == 'auto':
+        try:
+            import gunicorn  # noqa: F401
+            server = 'gunicorn'
+        except ImportError:
+            server = 'threaded'
+
+    workdir = Path(tempfile.mkdtemp(prefix='docsmith_load_'))
+    fixtures_dir, server_dir = workdir / 'fixtures', workdir / 'server'
+    server_dir.mkdir(parents=True)
+
+    report = {
+        'started': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'settings': {'server': server, 'llm_latency': args.llm_latency, 'files': args.files,
+                     'repos': args.repos, 'iterations': args.iterations, 'stages': stages},
+        'levels': {}
+    }
+
+    process = None
+    try:
+        print(f"Building {args.repos} fixture repositories with {args.files} files...")
+        fixtures = build_fixtures(fixtures_dir, args.repos, args.files)
+
+        port = free_port()
+        process = start_server(server_dir, port, server, {
+            'DOCSMITH_LLM_BACKEND': 'stub',
+            'DOCSMITH_STUB_LATENCY': str(args.llm_latency),
+            'DOCSMITH_ALLOW_LOCAL_REPOS': '1',
+            'DOCSMITH_WORKSPACE_ROOT': str(server_dir / 'temp_workspaces'),
+            'DOCSMITH_BLOB_DIR': str(server_dir / 'temp_blobs'),
+            'DOCSMITH_RESULT_DIR': str(server_dir / 'temp_results'),
+            'DOCSMITH_RENDER_DIR': str(server_dir / 'temp_rendered'),
+            'DOCSMITH_INDEX_DIR': str(server_dir / 'temp_indexes'),
+            'DOCSMITH_SNAPSHOT_DB': str(server_dir / 'temp_snapshots' / 'analysis.sqlite3'),
+        })
+        print(f"Server ({server}) listening on port {port}")
+
+        for concurrency in levels:
+            report['levels'][str(concurrency)] = run_level(
+                f'http://127.0.0.1:{port}', process.pid, server_dir, fixtures,
+                concurrency, args.iterations, stages
+            )
+    finally:
+        if process is not None:
+            stop_server(process)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report['saturation'] = saturation_points({int(level): r for level, r in report['levels'].items()}, stages)
+    lines = format_report(report)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_baseline(report, json.load(f), args.tolerance)
+        lines.append("")
+        lines.append(f"== regressions against {args.baseline} (tolerance {args.tolerance:.0%}) ==")
+        lines.extend(regressions or ['none'])
+
+    text = "\n".join(lines) + "\n"
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(text)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    print(text)
+    print(f"Results written to {args.output}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
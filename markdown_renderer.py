@@ -0,0 +1,218 @@
+import os
+import re
+import html
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from metrics import span, record_cache
+
+RENDER_DIR = os.getenv('DOCSMITH_RENDER_DIR', 'temp_rendered')
+
+# Bump when rendering options change so cached HTML is not reused
+RENDERER_VERSION = "1"
+
+MEMORY_CACHE_SIZE = 128
+
+# Rendered files on disk are evicted after RENDER_TTL seconds without use, oldest first above RENDER_MAX_MB
+RENDER_TTL = float(os.getenv('DOCSMITH_RENDER_TTL', '86400'))
+RENDER_MAX_BYTES = int(float(os.getenv('DOCSMITH_RENDER_MAX_MB', '512')) * 1024 * 1024)
+EVICT_EVERY = 50
+
+# Rendered HTML is split before top-level headings so long documents can be shown incrementally
+SECTION_BREAK = re.compile(r'(?=<h[12][ >])')
+
+SAFE_SCHEMES = {'http', 'https', 'mailto'}
+URL_SCHEME = re.compile(r'^([a-z][a-z0-9+.-]*):', re.IGNORECASE)
+# Browsers drop these anywhere in a URL before reading its scheme
+URL_IGNORED = re.compile(r'[\x00-\x20\x7f]+')
+
+_memory: 'OrderedDict[str, Dict]' = OrderedDict()
+_memory_lock = threading.Lock()
+_local = threading.local()
+_writes = 0
+
+
+def is_safe_url(value: str) -> bool:
+    """True for http(s) and mailto URLs and for URLs without a scheme
+
+    The value is decoded the way a browser decodes the attribute
+    (`&#106;avascript:`, `java&#x09;script:`) before its scheme is read.
+    """
+    url = URL_IGNORED.sub('', html.unescape(value))
+    match = URL_SCHEME.match(url)
+    return match is None or match.group(1).lower() in SAFE_SCHEMES
+
+
+def _safe_links_extension():
+    """Markdown extension that drops javascript:/data: and other unsafe link targets"""
+    from markdown.extensions import Extension
+    from markdown.treeprocessors import Treeprocessor
+
+    class SafeLinks(Treeprocessor):
+        def run(self, root):
+            for element in root.iter():
+                for attribute in ('href', 'src'):
+                    value = element.get(attribute)
+                    if value is not None and not is_safe_url(value):
+                        element.set(attribute, '#')
+
+    class SafeLinksExtension(Extension):
+        def extendMarkdown(self, md):
+            md.treeprocessors.register(SafeLinks(md), 'safe_links', 0)
+
+    return SafeLinksExtension()
+
+
+def _converter():
+    """Per-thread Markdown instance (instances are not thread-safe)"""
+    converter = getattr(_local, 'converter', None)
+    if converter is None:
+        import markdown
+        converter = markdown.Markdown(extensions=['toc', 'fenced_code', 'tables', _safe_links_extension()])
+        # Generated text is untrusted: raw HTML is shown escaped instead of being passed through
+        converter.preprocessors.deregister('html_block')
+        converter.inlinePatterns.deregister('html')
+        _local.converter = converter
+    return converter
+
+
+def content_digest(text: str) -> str:
+    return hashlib.sha256(f"{RENDERER_VERSION}\0{text}".encode('utf-8')).hexdigest()
+
+
+def _flatten_toc(tokens: List[Dict], entries: Optional[List[Dict]] = None) -> List[Dict]:
+    entries = [] if entries is None else entries
+    for token in tokens:
+        entries.append({'level': token['level'], 'id': token['id'], 'title': token['name']})
+        _flatten_toc(token.get('children', []), entries)
+    return entries
+
+
+def _render(text: str) -> Dict:
+    converter = _converter()
+    converter.reset()
+    with span('render.markdown'):
+        html = converter.convert(text)
+    sections = [section for section in SECTION_BREAK.split(html) if section.strip()]
+    return {'toc': _flatten_toc(converter.toc_tokens), 'sections': sections}
+
+
+def _cache_path(digest: str, suffix: str, render_dir: Optional[str] = None) -> Path:
+    return Path(render_dir or RENDER_DIR) / f"{digest}{suffix}"
+
+
+def _remember(digest: str, rendered: Dict):
+    with _memory_lock:
+        _memory[digest] = rendered
+        _memory.move_to_end(digest)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def render_markdown(text: str) -> str:
+    """Render markdown once per distinct content and return its digest (see load_rendered)
+
+    The markdown and its rendered sections and table of contents are stored
+    next to each other under the digest, so any worker process can serve them.
+    """
+    global _writes
+    digest = content_digest(text)
+    html_path = _cache_path(digest, '.json')
+    try:
+        # Touched on reuse so eviction keeps what is still being served
+        os.utime(html_path)
+        return digest
+    except OSError:
+        pass
+
+    rendered = load_rendered(digest)
+    if rendered is None:
+        rendered = _render(text)
+        rendered['digest'] = digest
+        _remember(digest, rendered)
+
+    try:
+        html_path.parent.mkdir(parents=True, exist_ok=True)
+        _cache_path(digest, '.md').write_text(text, encoding='utf-8')
+        temp_path = html_path.with_suffix(f'.{os.getpid()}.tmp')
+        temp_path.write_text(json.dumps(rendered), encoding='utf-8')
+        os.replace(temp_path, html_path)
+    except OSError as e:
+        print(f"Could not cache rendered markdown: {str(e)}")
+
+    _writes += 1
+    if _writes % EVICT_EVERY == 0:
+        evict_rendered()
+    return digest
+
+
+def evict_rendered(render_dir: Optional[str] = None, ttl: Optional[float] = None,
+                   max_bytes: Optional[int] = None) -> int:
+    """Remove renderings unused for the TTL, then the oldest ones until the directory fits max_bytes"""
+    root = Path(render_dir or RENDER_DIR)
+    ttl = RENDER_TTL if ttl is None else ttl
+    max_bytes = RENDER_MAX_BYTES if max_bytes is None else max_bytes
+
+    # digest -> (last use, bytes of its .json and .md)
+    entries: Dict[str, List[float]] = {}
+    try:
+        scan = list(os.scandir(root))
+    except OSError:
+        return 0
+    for entry in scan:
+        digest = entry.name.split('.', 1)[0]
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        usage = entries.setdefault(digest, [0.0, 0])
+        usage[0] = max(usage[0], stat.st_mtime)
+        usage[1] += stat.st_size
+
+    cutoff = time.time() - ttl
+    total = sum(size for _, size in entries.values())
+    removed = 0
+    for digest, (last_used, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+        if last_used >= cutoff and total <= max_bytes:
+            break
+        for path in root.glob(f'{digest}.*'):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        with _memory_lock:
+            _memory.pop(digest, None)
+        total -= size
+        removed += 1
+    return removed
+
+
+def load_rendered(digest: str) -> Optional[Dict]:
+    """Cached rendering ({'digest', 'toc', 'sections'}) for a digest, from memory or disk"""
+    with _memory_lock:
+        rendered = _memory.get(digest)
+        if rendered is not None:
+            _memory.move_to_end(digest)
+    if rendered is None:
+        try:
+            rendered = json.loads(_cache_path(digest, '.json').read_text(encoding='utf-8'))
+            _remember(digest, rendered)
+        except (OSError, ValueError):
+            rendered = None
+
+    record_cache('rendered_markdown', rendered is not None)
+    return rendered
+
+
+def render_all(documents: Dict[str, str]) -> Dict[str, str]:
+    """Digest of the rendered HTML for each document"""
+    return {name: render_markdown(text) for name, text in documents.items()}
+
+
+def is_valid_digest(digest: str) -> bool:
+    return bool(re.fullmatch(r'[0-9a-f]{64}', digest or ''))
@@ -0,0 +1,476 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: archiving is not serialized between processes
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+METRIC_HELP = {
+    'docsmith_phase_duration_seconds': ('histogram', 'Duration of instrumented phases'),
+    'docsmith_files_read_total': ('counter', 'Files read from analyzed codebases'),
+    'docsmith_bytes_read_total': ('counter', 'Bytes read from analyzed codebases'),
+    'docsmith_cache_requests_total': ('counter', 'Cache lookups by cache and result'),
+    'docsmith_llm_tokens_total': ('counter', 'LLM tokens reported by the backend'),
+    'docsmith_llm_requests_total': ('counter', 'LLM completions by model'),
+    'docsmith_http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+    'docsmith_workspace_evictions_total': ('counter', 'Workspaces removed by kind'),
+    'docsmith_workspace_bytes': ('gauge', 'Disk used by managed workspaces'),
+    'docsmith_workspaces': ('gauge', 'Number of managed workspaces'),
+    'docsmith_llm_route_duration_seconds': ('histogram', 'LLM call latency by route and model'),
+    'docsmith_llm_cost_usd_total': ('counter', 'Estimated LLM cost in USD by route and model'),
+    'docsmith_llm_hedges_total': ('counter', 'Duplicate LLM requests sent for slow calls'),
+    'docsmith_llm_hedge_wins_total': ('counter', 'Hedged LLM calls by the attempt that answered first'),
+    'docsmith_llm_fallbacks_total': ('counter', 'Timed-out LLM calls answered with partial or empty content'),
+    'docsmith_admission_rejected_total': ('counter', 'Work rejected with 429 because a stage was at capacity'),
+    'docsmith_admission_wait_seconds': ('histogram', 'Time spent waiting for a stage slot'),
+    'docsmith_admission_active': ('gauge', 'Work currently holding a stage slot'),
+    'docsmith_isolated_kills_total': ('counter', 'Isolated processes stopped for exceeding their limits'),
+    'docsmith_upload_bytes_total': ('counter', 'Uploaded bytes by whether they were stored, reused or sent as chunks'),
+    'docsmith_preflight_prompts_total': ('counter', 'Documentation prompts by pre-flight action (send, trim, reject)'),
+    'docsmith_compression_bytes_total': ('counter', 'Response bytes before and after compression by encoding'),
+    'docsmith_singleflight_wait_timeouts_total': ('counter', 'Coalesced followers that stopped waiting and did the work themselves'),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ''
+    rendered = ','.join(
+        '{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in items
+    )
+    return '{' + rendered + '}'
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms rendered in the Prometheus text format"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # Layout: one cumulative count per bucket, then sum, then count
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def get(self, name: str, **labels) -> float:
+        """Current value of a counter series (0 when unset)"""
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def snapshot(self, gauges: bool = False) -> Dict:
+        """Picklable copy of the counters and histograms, and of the gauges if asked (merge ignores them)"""
+        with self._lock:
+            snapshot = {
+                'counters': {name: dict(series) for name, series in self._counters.items()},
+                'histograms': {name: {key: list(state) for key, state in series.items()}
+                               for name, series in self._histograms.items()}
+            }
+            if gauges:
+                snapshot['gauges'] = {name: dict(series) for name, series in self._gauges.items()}
+            return snapshot
+
+    def merge(self, snapshot: Dict):
+        """Add counters and histograms recorded by another process"""
+        with self._lock:
+            for name, series in snapshot.get('counters', {}).items():
+                target = self._counters.setdefault(name, {})
+                for key, value in series.items():
+                    target[key] = target.get(key, 0) + value
+            for name, series in snapshot.get('histograms', {}).items():
+                target = self._histograms.setdefault(name, {})
+                for key, state in series.items():
+                    existing = target.get(key)
+                    if existing is None or len(existing) != len(state):
+                        target[key] = list(state)
+                    else:
+                        for index, value in enumerate(state):
+                            existing[index] += value
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                self._render_header(lines, name, 'counter')
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+            for name in sorted(self._gauges):
+                self._render_header(lines, name, 'gauge')
+                for key, value in sorted(self._gauges[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+            for name in sorted(self._histograms):
+                self._render_header(lines, name, 'histogram')
+                for key, state in sorted(self._histograms[name].items()):
+                    for index, bound in enumerate(self.buckets):
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {state[index]:g}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {state[-1]:g}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {state[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {state[-1]:g}")
+
+        return '\n'.join(lines) + '\n'
+
+    def _render_header(self, lines: List[str], name: str, default_type: str):
+        metric_type, help_text = METRIC_HELP.get(name, (default_type, name.replace('_', ' ')))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def _encode_series(series: Dict[LabelKey, object]) -> List:
+    return [[list(map(list, key)), value] for key, value in series.items()]
+
+
+def _decode_series(items: List) -> Dict[LabelKey, object]:
+    return {tuple(tuple(pair) for pair in key): value for key, value in items}
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsStore:
+    """Sums the metrics of every worker process on the host for /metrics
+
+    Each process writes snapshots of its registry to <directory>/<pid>-<token>.json
+    every flush_interval seconds and when it exits. Collecting merges the live
+    registry with the other processes' files. Counters and histograms of exited
+    workers are folded into archive.json, so totals never go down when workers
+    are recycled. Gauges are per process, so they are reported per live worker
+    with a pid label.
+    """
+
+    def __init__(self, registry: MetricsRegistry, directory: str = 'temp_metrics', flush_interval: float = 5):
+        self.registry = registry
+        self.directory = Path(directory).absolute()
+        self.flush_interval = flush_interval
+        self._token = None
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, registry: MetricsRegistry) -> 'MetricsStore':
+        return cls(
+            registry,
+            directory=os.getenv('DOCSMITH_METRICS_DIR', 'temp_metrics'),
+            flush_interval=float(os.getenv('DOCSMITH_METRICS_FLUSH_INTERVAL', '5'))
+        )
+
+    def _own_path(self) -> Path:
+        # A new token per process, so a recycled pid does not overwrite an exited worker's file
+        pid = os.getpid()
+        if self._token is None or self._token[0] != pid:
+            self._token = (pid, uuid.uuid4().hex[:8])
+        return self.directory / f"{pid}-{self._token[1]}.json"
+
+    def flush(self):
+        """Write this process's metrics for the other workers to collect"""
+        self._write(self._own_path(), self.registry.snapshot(gauges=True))
+
+    def collect(self) -> MetricsRegistry:
+        """A registry with this process's metrics plus those of every other worker, live or exited"""
+        own = self._own_path()
+        combined = MetricsRegistry(self.registry.buckets)
+        snapshot = self.registry.snapshot(gauges=True)
+        combined.merge(snapshot)
+        self._add_gauges(combined, snapshot['gauges'], os.getpid())
+
+        dead = []
+        for path in self.directory.glob('*-*.json'):
+            if path == own:
+                continue
+            payload = self._load(path)
+            if payload is None:
+                continue
+            pid = int(path.name.split('-', 1)[0])
+            if not _process_alive(pid):
+                dead.append(path)
+                continue
+            combined.merge(payload)
+            self._add_gauges(combined, payload['gauges'], pid)
+
+        if dead:
+            self._archive(dead)
+        archive = self._load(self.directory / 'archive.json')
+        if archive is not None:
+            combined.merge(archive)
+        return combined
+
+    def render_prometheus(self) -> str:
+        return self.collect().render_prometheus()
+
+    def _write(self, path: Path, snapshot: Dict):
+        temp_path = path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({kind: {name: _encode_series(series) for name, series in metrics_of_kind.items()}
+                       for kind, metrics_of_kind in snapshot.items()}, f)
+        os.replace(temp_path, path)
+
+    def _load(self, path: Path) -> Optional[Dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return {kind: {name: _decode_series(items) for name, items in payload.get(kind, {}).items()}
+                for kind in ('counters', 'histograms', 'gauges')}
+
+    def _add_gauges(self, combined: MetricsRegistry, gauges: Dict, pid: int):
+        for name, series in gauges.items():
+            for key, value in series.items():
+                combined.set(name, value, pid=pid, **dict(key))
+
+    def _archive(self, paths: List[Path]):
+        """Fold the files of exited processes into archive.json, once even with concurrent scrapes"""
+        lock_file = open(self.directory / 'archive.lock', 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            archive_path = self.directory / 'archive.json'
+            archive = MetricsRegistry(self.registry.buckets)
+            existing = self._load(archive_path)
+            if existing is not None:
+                archive.merge(existing)
+            folded = []
+            for path in paths:
+                # Another scrape may have folded it while we waited for the lock
+                payload = self._load(path)
+                if payload is not None:
+                    archive.merge(payload)
+                    folded.append(path)
+            if not folded:
+                return
+            self._write(archive_path, archive.snapshot())
+            for path in folded:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        finally:
+            lock_file.close()
+
+    def start_flusher(self):
+        """Flush every flush_interval seconds from this process (idempotent, and restarted after a fork)"""
+        if self.flush_interval <= 0 or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Metrics flush failed: {str(e)}")
+
+
+class RequestTrace:
+    """Per-request breakdown of phase timings and counters"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, List[float]] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_phase(self, phase: str, seconds: float):
+        with self._lock:
+            entry = self.phases.get(phase)
+            if entry is None:
+                entry = self.phases[phase] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add(self, counter: str, value: float = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'total_seconds': round(time.perf_counter() - self.started, 6),
+                'phases': {
+                    phase: {'count': int(count), 'seconds': round(seconds, 6)}
+                    for phase, (count, seconds) in self.phases.items()
+                },
+                'counters': dict(self.counters)
+            }
+
+
+metrics = MetricsRegistry()
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('docsmith_trace', default=None)
+
+
+def start_trace() -> RequestTrace:
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def end_trace():
+    _current_trace.set(None)
+
+
+class UsageMeter:
+    """LLM tokens used by the calls made while it is the current meter (see meter_usage)
+
+    Hedged attempts run in copies of the caller's context, so their usage is
+    added to the same meter from other threads.
+    """
+
+    def __init__(self):
+        self.calls: List[Tuple[str, int, int]] = []
+        self._lock = threading.Lock()
+
+    def add(self, model: str, input_tokens: int, output_tokens: int):
+        with self._lock:
+            self.calls.append((model, input_tokens, output_tokens))
+
+    @property
+    def tokens(self) -> int:
+        with self._lock:
+            return sum(input_tokens + output_tokens for _, input_tokens, output_tokens in self.calls)
+
+
+_current_usage: contextvars.ContextVar = contextvars.ContextVar('docsmith_usage', default=None)
+
+
+@contextmanager
+def meter_usage():
+    """Collect the LLM usage of the calls made inside the block"""
+    meter = UsageMeter()
+    token = _current_usage.set(meter)
+    try:
+        yield meter
+    finally:
+        _current_usage.reset(token)
+
+
+def current_usage() -> Optional[UsageMeter]:
+    return _current_usage.get()
+
+
+class span:
+    """Time a phase into the phase histogram and the current request trace
+
+        with span('analyze.structure'):
+            ...
+    """
+
+    __slots__ = ('phase', 'labels', 'start')
+
+    def __init__(self, phase: str, **labels):
+        self.phase = phase
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record_phase(self.phase, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def record_phase(phase: str, seconds: float, **labels):
+    metrics.observe('docsmith_phase_duration_seconds', seconds, phase=phase, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        if labels:
+            phase = phase + '[' + ','.join(f'{key}={value}' for key, value in sorted(labels.items())) + ']'
+        trace.add_phase(phase, seconds)
+
+
+def record_file_read(num_bytes: int):
+    metrics.inc('docsmith_files_read_total')
+    metrics.inc('docsmith_bytes_read_total', num_bytes)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add('files_read')
+        trace.add('bytes_read', num_bytes)
+
+
+def record_cache(cache: str, hit: bool):
+    result = 'hit' if hit else 'miss'
+    metrics.inc('docsmith_cache_requests_total', cache=cache, result=result)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(f'cache.{cache}.{result}')
+
+
+def record_llm_usage(model: str, input_tokens: int, output_tokens: int):
+    metrics.inc('docsmith_llm_requests_total', model=model)
+    metrics.inc('docsmith_llm_tokens_total', input_tokens, model=model, direction='input')
+    metrics.inc('docsmith_llm_tokens_total', output_tokens, model=model, direction='output')
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.add(model, input_tokens, output_tokens)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add('llm_calls')
+        trace.add('llm_input_tokens', input_tokens)
+        trace.add('llm_output_tokens', output_tokens)
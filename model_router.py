@@ -0,0 +1,144 @@
+import os
+import json
+import threading
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from metrics import metrics, current_trace
+
+SMALL_MODEL = "claude-3-5-haiku-20241022"
+LARGE_MODEL = "claude-3-5-sonnet-20241022"
+
+# USD per million (input, output) tokens
+MODEL_PRICES = {
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+    "claude-3-5-sonnet-20241022": (3.00, 15.00),
+}
+
+TIERS = ('free', 'standard', 'pro')
+
+# Per-task model size and output budget. 'auto' picks the small model when the
+# prompt has at most small_task_tokens tokens, with half the output budget.
+DEFAULT_ROUTES = {
+    'explain_chunk': {'model': 'small', 'max_tokens': 1200},
+    'explanation': {'model': 'auto', 'max_tokens': 3000},
+    'explain_synthesis': {'model': 'large', 'max_tokens': 2000},
+    'architecture_overview': {'model': 'large', 'max_tokens': 4000},
+    'developer_guide': {'model': 'large', 'max_tokens': 4000},
+    'api_documentation': {'model': 'large', 'max_tokens': 4000},
+}
+
+# Output budget cap for the free tier, which only uses the small model
+FREE_TIER_MAX_TOKENS = 2000
+
+# Recent calls kept per route for hedging thresholds and pre-flight estimates
+LATENCY_WINDOW = 200
+
+
+class Route(NamedTuple):
+    task: str
+    model: str
+    max_tokens: int
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Cost in USD of one completion (0 for models without a known price)"""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class ModelRouter:
+    """Chooses the model and output budget for each LLM task
+
+    Intermediate work such as chunk summaries and short explanations goes to
+    the small model; final documents and syntheses use the large one. The
+    free tier is served by the small model only and pro never downgrades.
+    """
+
+    def __init__(self, small_model: str = SMALL_MODEL, large_model: str = LARGE_MODEL,
+                 small_task_tokens: int = 1500, routes: Optional[Dict[str, Dict]] = None):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.small_task_tokens = small_task_tokens
+        self.routes = {task: dict(route) for task, route in DEFAULT_ROUTES.items()}
+        for task, route in (routes or {}).items():
+            self.routes.setdefault(task, {'model': 'large', 'max_tokens': 4000}).update(route)
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self._output_tokens: Dict[Tuple[str, str], Deque[int]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'ModelRouter':
+        routes = os.getenv('DOCSMITH_MODEL_ROUTES')
+        return cls(
+            small_model=os.getenv('DOCSMITH_SMALL_MODEL', SMALL_MODEL),
+            large_model=os.getenv('DOCSMITH_LARGE_MODEL', LARGE_MODEL),
+            small_task_tokens=int(os.getenv('DOCSMITH_SMALL_TASK_TOKENS', '1500')),
+            routes=json.loads(routes) if routes else None
+        )
+
+    def route(self, task: str, prompt_tokens: int, tier: str = 'standard') -> Route:
+        config = self.routes.get(task, {'model': 'large', 'max_tokens': 4000})
+        size = config.get('model', 'large')
+        max_tokens = int(config.get('max_tokens', 4000))
+
+        if size == 'auto':
+            if tier == 'pro' or prompt_tokens > self.small_task_tokens:
+                size = 'large'
+            else:
+                size = 'small'
+                max_tokens //= 2
+
+        if tier == 'free':
+            size = 'small'
+            max_tokens = min(max_tokens, FREE_TIER_MAX_TOKENS)
+
+        if size == 'small':
+            model = self.small_model
+        elif size == 'large':
+            model = self.large_model
+        else:
+            # Routes may also name a model directly
+            model = size
+
+        return Route(task, model, max_tokens)
+
+    def record(self, route: Route, seconds: float, input_tokens: int, output_tokens: int):
+        """Record latency and cost for a completed call on this route"""
+        cost = estimate_cost(route.model, input_tokens, output_tokens)
+        metrics.observe('docsmith_llm_route_duration_seconds', seconds, route=route.task, model=route.model)
+        metrics.inc('docsmith_llm_cost_usd_total', cost, route=route.task, model=route.model)
+        with self._lock:
+            window = self._latencies.setdefault((route.task, route.model), deque(maxlen=LATENCY_WINDOW))
+            window.append(seconds)
+            outputs = self._output_tokens.setdefault((route.task, route.model), deque(maxlen=LATENCY_WINDOW))
+            outputs.append(output_tokens)
+
+        trace = current_trace()
+        if trace is not None:
+            trace.add('llm_cost_usd', cost)
+
+    def latency_percentile(self, route: Route, percentile: float, min_samples: int = 20) -> Optional[float]:
+        """Recent latency percentile (0-100) for a route, None until min_samples calls are recorded"""
+        with self._lock:
+            samples = sorted(self._latencies.get((route.task, route.model), ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    def usage_history(self, route: Route) -> Tuple[List[float], List[int]]:
+        """Recent (latencies, output token counts) of a route, oldest first"""
+        with self._lock:
+            key = (route.task, route.model)
+            return list(self._latencies.get(key, ())), list(self._output_tokens.get(key, ()))
+
+
+_router: Optional[ModelRouter] = None
+
+
+def get_router() -> ModelRouter:
+    """Process-wide router configured from the environment on first use"""
+    global _router
+    if _router is None:
+        _router = ModelRouter.from_env()
+    return _router
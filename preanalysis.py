@@ -0,0 +1,130 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, List, Optional
+
+from metrics import metrics, span
+
+
+class AnalysisJob:
+    """A background analysis of one codebase"""
+
+    def __init__(self, key: str, codebase_path: str):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.codebase_path = codebase_path
+        self.submitted = time.time()
+        self.finished: Optional[float] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def state(self) -> str:
+        if self.future is None or not self.future.done():
+            return 'running'
+        return 'failed' if self.future.exception() is not None else 'done'
+
+    def result(self, timeout: Optional[float] = None) -> Dict:
+        """Wait for the prepared analysis (re-raises the job's error)"""
+        return self.future.result(timeout)
+
+    def status(self) -> Dict:
+        state = self.state
+        status = {'job_id': self.id, 'state': state}
+
+        if state == 'done':
+            prepared = self.future.result()
+            status['project_summary'] = prepared['project_summary']
+            status['prompt_tokens'] = prepared['prompt_tokens']
+            status['seconds'] = round(self.finished - self.submitted, 3)
+        elif state == 'failed':
+            status['error'] = str(self.future.exception())
+
+        return status
+
+
+class PreAnalysisPool:
+    """Starts analysis, prompt building and token estimation as soon as a codebase is ingested
+
+    /generate-docs then attaches to the running or finished job instead of
+    paying for the whole analysis itself. Jobs are deduplicated by key (the
+    workspace id or local path) and only the most recent max_jobs are kept.
+    """
+
+    def __init__(self, prepare: Callable[[str], Dict], max_workers: int = 2, max_jobs: int = 32):
+        self._prepare = prepare
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='preanalysis')
+        self._jobs: 'OrderedDict[str, AnalysisJob]' = OrderedDict()
+        self._by_key: Dict[str, str] = {}
+        self._max_jobs = max_jobs
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prepare: Callable[[str], Dict]) -> 'PreAnalysisPool':
+        return cls(
+            prepare,
+            max_workers=int(os.getenv('DOCSMITH_PREANALYSIS_WORKERS', '2')),
+            max_jobs=int(os.getenv('DOCSMITH_PREANALYSIS_MAX_JOBS', '32'))
+        )
+
+    def submit(self, key: str, codebase_path: str, on_finish: Optional[Callable[[], None]] = None,
+               reuse_finished: bool = True) -> AnalysisJob:
+        """Start analyzing a codebase, or return the job already running (or done) for its key
+
+        Pass reuse_finished=False for directories that can change between
+        submissions (local paths); only a job still running is joined then.
+        """
+        with self._lock:
+            existing = self._jobs.get(self._by_key.get(key, ''))
+            reusable = ('running', 'done') if reuse_finished else ('running',)
+            if existing is not None and existing.codebase_path == codebase_path and existing.state in reusable:
+                self._jobs.move_to_end(existing.id)
+                if on_finish:
+                    on_finish()
+                return existing
+
+            job = AnalysisJob(key, codebase_path)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            self._trim()
+            job.future = self._executor.submit(self._run, job, on_finish)
+
+        metrics.inc('docsmith_preanalysis_jobs_total')
+        return job
+
+    def get(self, job_id: Optional[str]) -> Optional[AnalysisJob]:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queued(self) -> int:
+        """Jobs submitted but not yet picked up by a worker"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return sum(1 for job in jobs if job.future is not None and not job.future.running() and not job.future.done())
+
+    def jobs(self) -> List[Dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [{'job_id': job.id, 'key': job.key, 'state': job.state} for job in jobs]
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: AnalysisJob, on_finish: Optional[Callable[[], None]]) -> Dict:
+        try:
+            with span('preanalysis.run'):
+                return self._prepare(job.codebase_path)
+        finally:
+            job.finished = time.time()
+            if on_finish:
+                on_finish()
+
+    def _trim(self):
+        while len(self._jobs) > self._max_jobs:
+            job_id, job = self._jobs.popitem(last=False)
+            if self._by_key.get(job.key) == job_id:
+                del self._by_key[job.key]
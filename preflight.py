@@ -0,0 +1,288 @@
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from statistics import median
+from typing import Callable, Dict, List, Optional
+
+from code_analyzer import count_tokens, truncate_to_tokens
+from metrics import metrics
+from model_router import ModelRouter, Route, estimate_cost
+
+# Prompts are cut before their closing instructions so the request itself survives trimming
+INSTRUCTIONS_MARKER = "\n        Please provide:"
+
+TRIM_NOTE = "\n        [... {tokens} tokens of codebase context omitted to fit the token budget ...]\n"
+
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tenant_spend (
+    tenant TEXT NOT NULL,
+    day TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    cost_usd REAL NOT NULL,
+    PRIMARY KEY (tenant, day)
+) WITHOUT ROWID
+"""
+
+# Used until a route has enough recorded calls
+DEFAULT_OUTPUT_FRACTION = 0.5
+MIN_HISTORY = 5
+
+
+class PreflightPlanner:
+    """Forecasts tokens, latency and cost of documentation prompts and enforces budgets
+
+    Input tokens are counted on the rendered prompt. Output tokens and latency
+    come from the route's recent calls (median output tokens, median seconds
+    per output token), or from defaults until enough calls are recorded.
+    Prompts above the per-prompt limit, or above what is left of the request
+    or tenant budget, are trimmed; if less than min_trimmed_tokens would be
+    left, the doc type is rejected instead.
+    """
+
+    def __init__(self, router: ModelRouter, max_prompt_tokens: int = 100000, request_tokens: int = 0,
+                 request_cost: float = 0.0, tokens_per_second: float = 50.0, min_trimmed_tokens: int = 1000):
+        self.router = router
+        self.max_prompt_tokens = max_prompt_tokens
+        self.request_tokens = request_tokens
+        self.request_cost = request_cost
+        self.tokens_per_second = tokens_per_second
+        self.min_trimmed_tokens = min_trimmed_tokens
+
+    @classmethod
+    def from_env(cls, router: ModelRouter) -> 'PreflightPlanner':
+        return cls(
+            router,
+            max_prompt_tokens=int(os.getenv('DOCSMITH_MAX_PROMPT_TOKENS', '100000')),
+            request_tokens=int(os.getenv('DOCSMITH_REQUEST_TOKEN_BUDGET', '0')),
+            request_cost=float(os.getenv('DOCSMITH_REQUEST_COST_BUDGET', '0')),
+            tokens_per_second=float(os.getenv('DOCSMITH_PREFLIGHT_TOKENS_PER_SECOND', '50')),
+            min_trimmed_tokens=int(os.getenv('DOCSMITH_MIN_TRIMMED_PROMPT_TOKENS', '1000'))
+        )
+
+    def estimate(self, route: Route, input_tokens: int) -> Dict:
+        """Expected output tokens, latency and cost of one call on a route"""
+        latencies, outputs = self.router.usage_history(route)
+        if len(outputs) >= MIN_HISTORY:
+            output_tokens = min(route.max_tokens, int(median(outputs)))
+            per_token = [seconds / max(1, tokens) for seconds, tokens in zip(latencies, outputs)]
+            seconds = median(per_token) * output_tokens
+            source = 'history'
+        else:
+            output_tokens = int(route.max_tokens * DEFAULT_OUTPUT_FRACTION)
+            seconds = output_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+            source = 'default'
+
+        return {
+            'model': route.model,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'max_output_tokens': route.max_tokens,
+            'latency_seconds': round(seconds, 2),
+            'cost_usd': round(estimate_cost(route.model, input_tokens, output_tokens), 6),
+            'max_cost_usd': round(estimate_cost(route.model, input_tokens, route.max_tokens), 6),
+            'estimate_source': source
+        }
+
+    def plan(self, prompts: Dict[str, str], doc_types: List[str], route_for: Callable[[str, str], Route],
+             tenant_remaining: Optional[Dict] = None) -> Dict:
+        """Decide, in order, which doc types to send and with which (possibly trimmed) prompt
+
+        Returns {'doc_types', 'prompts', 'sections', 'totals'}; each section has
+        an 'action' of 'send', 'trim' or 'reject' (with a 'reason').
+        """
+        tenant_remaining = tenant_remaining or {}
+        tokens_left = _smallest(self.request_tokens or None, tenant_remaining.get('tokens'))
+        cost_left = _smallest(self.request_cost or None, tenant_remaining.get('cost_usd'))
+
+        accepted, planned_prompts, sections = [], {}, {}
+        totals = {'input_tokens': 0, 'output_tokens': 0, 'latency_seconds': 0.0, 'cost_usd': 0.0, 'max_cost_usd': 0.0}
+
+        for doc_type in doc_types:
+            prompt = prompts.get(doc_type)
+            if prompt is None:
+                continue
+
+            input_tokens = count_tokens(prompt)
+            route = route_for(doc_type, prompt)
+            expected = self.estimate(route, 0)
+            # Budgets must also cover the expected output
+            limit = self.max_prompt_tokens
+            if tokens_left is not None:
+                limit = min(limit, tokens_left - expected['output_tokens'])
+            if cost_left is not None:
+                limit = min(limit, self._tokens_affordable(route, cost_left - expected['cost_usd']))
+
+            action, reason = 'send', None
+            if input_tokens > limit:
+                if limit < self.min_trimmed_tokens:
+                    sections[doc_type] = {
+                        **self.estimate(route, input_tokens),
+                        'action': 'reject',
+                        'reason': 'over the remaining token or cost budget'
+                    }
+                    metrics.inc('docsmith_preflight_prompts_total', action='reject', doc_type=doc_type)
+                    continue
+                prompt = trim_prompt(prompt, limit)
+                input_tokens = count_tokens(prompt)
+                action, reason = 'trim', f'trimmed to {limit} input tokens'
+
+            section = self.estimate(route_for(doc_type, prompt), input_tokens)
+            section['action'] = action
+            if reason:
+                section['reason'] = reason
+            sections[doc_type] = section
+            metrics.inc('docsmith_preflight_prompts_total', action=action, doc_type=doc_type)
+
+            accepted.append(doc_type)
+            planned_prompts[doc_type] = prompt
+            for key in totals:
+                totals[key] += section[key]
+            if tokens_left is not None:
+                tokens_left -= input_tokens + section['output_tokens']
+            if cost_left is not None:
+                cost_left -= section['cost_usd']
+
+        totals['latency_seconds'] = round(totals['latency_seconds'], 2)
+        totals['cost_usd'] = round(totals['cost_usd'], 6)
+        totals['max_cost_usd'] = round(totals['max_cost_usd'], 6)
+        return {'doc_types': accepted, 'prompts': planned_prompts, 'sections': sections, 'totals': totals}
+
+    def _tokens_affordable(self, route: Route, cost_left: float) -> int:
+        """Input tokens that cost_left pays for on a route"""
+        per_token = estimate_cost(route.model, 1_000_000, 0) / 1_000_000
+        if per_token <= 0:
+            return self.max_prompt_tokens
+        return max(0, int(cost_left / per_token))
+
+
+def _smallest(*values):
+    present = [value for value in values if value is not None]
+    return min(present) if present else None
+
+
+def trim_prompt(prompt: str, max_tokens: int) -> str:
+    """Cut codebase context from the middle of a prompt, keeping its closing instructions"""
+    split = prompt.rfind(INSTRUCTIONS_MARKER)
+    if split < 0:
+        return truncate_to_tokens(prompt, max_tokens)
+
+    context, instructions = prompt[:split], prompt[split:]
+    omitted = count_tokens(prompt) - max_tokens
+    note = TRIM_NOTE.format(tokens=omitted)
+    budget = max(0, max_tokens - count_tokens(instructions) - count_tokens(note))
+    while True:
+        trimmed = truncate_to_tokens(context, budget) + note + instructions
+        # Tokens can merge across the joins, so the parts may not add up exactly
+        excess = count_tokens(trimmed) - max_tokens
+        if excess <= 0 or budget == 0:
+            return trimmed
+        budget = max(0, budget - excess)
+
+
+class TenantLedger:
+    """Daily token and cost spending per tenant, shared by worker processes through SQLite
+
+    Requests reserve their forecast before generating. The check and the
+    update run in one write transaction, so concurrent requests (in any
+    worker) cannot together reserve more than the budget. Each section's
+    reservation is then settled against the tokens its LLM calls used.
+    """
+
+    def __init__(self, daily_tokens: int = 0, daily_cost: float = 0.0, path: str = 'temp_ledger/tenants.sqlite3'):
+        self.daily_tokens = daily_tokens
+        self.daily_cost = daily_cost
+        self.path = str(Path(path).absolute())
+        self._local = threading.local()
+        if self.enabled:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with self._connection() as connection:
+                connection.execute(LEDGER_SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> 'TenantLedger':
+        return cls(
+            daily_tokens=int(os.getenv('DOCSMITH_TENANT_DAILY_TOKENS', '0')),
+            daily_cost=float(os.getenv('DOCSMITH_TENANT_DAILY_COST', '0')),
+            path=os.getenv('DOCSMITH_TENANT_LEDGER', 'temp_ledger/tenants.sqlite3')
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.daily_tokens or self.daily_cost)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Transactions are managed explicitly (BEGIN IMMEDIATE)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def _spent(self, connection: sqlite3.Connection, tenant: str, day: str):
+        row = connection.execute(
+            'SELECT tokens, cost_usd FROM tenant_spend WHERE tenant = ? AND day = ?', (tenant, day)
+        ).fetchone()
+        return row if row is not None else (0, 0.0)
+
+    def _remaining(self, tokens: int, cost: float) -> Dict:
+        return {
+            'tokens': max(0, self.daily_tokens - tokens) if self.daily_tokens else None,
+            'cost_usd': max(0.0, self.daily_cost - cost) if self.daily_cost else None
+        }
+
+    def remaining(self, tenant: str) -> Dict:
+        """Tokens and USD left today; None where there is no limit"""
+        if not self.enabled:
+            return self._remaining(0, 0.0)
+        return self._remaining(*self._spent(self._connection(), tenant, _today()))
+
+    def reserve(self, tenant: str, tokens: int, cost: float) -> bool:
+        """Add a forecast to today's spending if it fits what is left; False (and nothing added) otherwise"""
+        if not self.enabled:
+            return True
+        day = _today()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            spent_tokens, spent_cost = self._spent(connection, tenant, day)
+            fits = (not self.daily_tokens or spent_tokens + tokens <= self.daily_tokens) and \
+                   (not self.daily_cost or spent_cost + cost <= self.daily_cost + 1e-9)
+            if fits:
+                connection.execute(
+                    'INSERT INTO tenant_spend (tenant, day, tokens, cost_usd) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (tenant, day) DO UPDATE SET tokens = tokens + excluded.tokens, '
+                    'cost_usd = cost_usd + excluded.cost_usd',
+                    (tenant, day, tokens, cost)
+                )
+                connection.execute('DELETE FROM tenant_spend WHERE day < ?', (day,))
+            connection.execute('COMMIT')
+            return fits
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def settle(self, tenant: str, reserved_tokens: int, reserved_cost: float, used_tokens: int, used_cost: float):
+        """Replace a reservation with what was actually used
+
+        The unused part is refunded and an overrun is charged even past the
+        budget, since the tokens were already spent.
+        """
+        if not self.enabled:
+            return
+        tokens, cost = used_tokens - reserved_tokens, used_cost - reserved_cost
+        if not tokens and abs(cost) < 1e-12:
+            return
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT INTO tenant_spend (tenant, day, tokens, cost_usd) VALUES (?, ?, MAX(0, ?), MAX(0, ?)) '
+                'ON CONFLICT (tenant, day) DO UPDATE SET tokens = MAX(0, tokens + ?), '
+                'cost_usd = MAX(0, cost_usd + ?)',
+                (tenant, _today(), tokens, cost, tokens, cost)
+            )
+
+
+def _today() -> str:
+    return time.strftime('%Y-%m-%d', time.gmtime())
@@ -0,0 +1,39 @@
+"""
+Warm up heavy dependencies once, before worker processes are forked
+
+With a pre-forking server (e.g. gunicorn --preload) the tiktoken encoding,
+the imported modules and the LLM client are created in the master process
+and shared copy-on-write by every worker instead of being loaded per worker.
+"""
+
+import os
+import time
+from typing import Dict
+
+
+def preload() -> Dict[str, float]:
+    """Load the tokenizer, lazily imported libraries and the LLM client; returns seconds per step"""
+    timings = {}
+
+    started = time.perf_counter()
+    from code_analyzer import get_token_encoding
+    get_token_encoding()
+    timings['tiktoken'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    import chardet  # noqa: F401
+    import git  # noqa: F401
+    timings['imports'] = time.perf_counter() - started
+
+    # The Anthropic client needs a key; the stub backend is cheap either way
+    if os.getenv('ANTHROPIC_API_KEY') or os.getenv('DOCSMITH_LLM_BACKEND', '').lower() == 'stub':
+        started = time.perf_counter()
+        from llm_backends import shared_backend
+        shared_backend()
+        timings['llm_backend'] = time.perf_counter() - started
+
+    return timings
+
+
+def preload_requested() -> bool:
+    return os.getenv('DOCSMITH_PRELOAD', '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Opt-in cProfile capture for analysis and generation runs
+
+Profiles are saved as <run_id>.prof (loadable with pstats/snakeviz) next to a
+<run_id>.json metadata file in DOCSMITH_PROFILE_DIR.
+
+    python3 profiling.py /path/to/repo --top 30
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROFILE_DIR = os.getenv('DOCSMITH_PROFILE_DIR', 'temp_profiles')
+
+SORT_KEYS = {'cumulative', 'tottime', 'calls'}
+
+_RUN_ID_PATTERN = re.compile(r'^[a-f0-9]{8,32}$')
+
+# cProfile cannot have two profilers active at once
+_profiler_lock = threading.Lock()
+
+
+class ProfileRun:
+    """Wrap a block in cProfile and save the artifact keyed by run id
+
+        with ProfileRun('generate-docs') as run:
+            ...
+        run.run_id  # None if another profile was already active
+    """
+
+    def __init__(self, label: str, profile_dir: Optional[str] = None, metadata: Optional[Dict] = None):
+        self.label = label
+        self.profile_dir = Path(profile_dir or PROFILE_DIR)
+        self.metadata = metadata or {}
+        self.run_id: Optional[str] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._started = 0.0
+
+    def __enter__(self):
+        if not _profiler_lock.acquire(blocking=False):
+            print(f"Profiling skipped for {self.label}: another profile is in progress")
+            return self
+
+        self.run_id = uuid.uuid4().hex[:16]
+        self._profiler = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler is None:
+            return False
+
+        try:
+            self._profiler.disable()
+            duration = time.perf_counter() - self._started
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            self._profiler.dump_stats(str(self.profile_dir / f"{self.run_id}.prof"))
+
+            metadata = {
+                'run_id': self.run_id,
+                'label': self.label,
+                'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'duration_seconds': round(duration, 6),
+                'failed': exc_type is not None,
+                **self.metadata
+            }
+            with open(self.profile_dir / f"{self.run_id}.json", 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, indent=2)
+        finally:
+            self._profiler = None
+            _profiler_lock.release()
+
+        return False
+
+
+def is_valid_run_id(run_id: str) -> bool:
+    return bool(_RUN_ID_PATTERN.match(run_id or ''))
+
+
+def profile_path(run_id: str, profile_dir: Optional[str] = None) -> Optional[Path]:
+    """Location of a saved profile, or None if the id is malformed or unknown"""
+    if not is_valid_run_id(run_id):
+        return None
+    path = Path(profile_dir or PROFILE_DIR) / f"{run_id}.prof"
+    return path if path.exists() else None
+
+
+def list_profiles(profile_dir: Optional[str] = None) -> List[Dict]:
+    """Metadata of all saved profiles, newest first"""
+    directory = Path(profile_dir or PROFILE_DIR)
+    if not directory.exists():
+        return []
+
+    profiles = []
+    for meta_path in directory.glob('*.json'):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                profiles.append(json.load(f))
+        except (json.JSONDecodeError, IOError):
+            continue
+
+    profiles.sort(key=lambda item: item.get('created', ''), reverse=True)
+    return profiles
+
+
+def profile_summary(run_id: str, top: int = 20, sort: str = 'cumulative',
+                    profile_dir: Optional[str] = None) -> Optional[Dict]:
+    """Top-N hot functions of a saved profile"""
+    path = profile_path(run_id, profile_dir)
+    if path is None:
+        return None
+
+    if sort not in SORT_KEYS:
+        sort = 'cumulative'
+
+    stats = pstats.Stats(str(path))
+    rows = []
+    for (filename, line, function), (calls, primitive_calls, total_time, cumulative_time, _) in stats.stats.items():
+        rows.append({
+            'function': function,
+            'file': filename,
+            'line': line,
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'total_time': round(total_time, 6),
+            'cumulative_time': round(cumulative_time, 6)
+        })
+
+    sort_field = {'cumulative': 'cumulative_time', 'tottime': 'total_time', 'calls': 'calls'}[sort]
+    rows.sort(key=lambda row: row[sort_field], reverse=True)
+
+    metadata = {}
+    meta_path = path.with_suffix('.json')
+    if meta_path.exists():
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+
+    return {
+        'run_id': run_id,
+        'metadata': metadata,
+        'total_time': round(stats.total_tt, 6),
+        'sort': sort,
+        'functions': rows[:max(1, top)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile a DocSmith analysis run')
+    parser.add_argument('path', help='Codebase directory to analyze')
+    parser.add_argument('--top', type=int, default=25, help='Number of hot functions to print')
+    parser.add_argument('--sort', default='cumulative', choices=sorted(SORT_KEYS))
+    parser.add_argument('--profile-dir', default=None, help='Where to save the profile artifact')
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).parent.absolute()))
+    from code_analyzer import CodebaseAnalyzer
+
+    with ProfileRun('cli-analyze', args.profile_dir, {'path': args.path}) as run:
+        CodebaseAnalyzer().analyze_codebase(args.path)
+
+    summary = profile_summary(run.run_id, args.top, args.sort, args.profile_dir)
+    print(f"Profile {run.run_id} ({summary['total_time']:.3f}s total)")
+    print(f"{'cumulative':>12} {'tottime':>10} {'calls':>9}  function")
+    for row in summary['functions']:
+        print(f"{row['cumulative_time']:>12.4f} {row['total_time']:>10.4f} {row['calls']:>9}  "
+              f"{row['function']} ({os.path.basename(row['file'])}:{row['line']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import os
+import re
+import math
+import time
+import random
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from metrics import span
+
+# Two-sided 95% normal quantile for the confidence intervals
+Z_95 = 1.96
+
+# File names whose technologies do not follow from their extension alone
+MANIFEST_FILES = {'package.json', 'requirements.txt', 'Cargo.toml', 'go.mod', 'pom.xml'}
+
+
+class _Stratum:
+    """Files of one language and the line/token counts of the sampled ones"""
+
+    def __init__(self, language: str):
+        self.language = language
+        self.paths: List[str] = []
+        self.order: List[int] = []
+        self.lines: List[int] = []
+        self.tokens: List[int] = []
+
+    @property
+    def sampled(self) -> int:
+        return len(self.lines)
+
+
+def _mean_variance(values: List[int]) -> Tuple[float, Optional[float]]:
+    if not values:
+        return 0.0, None
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, None
+    return mean, sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+
+
+class ProjectPreviewer:
+    """Estimates a project summary from a stratified sample of files within a time budget
+
+    Paths are enumerated without reading files, so file counts and technologies
+    are exact (unless enumeration itself runs out of time). Lines and tokens
+    are extrapolated per language from a random sample of that language's
+    files, taken round-robin across languages until the budget is spent, and
+    reported with 95% confidence intervals.
+    """
+
+    def __init__(self, analyzer, budget_seconds: float = 0.5, samples_per_language: int = 30):
+        self.analyzer = analyzer
+        self.budget_seconds = budget_seconds
+        self.samples_per_language = samples_per_language
+
+    @classmethod
+    def from_env(cls, analyzer) -> 'ProjectPreviewer':
+        return cls(
+            analyzer,
+            budget_seconds=float(os.getenv('DOCSMITH_PREVIEW_BUDGET_MS', '500')) / 1000,
+            samples_per_language=int(os.getenv('DOCSMITH_PREVIEW_SAMPLES', '30'))
+        )
+
+    def preview(self, path: str) -> Dict:
+        started = time.monotonic()
+        stop_at = started + self.budget_seconds
+
+        with span('preview.enumerate'):
+            # Leave at least a third of the budget for sampling
+            strata, total_files, technologies, complete = self._enumerate(
+                Path(path), started + self.budget_seconds * 2 / 3
+            )
+        with span('preview.sample'):
+            self._sample(strata, stop_at, zlib.crc32(str(path).encode('utf-8')))
+
+        lines, lines_margin, lines_by_language = self._extrapolate(strata, 'lines')
+        tokens, tokens_margin, _ = self._extrapolate(strata, 'tokens')
+
+        return {
+            'total_files': total_files,
+            'total_lines': lines,
+            'total_lines_interval': [max(0, lines - lines_margin), lines + lines_margin],
+            'estimated_tokens': tokens,
+            'estimated_tokens_interval': [max(0, tokens - tokens_margin), tokens + tokens_margin],
+            'lines_by_language': lines_by_language,
+            'technologies': sorted(technologies),
+            'sampled_files': sum(stratum.sampled for stratum in strata.values()),
+            'enumeration_complete': complete,
+            'seconds': round(time.monotonic() - started, 3)
+        }
+
+    def _enumerate(self, root: Path, stop_at: float) -> Tuple[Dict[str, _Stratum], int, set, bool]:
+        """Group supported files by language, counting every file the full analysis would count"""
+        strata: Dict[str, _Stratum] = {}
+        technologies = set()
+        total_files = 0
+        stack = [str(root)]
+
+        # Same matching as the analyzer's _should_ignore, in one regex search per name
+        ignored = re.compile('|'.join(re.escape(pattern) for pattern in self.analyzer.ignore_patterns))
+        supported = self.analyzer.supported_extensions
+        # Only a few file names look inside the file; everything else depends on the extension
+        technologies_by_extension: Dict[str, List[str]] = {}
+
+        while stack:
+            if time.monotonic() > stop_at:
+                return strata, total_files, technologies, False
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+
+            for entry in entries:
+                name = entry.name
+                if ignored.search(name):
+                    continue
+                try:
+                    if entry.is_dir():
+                        # Like os.walk, symlinked directories are not descended into
+                        if not entry.is_symlink():
+                            stack.append(entry.path)
+                        continue
+                except OSError:
+                    continue
+
+                total_files += 1
+                dot = name.rfind('.')
+                extension = name[dot:].lower() if dot > 0 else ''
+
+                if name in MANIFEST_FILES:
+                    technologies.update(self.analyzer._file_technologies(name, entry.path))
+                elif extension not in technologies_by_extension:
+                    found = self.analyzer._file_technologies(name, entry.path)
+                    technologies_by_extension[extension] = found
+                    technologies.update(found)
+
+                language = supported.get(extension)
+                if language is not None:
+                    stratum = strata.get(language)
+                    if stratum is None:
+                        stratum = strata[language] = _Stratum(language)
+                    stratum.paths.append(entry.path)
+
+        return strata, total_files, technologies, True
+
+    def _sample(self, strata: Dict[str, _Stratum], stop_at: float, seed: int):
+        """Scan sampled files round-robin across languages until each has enough or time is up"""
+        rng = random.Random(seed)
+        for stratum in strata.values():
+            count = min(len(stratum.paths), self.samples_per_language)
+            stratum.order = rng.sample(range(len(stratum.paths)), count)
+
+        active = [stratum for stratum in strata.values() if stratum.order]
+        while active and time.monotonic() < stop_at:
+            for stratum in list(active):
+                index = stratum.order[stratum.sampled]
+                file_stats = self.analyzer._file_stats(Path(stratum.paths[index]), stratum.language)
+                # Empty, unreadable and oversized files count as zero, as in the full analysis
+                stratum.lines.append(file_stats.lines if file_stats else 0)
+                stratum.tokens.append(file_stats.tokens if file_stats else 0)
+                if stratum.sampled >= len(stratum.order):
+                    active.remove(stratum)
+                if time.monotonic() >= stop_at:
+                    break
+
+    def _extrapolate(self, strata: Dict[str, _Stratum], field: str) -> Tuple[int, int, Dict[str, int]]:
+        """Stratified estimate of a total and its 95% margin of error
+
+        Each language's total is its file count times its sample mean, with the
+        finite population correction. Languages sampled fewer than twice borrow
+        the pooled mean or variance of all samples.
+        """
+        pooled_mean, pooled_variance = _mean_variance(
+            [value for stratum in strata.values() for value in getattr(stratum, field)]
+        )
+
+        total = 0.0
+        variance = 0.0
+        by_language = {}
+        for stratum in strata.values():
+            population = len(stratum.paths)
+            sample = getattr(stratum, field)
+            mean, sample_variance = _mean_variance(sample)
+            if not sample:
+                mean = pooled_mean
+            if sample_variance is None:
+                sample_variance = pooled_variance or 0.0
+
+            estimate = population * mean
+            by_language[stratum.language] = int(round(estimate))
+            total += estimate
+
+            sampled = max(len(sample), 1)
+            correction = (population - len(sample)) / population if population else 0.0
+            variance += population ** 2 * correction * sample_variance / sampled
+
+        ordered = dict(sorted(by_language.items(), key=lambda item: item[1], reverse=True))
+        return int(round(total)), int(math.ceil(Z_95 * math.sqrt(variance))), ordered
@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from metrics import record_cache
+
+ARCHIVE_NAME = 'documentation.zip'
+MANIFEST_NAME = 'manifest.json'
+
+DOC_TYPE_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+RESULT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class _ChunkBuffer:
+    """Write-only file object whose contents are drained after each write burst"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ResultStore:
+    """Generated documentation stored on disk, one directory per result id
+
+    Each result holds <doc_type>.md files and a manifest with their SHA-256
+    hashes, which are used as strong ETags. The ZIP of all documents is built
+    on first download and kept next to them, so repeat downloads are served
+    straight from disk.
+    """
+
+    def __init__(self, root: str = 'temp_results', ttl: float = 86400, stream_threshold: int = 32 * 1024 * 1024):
+        self.root = Path(root).absolute()
+        self.ttl = ttl
+        self.stream_threshold = stream_threshold
+        self._saves = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> 'ResultStore':
+        return cls(
+            root=os.getenv('DOCSMITH_RESULT_DIR', 'temp_results'),
+            ttl=float(os.getenv('DOCSMITH_RESULT_TTL', '86400')),
+            stream_threshold=int(float(os.getenv('DOCSMITH_ZIP_STREAM_THRESHOLD_MB', '32')) * 1024 * 1024)
+        )
+
+    def save(self, documentation: Dict[str, str], project_summary: Optional[Dict] = None) -> str:
+        """Store documents and return the new result id"""
+        result_id = uuid.uuid4().hex
+        temp_dir = self.root / f".{result_id}.tmp"
+        temp_dir.mkdir(parents=True)
+
+        documents = {}
+        try:
+            for doc_type, content in documentation.items():
+                if not DOC_TYPE_PATTERN.match(doc_type):
+                    continue
+                data = content.encode('utf-8')
+                (temp_dir / f"{doc_type}.md").write_bytes(data)
+                documents[doc_type] = {'sha256': hashlib.sha256(data).hexdigest(), 'size': len(data)}
+
+            manifest = {
+                'result_id': result_id,
+                'created': time.time(),
+                'documents': documents,
+                'project_summary': project_summary
+            }
+            (temp_dir / MANIFEST_NAME).write_text(json.dumps(manifest), encoding='utf-8')
+            os.replace(temp_dir, self.root / result_id)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        self._saves += 1
+        if self._saves % 50 == 0:
+            self.evict_expired()
+        return result_id
+
+    def manifest(self, result_id: Optional[str]) -> Optional[Dict]:
+        if not result_id or not RESULT_ID_PATTERN.match(result_id):
+            return None
+        try:
+            with open(self.root / result_id / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, result_id: Optional[str]) -> Optional[Dict[str, str]]:
+        """All documents of a result as {doc_type: markdown}"""
+        manifest = self.manifest(result_id)
+        if manifest is None:
+            return None
+        return {
+            doc_type: (self.root / result_id / f"{doc_type}.md").read_text(encoding='utf-8')
+            for doc_type in manifest['documents']
+        }
+
+    def document_path(self, result_id: str, doc_type: str) -> Path:
+        return self.root / result_id / f"{doc_type}.md"
+
+    def archive_etag(self, manifest: Dict) -> str:
+        """Strong ETag for the ZIP, derived from the hashes of its documents"""
+        digest = hashlib.sha256()
+        for doc_type, document in sorted(manifest['documents'].items()):
+            digest.update(f"{doc_type}:{document['sha256']}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def archive_path(self, result_id: str) -> Path:
+        return self.root / result_id / ARCHIVE_NAME
+
+    def cached_archive(self, result_id: str) -> Optional[Path]:
+        path = self.archive_path(result_id)
+        exists = path.exists()
+        record_cache('result_archive', exists)
+        return path if exists else None
+
+    def should_stream(self, manifest: Dict) -> bool:
+        return sum(document['size'] for document in manifest['documents'].values()) >= self.stream_threshold
+
+    def build_archive(self, result_id: str) -> Path:
+        """Write the ZIP for a result once and return its path"""
+        for _ in self.stream_archive(result_id):
+            pass
+        return self.archive_path(result_id)
+
+    def stream_archive(self, result_id: str) -> Iterator[bytes]:
+        """Yield the ZIP as it is compressed, saving it for later downloads once complete
+
+        Only one document is held in memory at a time. If the client goes away
+        before the end, the partial archive is discarded.
+        """
+        manifest = self.manifest(result_id)
+        archive_path = self.archive_path(result_id)
+        temp_path = archive_path.with_suffix(f'.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp')
+
+        buffer = _ChunkBuffer()
+        completed = False
+        try:
+            with open(temp_path, 'wb') as cache_file:
+                with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    for doc_type in manifest['documents']:
+                        with open(self.document_path(result_id, doc_type), 'rb') as f:
+                            archive.writestr(f"{doc_type}.md", f.read())
+                        chunk = buffer.drain()
+                        cache_file.write(chunk)
+                        yield chunk
+                # The central directory is written when the archive is closed
+                chunk = buffer.drain()
+                cache_file.write(chunk)
+                yield chunk
+            os.replace(temp_path, archive_path)
+            completed = True
+        finally:
+            if not completed:
+                try:
+                    temp_path.unlink()
+                except OSError:
+                    pass
+
+    def evict_expired(self) -> int:
+        """Remove results older than the TTL"""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for entry in os.scandir(self.root):
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
@@ -0,0 +1,248 @@
+import os
+import re
+import math
+import time
+import heapq
+import pickle
+import hashlib
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from metrics import span
+
+INDEX_DIR = os.getenv('DOCSMITH_INDEX_DIR', 'temp_indexes')
+
+# Languages whose files are indexed; data and prose formats only add noise
+INDEXED_LANGUAGES = {
+    'python', 'javascript', 'typescript', 'react', 'react-typescript', 'java', 'cpp', 'c',
+    'csharp', 'php', 'ruby', 'go', 'rust', 'swift', 'kotlin', 'scala', 'shell', 'sql'
+}
+
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]{1,63}')
+SUBWORD = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+
+DEFINITION = re.compile(
+    r'^[ \t]*(?:export[ \t]+|pub[ \t]+|async[ \t]+|public[ \t]+|private[ \t]+|protected[ \t]+|static[ \t]+)*'
+    r'(?:def|class|function|func|fn|interface|struct|impl|enum|trait|module|type)\b',
+    re.MULTILINE
+)
+
+STOPWORDS = {
+    'self', 'this', 'the', 'and', 'or', 'not', 'if', 'else', 'elif', 'for', 'while', 'in', 'of',
+    'to', 'is', 'as', 'return', 'def', 'class', 'function', 'func', 'fn', 'import', 'from',
+    'const', 'let', 'var', 'new', 'none', 'null', 'nil', 'true', 'false', 'public', 'private',
+    'protected', 'static', 'void', 'int', 'str', 'string', 'bool', 'async', 'await', 'export',
+    'package', 'pub', 'try', 'except', 'catch', 'finally', 'with', 'pass', 'break', 'continue'
+}
+
+# Chunks longer than this are split even without a definition boundary
+MAX_CHUNK_LINES = 80
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """Lower-cased identifiers plus their snake_case and camelCase parts"""
+    for identifier in IDENTIFIER.findall(text):
+        lowered = identifier.lower()
+        if lowered not in STOPWORDS:
+            yield lowered
+
+        parts = [part for piece in identifier.split('_') for part in SUBWORD.findall(piece)]
+        if len(parts) > 1:
+            for part in parts:
+                part = part.lower()
+                if len(part) > 1 and part not in STOPWORDS:
+                    yield part
+
+
+def split_chunks(text: str) -> List[Tuple[int, int]]:
+    """(start_line, end_line) ranges cut at definition boundaries"""
+    lines = text.count('\n') + 1
+    boundaries = {0}
+    line, position = 0, 0
+    for match in DEFINITION.finditer(text):
+        line += text.count('\n', position, match.start())
+        position = match.start()
+        boundaries.add(line)
+    starts = sorted(boundaries)
+
+    chunks = []
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else lines
+        while end - start > MAX_CHUNK_LINES:
+            chunks.append((start, start + MAX_CHUNK_LINES))
+            start += MAX_CHUNK_LINES
+        if end > start:
+            chunks.append((start, end))
+    return chunks
+
+
+def index_path_for(codebase_path: str, index_dir: Optional[str] = None) -> Path:
+    digest = hashlib.sha256(os.path.abspath(codebase_path).encode('utf-8')).hexdigest()[:24]
+    return Path(index_dir or INDEX_DIR) / f"{digest}.idx"
+
+
+def evict_indexes(keep_paths: List[str], ttl: float, index_dir: Optional[str] = None) -> int:
+    """Remove saved indexes older than ttl seconds except those of keep_paths"""
+    keep = {index_path_for(path, index_dir).name for path in keep_paths}
+    cutoff = time.time() - ttl
+    removed = 0
+    try:
+        entries = list(os.scandir(index_dir or INDEX_DIR))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.name not in keep and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class RetrievalIndex:
+    """BM25 index over identifiers in definition-sized chunks of a codebase
+
+    Postings are stored flat: all document ids and term frequencies live in
+    two typed arrays, and each term maps to its [start, end) slice.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, root: str):
+        self.root = str(root)
+        self.paths: List[str] = []
+        self.doc_paths = array('I')
+        self.doc_starts = array('I')
+        self.doc_ends = array('I')
+        self.doc_lengths = array('I')
+        self.term_ids: Dict[str, int] = {}
+        self.offsets = array('Q', [0])
+        self.postings = array('I')
+        self.frequencies = array('H')
+        self.average_length = 0.0
+
+    @classmethod
+    def build(cls, root: str, files: List[Tuple[str, str]],
+              reader: Callable[[Path, Optional[int]], Optional[str]]) -> 'RetrievalIndex':
+        """Index (relative_path, language) pairs, reading each file through reader"""
+        index = cls(root)
+        term_postings: Dict[str, List[Tuple[int, int]]] = {}
+
+        with span('retrieval.build'):
+            for relative_path, language in files:
+                if language not in INDEXED_LANGUAGES:
+                    continue
+                text = reader(Path(root) / relative_path, None)
+                if not text:
+                    continue
+
+                path_id = len(index.paths)
+                index.paths.append(relative_path)
+                lines = text.split('\n')
+
+                for start, end in split_chunks(text):
+                    counts = Counter(tokenize('\n'.join(lines[start:end])))
+                    if not counts:
+                        continue
+
+                    doc_id = len(index.doc_paths)
+                    index.doc_paths.append(path_id)
+                    index.doc_starts.append(start)
+                    index.doc_ends.append(end)
+                    index.doc_lengths.append(sum(counts.values()))
+                    for term, frequency in counts.items():
+                        term_postings.setdefault(term, []).append((doc_id, min(frequency, 65535)))
+
+            for term, postings in term_postings.items():
+                index.term_ids[term] = len(index.offsets) - 1
+                for doc_id, frequency in postings:
+                    index.postings.append(doc_id)
+                    index.frequencies.append(frequency)
+                index.offsets.append(len(index.postings))
+
+            if index.doc_lengths:
+                index.average_length = sum(index.doc_lengths) / len(index.doc_lengths)
+
+        return index
+
+    def __len__(self) -> int:
+        return len(self.doc_paths)
+
+    def search(self, query: str, limit: int = 10, max_df_ratio: float = 0.25) -> List[Tuple[int, float]]:
+        """Top documents for a query as (doc_id, score), best first"""
+        total_docs = len(self.doc_paths)
+        if not total_docs:
+            return []
+
+        terms = set(tokenize(query))
+        scores: Dict[int, float] = {}
+        k1, b = self.K1, self.B
+        average_length = self.average_length or 1.0
+
+        with span('retrieval.search'):
+            for term in terms:
+                term_id = self.term_ids.get(term)
+                if term_id is None:
+                    continue
+
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                document_frequency = end - start
+                # Very common terms barely move BM25 scores but dominate query time
+                if len(terms) > 1 and document_frequency > max_df_ratio * total_docs:
+                    continue
+
+                idf = math.log(1 + (total_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+                for position in range(start, end):
+                    doc_id = self.postings[position]
+                    frequency = self.frequencies[position]
+                    norm = k1 * (1 - b + b * self.doc_lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (k1 + 1) / (frequency + norm)
+
+            return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def retrieve(self, query: str, token_budget: int, reader: Callable[[Path, Optional[int]], Optional[str]],
+                 count_tokens: Callable[[str], int], limit: int = 20) -> str:
+        """Best-matching code snippets formatted for a prompt, within a token budget"""
+        snippets = []
+        used = 0
+
+        for doc_id, _ in self.search(query, limit):
+            relative_path = self.paths[self.doc_paths[doc_id]]
+            text = reader(Path(self.root) / relative_path, None)
+            if not text:
+                continue
+
+            start, end = self.doc_starts[doc_id], self.doc_ends[doc_id]
+            body = '\n'.join(text.split('\n')[start:end])
+            snippet = f"File: {relative_path} (lines {start + 1}-{end})\n{body}\n"
+
+            tokens = count_tokens(snippet)
+            if used + tokens > token_budget:
+                continue
+            snippets.append(snippet)
+            used += tokens
+
+        return '\n'.join(snippets)
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(temp_path, 'wb') as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['RetrievalIndex']:
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        index = cls.__new__(cls)
+        index.__dict__.update(state)
+        return index
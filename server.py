@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 """
 Run script for the Flask DocSmith application
+
+    python3 server.py               # development server with debugger and reloader
+    python3 server.py --production  # gunicorn with gunicorn.conf.py (or DOCSMITH_ENV=production)
 """
 
 import os
@@ -15,10 +18,28 @@ sys.path.insert(0, str(current_dir))
 from dotenv import load_dotenv
 load_dotenv()
 
-# Import and run the Flask app
-from flask_app import app
+
+def run_production():
+    """Replace this process with gunicorn using the settings in gunicorn.conf.py"""
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print("ERROR: gunicorn is not installed; run 'pip install gunicorn' for production mode.")
+        sys.exit(1)
+    
+    config = str(current_dir / 'gunicorn.conf.py')
+    print(f"🚀 Starting DocSmith in production mode ({config})")
+    os.chdir(current_dir)
+    os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', config, 'wsgi:app'])
+
 
 if __name__ == '__main__':
+    if '--production' in sys.argv or os.getenv('DOCSMITH_ENV', '').lower() == 'production':
+        run_production()
+    
+    # Import and run the Flask app
+    from flask_app import app
+    
     # Check if API key is set
     if not os.getenv('ANTHROPIC_API_KEY'):
         print("WARNING: ANTHROPIC_API_KEY environment variable is not set!")
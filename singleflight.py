@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays within the process
+    fcntl = None
+
+from metrics import metrics, record_cache
+from deadline import remaining
+
+_MISSING = object()
+
+# Polling interval bounds while waiting for another process's lock
+LOCK_POLL_MIN = 0.01
+LOCK_POLL_MAX = 0.25
+
+
+class SingleFlight:
+    """Run a function once per key while identical concurrent calls wait for its result
+
+    Within a process, followers wait on the leader's future. With a store
+    directory, processes on the same host serialize on a per-key flock and
+    the leader publishes its JSON result there, so a follower that acquires
+    the lock afterwards reads the result instead of redoing the work.
+    Published results are reused for result_ttl seconds.
+
+    Followers wait at most until the request deadline, or max_wait seconds
+    without one, and then do the work themselves, so a hung leader cannot
+    hold every follower's thread.
+    """
+
+    def __init__(self, name: str, store_dir: Optional[str] = None, result_ttl: float = 300,
+                 max_wait: float = 600):
+        self.name = name
+        self.store_dir = Path(store_dir) if store_dir and fcntl is not None else None
+        self.result_ttl = result_ttl
+        self.max_wait = max_wait
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        if self.store_dir is not None:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, name: str) -> 'SingleFlight':
+        return cls(
+            name,
+            store_dir=os.path.join(os.getenv('DOCSMITH_SINGLEFLIGHT_DIR', 'temp_singleflight'), name),
+            result_ttl=float(os.getenv('DOCSMITH_SINGLEFLIGHT_TTL', '300')),
+            max_wait=float(os.getenv('DOCSMITH_SINGLEFLIGHT_MAX_WAIT', '600'))
+        )
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            try:
+                result = future.result(timeout=self._wait_seconds())
+            except FutureTimeout:
+                metrics.inc('docsmith_singleflight_wait_timeouts_total', flight=self.name, scope='thread')
+                return self._call(fn)
+            record_cache(f'singleflight.{self.name}', True)
+            return result
+
+        try:
+            result = self._do_shared(key, fn) if self.store_dir is not None else self._call(fn)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _wait_seconds(self) -> float:
+        left = remaining()
+        return self.max_wait if left is None else max(0.0, min(left, self.max_wait))
+
+    def _call(self, fn: Callable[[], Any]) -> Any:
+        record_cache(f'singleflight.{self.name}', False)
+        return fn()
+
+    def _do_shared(self, key: str, fn: Callable[[], Any]) -> Any:
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        result_path = self.store_dir / f"{digest}.json"
+
+        cached = self._read_result(result_path, key)
+        if cached is not _MISSING:
+            record_cache(f'singleflight.{self.name}', True)
+            return cached
+
+        lock_file = self._lock_key(self.store_dir / f"{digest}.lock", time.monotonic() + self._wait_seconds())
+        if lock_file is None:
+            # Another process is still at it after our whole wait; do the work rather than keep waiting
+            metrics.inc('docsmith_singleflight_wait_timeouts_total', flight=self.name, scope='process')
+            cached = self._read_result(result_path, key)
+            if cached is not _MISSING:
+                record_cache(f'singleflight.{self.name}', True)
+                return cached
+            result = self._call(fn)
+            self._write_result(result_path, key, result)
+            return result
+
+        with lock_file:
+            try:
+                cached = self._read_result(result_path, key)
+                if cached is not _MISSING:
+                    record_cache(f'singleflight.{self.name}', True)
+                    return cached
+
+                result = self._call(fn)
+                self._write_result(result_path, key, result)
+                return result
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _lock_key(self, lock_path: Path, wait_until: float):
+        """Open and exclusively lock a key's lock file, polling until wait_until; None on timeout
+
+        Lock files are pruned while locked, so a lock taken on a file that was
+        unlinked in the meantime is dropped and taken again on the new file.
+        """
+        delay = LOCK_POLL_MIN
+        while True:
+            lock_file = open(lock_path, 'a+')
+            while True:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    now = time.monotonic()
+                    if now >= wait_until:
+                        lock_file.close()
+                        return None
+                    time.sleep(min(delay, wait_until - now))
+                    delay = min(delay * 2, LOCK_POLL_MAX)
+
+            try:
+                current = os.stat(lock_path).st_ino
+            except OSError:
+                current = None
+            if current == os.fstat(lock_file.fileno()).st_ino:
+                # Marks the lock as recently used for _prune
+                os.utime(lock_path)
+                return lock_file
+            lock_file.close()
+
+    def _read_result(self, result_path: Path, key: str) -> Any:
+        try:
+            if time.time() - result_path.stat().st_mtime > self.result_ttl:
+                return _MISSING
+            with open(result_path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return _MISSING
+
+        # Guard against digest collisions
+        if payload.get('key') != key:
+            return _MISSING
+        return payload.get('result')
+
+    def _write_result(self, result_path: Path, key: str, result: Any):
+        temp_path = result_path.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'result': result}, f)
+            os.replace(temp_path, result_path)
+        except (OSError, TypeError, ValueError):
+            # Unserializable results are still returned, just not shared
+            if temp_path.exists():
+                temp_path.unlink()
+            return
+
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self._prune()
+
+    def _prune(self):
+        """Remove published results and unused lock files older than the TTL"""
+        cutoff = time.time() - self.result_ttl
+        for path in self.store_dir.glob('*.json'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+        for path in self.store_dir.glob('*.lock'):
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+                with open(path, 'a+') as lock_file:
+                    # Skip locks in use; waiters on an unlinked file notice and reopen it
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    path.unlink()
+            except OSError:
+                pass
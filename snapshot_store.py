@@ -0,0 +1,226 @@
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from metrics import span
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    created REAL NOT NULL,
+    project_name TEXT NOT NULL,
+    total_files INTEGER NOT NULL,
+    total_directories INTEGER NOT NULL,
+    total_lines INTEGER NOT NULL,
+    blank_lines INTEGER NOT NULL,
+    comment_lines INTEGER NOT NULL,
+    estimated_tokens INTEGER NOT NULL,
+    complexity TEXT NOT NULL,
+    UNIQUE (repo, commit_sha)
+);
+CREATE INDEX IF NOT EXISTS snapshots_by_repo ON snapshots (repo, created DESC);
+
+CREATE TABLE IF NOT EXISTS snapshot_languages (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    language TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_id, language)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS snapshot_technologies (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    technology TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, technology)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS snapshot_files (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    language TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_id, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS snapshot_files_by_size ON snapshot_files (snapshot_id, size DESC);
+"""
+
+# The newest snapshot of each repository, used by cross-repository rollups
+LATEST_SNAPSHOTS = """
+SELECT s.* FROM snapshots s
+WHERE s.created = (SELECT MAX(created) FROM snapshots WHERE repo = s.repo)
+"""
+
+
+class SnapshotStore:
+    """Analysis results per (repository, commit) in a local SQLite database
+
+    Each snapshot keeps the project totals, a per-language breakdown, the
+    detected technologies and one row per analyzed file, so summaries,
+    language breakdowns, largest files and rollups across repositories are
+    indexed queries instead of new walks over the file tree. Connections are
+    per thread; WAL mode lets worker processes read while one writes.
+    """
+
+    def __init__(self, path: str = 'temp_snapshots/analysis.sqlite3'):
+        self.path = str(Path(path).absolute())
+        self._local = threading.local()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> 'SnapshotStore':
+        return cls(os.getenv('DOCSMITH_SNAPSHOT_DB', 'temp_snapshots/analysis.sqlite3'))
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = connection
+        return connection
+
+    def save(self, repo: str, commit: str, analysis: Dict, project_summary: Dict) -> int:
+        """Store (or replace) the snapshot of a repository commit and return its id"""
+        statistics = analysis['statistics']
+        structure = analysis['structure']
+        table = analysis['files']
+
+        with span('snapshots.save'), self._connection() as connection:
+            connection.execute('DELETE FROM snapshots WHERE repo = ? AND commit_sha = ?', (repo, commit))
+            cursor = connection.execute(
+                'INSERT INTO snapshots (repo, commit_sha, created, project_name, total_files, total_directories, '
+                'total_lines, blank_lines, comment_lines, estimated_tokens, complexity) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (repo, commit, time.time(), project_summary['project_name'], structure['total_files'],
+                 structure['total_directories'], statistics['total_lines'], statistics['blank_lines'],
+                 statistics['comment_lines'], statistics['estimated_tokens'], project_summary['estimated_complexity'])
+            )
+            snapshot_id = cursor.lastrowid
+
+            connection.executemany(
+                'INSERT INTO snapshot_languages (snapshot_id, language, files, lines) VALUES (?, ?, ?, ?)',
+                [(snapshot_id, language, statistics['file_count_by_language'][language], lines)
+                 for language, lines in statistics['lines_by_language'].items()]
+            )
+            connection.executemany(
+                'INSERT INTO snapshot_technologies (snapshot_id, technology) VALUES (?, ?)',
+                [(snapshot_id, technology) for technology in set(analysis['technologies'])]
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO snapshot_files (snapshot_id, path, language, size, lines, tokens) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    (snapshot_id, table.paths[path_id], table.languages[language_id], size, lines, tokens)
+                    for path_id, language_id, size, lines, tokens in zip(
+                        table.path_ids, table.language_ids, table.sizes, table.line_counts, table.token_counts
+                    )
+                )
+            )
+        return snapshot_id
+
+    def _snapshot(self, repo: str, commit: Optional[str] = None) -> Optional[sqlite3.Row]:
+        """The snapshot of a commit, or the repository's newest one when commit is None"""
+        if commit:
+            query, params = 'SELECT * FROM snapshots WHERE repo = ? AND commit_sha = ?', (repo, commit)
+        else:
+            query, params = 'SELECT * FROM snapshots WHERE repo = ? ORDER BY created DESC LIMIT 1', (repo,)
+        return self._connection().execute(query, params).fetchone()
+
+    def has(self, repo: str, commit: str) -> bool:
+        return self._snapshot(repo, commit) is not None
+
+    def summary(self, repo: str, commit: Optional[str] = None) -> Optional[Dict]:
+        """Project summary in the same shape as DocumentationGenerator.summarize_analysis"""
+        snapshot = self._snapshot(repo, commit)
+        if snapshot is None:
+            return None
+
+        connection = self._connection()
+        languages = connection.execute(
+            'SELECT language FROM snapshot_languages WHERE snapshot_id = ? ORDER BY lines DESC LIMIT 5',
+            (snapshot['id'],)
+        ).fetchall()
+        technologies = connection.execute(
+            'SELECT technology FROM snapshot_technologies WHERE snapshot_id = ?', (snapshot['id'],)
+        ).fetchall()
+
+        return {
+            'project_name': snapshot['project_name'],
+            'total_files': snapshot['total_files'],
+            'total_lines': snapshot['total_lines'],
+            'technologies': [row['technology'] for row in technologies],
+            'main_languages': [row['language'] for row in languages],
+            'estimated_complexity': snapshot['complexity'],
+            'repo': snapshot['repo'],
+            'commit': snapshot['commit_sha'],
+            'analyzed_at': snapshot['created']
+        }
+
+    def languages(self, repo: str, commit: Optional[str] = None) -> Optional[List[Dict]]:
+        snapshot = self._snapshot(repo, commit)
+        if snapshot is None:
+            return None
+        rows = self._connection().execute(
+            'SELECT language, files, lines FROM snapshot_languages WHERE snapshot_id = ? ORDER BY lines DESC',
+            (snapshot['id'],)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def largest_files(self, repo: str, commit: Optional[str] = None, limit: int = 10) -> Optional[List[Dict]]:
+        snapshot = self._snapshot(repo, commit)
+        if snapshot is None:
+            return None
+        rows = self._connection().execute(
+            'SELECT path, language, size, lines, tokens FROM snapshot_files '
+            'WHERE snapshot_id = ? ORDER BY size DESC LIMIT ?',
+            (snapshot['id'], limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def repos(self, limit: int = 100, offset: int = 0) -> List[Dict]:
+        """Each repository's newest snapshot, most recently analyzed first"""
+        rows = self._connection().execute(
+            f'SELECT repo, commit_sha, created, total_files, total_lines, estimated_tokens, complexity '
+            f'FROM ({LATEST_SNAPSHOTS}) ORDER BY created DESC LIMIT ? OFFSET ?',
+            (limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def rollup(self) -> Dict:
+        """Totals across the newest snapshot of every repository"""
+        connection = self._connection()
+        totals = connection.execute(
+            f'SELECT COUNT(*) AS repos, COALESCE(SUM(total_files), 0) AS total_files, '
+            f'COALESCE(SUM(total_lines), 0) AS total_lines, COALESCE(SUM(estimated_tokens), 0) AS estimated_tokens '
+            f'FROM ({LATEST_SNAPSHOTS})'
+        ).fetchone()
+        languages = connection.execute(
+            f'SELECT l.language, COUNT(*) AS repos, SUM(l.files) AS files, SUM(l.lines) AS lines '
+            f'FROM ({LATEST_SNAPSHOTS}) s JOIN snapshot_languages l ON l.snapshot_id = s.id '
+            f'GROUP BY l.language ORDER BY lines DESC'
+        ).fetchall()
+        technologies = connection.execute(
+            f'SELECT t.technology, COUNT(*) AS repos '
+            f'FROM ({LATEST_SNAPSHOTS}) s JOIN snapshot_technologies t ON t.snapshot_id = s.id '
+            f'GROUP BY t.technology ORDER BY repos DESC'
+        ).fetchall()
+        complexity = connection.execute(
+            f'SELECT complexity, COUNT(*) AS repos FROM ({LATEST_SNAPSHOTS}) GROUP BY complexity'
+        ).fetchall()
+
+        return {
+            **dict(totals),
+            'languages': [dict(row) for row in languages],
+            'technologies': [dict(row) for row in technologies],
+            'complexity': {row['complexity']: row['repos'] for row in complexity}
+        }
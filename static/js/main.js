@@ -46,6 +46,10 @@ function createAlertsContainer() {
 
 // Tab functionality
 function initializeTabs() {
+    // Result URLs are stable per generation, so browsers can revalidate them with ETags
+    const docUrl = (docType) => resultId ? `/results/${resultId}/${docType}.md` : `/download/${docType}`;
+    const archiveUrl = resultId ? `/results/${resultId}/documentation.zip` : '/download-all';
+    
     const tabButtons = document.querySelectorAll('.tab-button');
     const tabPanels = document.querySelectorAll('.tab-panel');
     
@@ -178,6 +182,7 @@ function handleGitHubSubmit() {
                 }
                 
                 displayUploadSuccess(data);
+                watchAnalysis(data.analysis);
                 enableDocumentationGeneration();
             }
         });
@@ -201,6 +206,7 @@ function handleZipUpload() {
                             hideLoading();
                             showAlert(data.message, 'success');
                             displayUploadSuccess(data);
+                            watchAnalysis(data.analysis);
                             enableDocumentationGeneration();
                         }
                     });
@@ -210,11 +216,86 @@ function handleZipUpload() {
     }
 }
 
+// Resumable, deduplicated uploads: send a manifest of hashes, then only the missing blobs in chunks
+async function sha256Hex(file) {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function fetchJson(url, options = {}, retries = 3) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch(url, options);
+            const data = await response.json();
+            if (response.ok || response.status === 409 || attempt >= retries) {
+                return { status: response.status, data };
+            }
+        } catch (error) {
+            if (attempt >= retries) throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+    }
+}
+
+async function uploadBlob(uploadId, file, blob, chunkSize) {
+    let offset = blob.received;
+    while (offset < blob.size) {
+        const chunk = file.slice(offset, Math.min(offset + chunkSize, blob.size));
+        const { status, data } = await fetchJson(
+            `/uploads/${uploadId}/blobs/${blob.sha256}?offset=${offset}`,
+            { method: 'PUT', body: chunk }
+        );
+        if (status === 409) {
+            // The server has a different amount than we assumed; resume from there
+            offset = data.received;
+        } else if (data.error) {
+            throw new Error(data.error);
+        } else {
+            offset = data.received;
+        }
+    }
+}
+
+async function uploadFilesChunked(files) {
+    const entries = [];
+    const fileByHash = {};
+    for (const file of files) {
+        const sha256 = await sha256Hex(file);
+        fileByHash[sha256] = file;
+        entries.push({ path: file.webkitRelativePath || file.name, size: file.size, sha256 });
+    }
+    
+    const { data: upload } = await fetchJson('/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ files: entries })
+    });
+    if (upload.error) throw new Error(upload.error);
+    
+    let sent = 0;
+    for (const blob of upload.missing) {
+        showLoading(`Uploading ${++sent} of ${upload.missing.length} new files...`);
+        await uploadBlob(upload.upload_id, fileByHash[blob.sha256], blob, upload.chunk_size);
+    }
+    
+    const { data } = await fetchJson(`/uploads/${upload.upload_id}/complete`, { method: 'POST' });
+    if (!data.success) throw new Error(data.error || 'Upload failed');
+    return data;
+}
+
 // Individual files handling
 function handleFilesUpload() {
     const form = document.getElementById('files-form');
     if (!form) return;
     
+    const onSuccess = (data) => {
+        hideLoading();
+        showAlert(data.message, 'success');
+        displayUploadSuccess(data);
+        watchAnalysis(data.analysis);
+        enableDocumentationGeneration();
+    };
+    
     const fileInput = form.querySelector('input[type="file"]');
     if (fileInput && !fileInput.hasAttribute('data-submit-listener')) {
         fileInput.setAttribute('data-submit-listener', 'true');
@@ -222,14 +303,19 @@ function handleFilesUpload() {
             if (fileInput.files.length > 0) {
                 // Auto-submit after file selection
                 setTimeout(() => {
-                    submitFormAjax(form, {
-                        onSuccess: (data) => {
+                    // Hashing needs Web Crypto, which browsers only offer on secure origins
+                    if (!(window.crypto && crypto.subtle)) {
+                        submitFormAjax(form, { onSuccess });
+                        return;
+                    }
+                    
+                    showLoading('Preparing upload...');
+                    uploadFilesChunked(Array.from(fileInput.files))
+                        .then(onSuccess)
+                        .catch(error => {
                             hideLoading();
-                            showAlert(data.message, 'success');
-                            displayUploadSuccess(data);
-                            enableDocumentationGeneration();
-                        }
-                    });
+                            showAlert(error.message || 'An error occurred', 'error');
+                        });
                 }, 500); // Small delay to show file selection first
             }
         });
@@ -248,6 +334,7 @@ function handleLocalPath() {
             onSuccess: (data) => {
                 hideLoading();
                 showAlert(data.message, 'success');
+                watchAnalysis(data.analysis);
                 enableDocumentationGeneration();
             }
         });
@@ -295,7 +382,7 @@ function handleDocumentationGeneration() {
                 }
                 
                 if (data.documentation) {
-                    displayDocumentation(data.documentation);
+                    displayDocumentation(data.documentation, data.rendered, data.result_id);
                 }
             },
             onError: (error) => {
@@ -329,7 +416,7 @@ function handleCodeExplanation() {
             onSuccess: (data) => {
                 hideLoading();
                 if (data.explanation) {
-                    displayCodeExplanation(data.explanation);
+                    displayCodeExplanation(data.explanation, data.rendered);
                 }
             }
         });
@@ -337,6 +424,43 @@ function handleCodeExplanation() {
 }
 
 // Display functions
+// Background analysis started at upload time
+let exactSummaryJobId = null;
+
+function watchAnalysis(analysis, previewRequested = false) {
+    if (!analysis || !analysis.job_id) return;
+    
+    if (analysis.state === 'done') {
+        exactSummaryJobId = analysis.job_id;
+        displayProjectSummary(analysis.project_summary);
+        return;
+    }
+    if (analysis.state === 'failed') return;
+    
+    // Large codebases: show an estimate from sampled files until the exact numbers arrive
+    if (!previewRequested) {
+        fetch('/project-preview')
+            .then(response => response.json())
+            .then(data => {
+                if (data.project_summary && exactSummaryJobId !== analysis.job_id) {
+                    displayProjectSummary(data.project_summary);
+                }
+            })
+            .catch(() => {});
+    }
+    
+    setTimeout(() => {
+        fetch(`/analysis-status/${analysis.job_id}`)
+            .then(response => response.json())
+            .then(status => {
+                if (!status.error) {
+                    watchAnalysis(status, true);
+                }
+            })
+            .catch(() => {});
+    }, 1000);
+}
+
 function displayRepoInfo(repoInfo) {
     const container = document.getElementById('repo-info-container');
     if (!container) return;
@@ -362,19 +486,36 @@ function displayProjectSummary(summary) {
     const container = document.getElementById('project-summary-container');
     if (!container) return;
     
+    // Previews extrapolate lines from sampled files and carry a 95% interval
+    const preview = summary.preview;
+    const lines = preview
+        ? `≈ ${summary.total_lines.toLocaleString()}`
+        : summary.total_lines.toLocaleString();
+    const linesRange = preview
+        ? `<div class="text-muted">${preview.total_lines_interval.map(n => n.toLocaleString()).join(' – ')}</div>`
+        : '';
+    
+    // Binary, minified and generated files are not counted in lines or sent to the model
+    const skipped = Object.entries(summary.skipped_files || {}).filter(([, count]) => count > 0);
+    const skippedNote = skipped.length
+        ? `<div class="text-muted">Skipped: ${skipped.map(([kind, count]) => `${count} ${kind}`).join(', ')}</div>`
+        : '';
+    
     container.innerHTML = `
         <div class="card">
             <div class="card-header">
-                <h3 class="card-title">📊 Project Summary</h3>
+                <h3 class="card-title">📊 Project Summary${preview ? ' (estimate)' : ''}</h3>
             </div>
             <div class="metrics-grid">
                 <div class="metric-card">
                     <div class="metric-title">Files</div>
                     <div class="metric-value">${summary.total_files}</div>
+                    ${skippedNote}
                 </div>
                 <div class="metric-card">
                     <div class="metric-title">Lines</div>
-                    <div class="metric-value">${summary.total_lines.toLocaleString()}</div>
+                    <div class="metric-value">${lines}</div>
+                    ${linesRange}
                 </div>
                 <div class="metric-card">
                     <div class="metric-title">Complexity</div>
@@ -401,7 +542,7 @@ function displayProjectSummary(summary) {
     `;
 }
 
-function displayDocumentation(documentation) {
+function displayDocumentation(documentation, rendered = {}, resultId = null) {
     const container = document.getElementById('documentation-container');
     if (!container) return;
     
@@ -417,11 +558,9 @@ function displayDocumentation(documentation) {
     
     const tabPanels = Object.entries(documentation).map(([docType, content]) => `
         <div id="${docType}" class="tab-panel">
-            <div class="documentation-content">
-                ${renderMarkdown(content)}
-            </div>
+            <div class="documentation-content" data-doc-type="${docType}"></div>
             <div class="mt-3">
-                <a href="/download/${docType}" class="btn btn-secondary">📥 Download MD</a>
+                <a href="${docUrl(docType)}" class="btn btn-secondary">📥 Download MD</a>
             </div>
         </div>
     `).join('');
@@ -441,12 +580,18 @@ function displayDocumentation(documentation) {
             </div>
             ${Object.keys(documentation).length > 1 ? `
                 <div class="text-center mt-3">
-                    <a href="/download-all" class="btn btn-success">📦 Download All as ZIP</a>
+                    <a href="${archiveUrl}" class="btn btn-success">📦 Download All as ZIP</a>
                 </div>
             ` : ''}
         </div>
     `;
     
+    // Rendered HTML is fetched from the server and inserted a few sections at a time
+    Object.entries(documentation).forEach(([docType, content]) => {
+        const target = container.querySelector(`.documentation-content[data-doc-type="${docType}"]`);
+        loadRenderedMarkdown(target, rendered[docType], content);
+    });
+    
     // Initialize tabs and make first one active
     initializeTabs();
     const firstButton = container.querySelector('.tab-button');
@@ -457,7 +602,7 @@ function displayDocumentation(documentation) {
     }
 }
 
-function displayCodeExplanation(explanation) {
+function displayCodeExplanation(explanation, rendered) {
     const container = document.getElementById('code-explanation-container');
     if (!container) return;
     
@@ -466,11 +611,11 @@ function displayCodeExplanation(explanation) {
             <div class="card-header">
                 <h3 class="card-title">💡 Code Explanation</h3>
             </div>
-            <div class="explanation-content">
-                ${renderMarkdown(explanation)}
-            </div>
+            <div class="explanation-content"></div>
         </div>
     `;
+    
+    loadRenderedMarkdown(container.querySelector('.explanation-content'), rendered, explanation);
 }
 
 function displayFileSelection(files, fileInput) {
@@ -584,32 +729,115 @@ function displayUploadSuccess(data) {
         `;
     }
     
+    const rejected = data.rejected_files || [];
+    if (rejected.length) {
+        uploadInfo += `
+            <div class="card">
+                <div class="card-header">
+                    <h3 class="card-title">⚠️ ${rejected.length} Files Skipped</h3>
+                </div>
+                ${rejected.map(file => `<p><code>${escapeHtml(file.path)}</code>: ${escapeHtml(file.error)}</p>`).join('')}
+            </div>
+        `;
+    }
+    
     container.innerHTML = uploadInfo;
 }
 
-function renderMarkdown(text) {
-    if (!text) return '';
-    
-    // Basic markdown rendering (simple implementation)
-    return text
-        // Headers
-        .replace(/^### (.*$)/gm, '<h3>$1</h3>')
-        .replace(/^## (.*$)/gm, '<h2>$1</h2>')
-        .replace(/^# (.*$)/gm, '<h1>$1</h1>')
-        // Bold and italic
-        .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
-        .replace(/\*(.*?)\*/g, '<em>$1</em>')
-        // Code blocks
-        .replace(/```(\w+)?\n([\s\S]*?)```/g, '<pre><code class="language-$1">$2</code></pre>')
-        .replace(/`([^`]+)`/g, '<code>$1</code>')
-        // Lists
-        .replace(/^\- (.*$)/gm, '<li>$1</li>')
-        .replace(/(<li>.*<\/li>)/gs, '<ul>$1</ul>')
-        // Links
-        .replace(/\[([^\]]+)\]\(([^)]+)\)/g, '<a href="$2" target="_blank" rel="noopener noreferrer">$1</a>')
-        // Line breaks
-        .replace(/\n\n/g, '<br><br>')
-        .replace(/\n/g, '<br>');
+// Markdown is rendered on the server; long documents are inserted section by section on scroll
+const RENDERED_SECTIONS_PER_BATCH = 3;
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text || '';
+    return div.innerHTML;
+}
+
+function loadRenderedMarkdown(container, digest, fallbackText) {
+    if (!container) return;
+    
+    const showPlainText = () => {
+        container.innerHTML = `<pre>${escapeHtml(fallbackText)}</pre>`;
+    };
+    if (!digest) {
+        showPlainText();
+        return;
+    }
+    
+    container.innerHTML = '<p class="text-muted">Rendering...</p>';
+    fetch(`/rendered/${digest}`)
+        .then(response => {
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        })
+        .then(rendered => renderSections(container, rendered))
+        .catch(showPlainText);
+}
+
+function renderSections(container, rendered) {
+    const sections = rendered.sections || [];
+    const toc = rendered.toc || [];
+    container.innerHTML = '';
+    
+    if (toc.length > 1) {
+        const nav = document.createElement('nav');
+        nav.className = 'doc-toc';
+        nav.innerHTML = `<ul>${toc.map(entry =>
+            `<li class="toc-level-${entry.level}"><a href="#${entry.id}" data-target="${entry.id}">${entry.title}</a></li>`
+        ).join('')}</ul>`;
+        container.appendChild(nav);
+    }
+    
+    const body = document.createElement('div');
+    container.appendChild(body);
+    
+    let next = 0;
+    const appendSections = (count) => {
+        const end = Math.min(sections.length, next + count);
+        body.insertAdjacentHTML('beforeend', sections.slice(next, end).join(''));
+        next = end;
+    };
+    
+    let observer = null;
+    const sentinel = document.createElement('div');
+    const finish = () => {
+        appendSections(sections.length);
+        if (observer) observer.disconnect();
+        sentinel.remove();
+    };
+    
+    container.querySelectorAll('.doc-toc a').forEach(link => {
+        link.addEventListener('click', (e) => {
+            e.preventDefault();
+            // The heading may be in a section that has not been inserted yet
+            finish();
+            const heading = body.querySelector(`[id="${link.dataset.target}"]`);
+            if (heading) heading.scrollIntoView({ behavior: 'smooth', block: 'start' });
+        });
+    });
+    
+    appendSections(RENDERED_SECTIONS_PER_BATCH);
+    if (next >= sections.length) return;
+    
+    if (!('IntersectionObserver' in window)) {
+        finish();
+        return;
+    }
+    
+    sentinel.className = 'render-sentinel';
+    container.appendChild(sentinel);
+    observer = new IntersectionObserver(entries => {
+        if (!entries.some(entry => entry.isIntersecting)) return;
+        appendSections(RENDERED_SECTIONS_PER_BATCH);
+        if (next >= sections.length) {
+            finish();
+        } else {
+            // Re-observe so a sentinel that is still visible triggers the next batch
+            observer.unobserve(sentinel);
+            observer.observe(sentinel);
+        }
+    }, { root: container, rootMargin: '600px 0px' });
+    observer.observe(sentinel);
 }
 
 function enableDocumentationGeneration() {
@@ -0,0 +1,177 @@
+"""
+Fingerprinted, precompressed static assets
+
+`python3 static_assets.py` copies every file under static/ to static/dist/
+under a name containing its content hash (css/main.3f2a9c1b7d4e.css), writes
+gzip and, when the `brotli` package is installed, brotli variants next to
+it, and records the names in static/dist/manifest.json. Templates link the
+fingerprinted names, which never change content, so browsers cache them for a
+year without revalidating.
+
+The app runs the same build at startup when the manifest is missing or out of
+date, so the script only matters where static/ is read-only at runtime.
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from compression import available_encodings, compress
+
+current_dir = Path(__file__).parent
+
+MANIFEST_NAME = 'manifest.json'
+
+# Content encoding -> file suffix of the precompressed variants
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.txt', '.json', '.md'}
+
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+def _digest(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _source_files(source_dir: Path, output_dir: Path):
+    for path in sorted(source_dir.rglob('*')):
+        if path.is_file() and output_dir not in path.parents and not path.name.startswith('.'):
+            yield path
+
+
+def build_assets(source_dir: Path, output_dir: Path) -> Dict:
+    """Write fingerprinted copies and precompressed variants of every static file
+
+    Returns the manifest: {'assets': {logical name: {'path', 'sha256', 'encodings'}}}.
+    Builds are deterministic, so concurrent builds by several workers agree.
+    """
+    source_dir, output_dir = Path(source_dir).resolve(), Path(output_dir).resolve()
+    assets = {}
+    for path in _source_files(source_dir, output_dir):
+        logical = path.relative_to(source_dir).as_posix()
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        fingerprinted = path.relative_to(source_dir).with_name(f'{path.stem}.{digest[:12]}{path.suffix}').as_posix()
+
+        target = output_dir / fingerprinted
+        if not target.exists():
+            _write_atomic(target, data)
+
+        encodings = []
+        if path.suffix.lower() in COMPRESSIBLE_EXTENSIONS:
+            for encoding in available_encodings():
+                variant = target.with_name(target.name + ENCODING_SUFFIXES[encoding])
+                if not variant.exists():
+                    compressed = compress(data, encoding, 11 if encoding == 'br' else 9)
+                    if len(compressed) >= len(data):
+                        continue
+                    _write_atomic(variant, compressed)
+                encodings.append(encoding)
+
+        assets[logical] = {'path': fingerprinted, 'sha256': digest, 'encodings': encodings}
+
+    manifest = {'assets': assets}
+    _write_atomic(output_dir / MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+class StaticAssets:
+    """Maps static file names to fingerprinted URLs and picks precompressed variants to serve"""
+
+    def __init__(self, source_dir: Path, output_dir: Path, build_on_start: bool = True):
+        self.source_dir = Path(source_dir).resolve()
+        self.output_dir = Path(output_dir).resolve()
+        self.build_on_start = build_on_start
+        self.assets: Dict[str, Dict] = {}
+        # Fingerprinted path -> asset entry, for serving
+        self.by_path: Dict[str, Dict] = {}
+
+    @classmethod
+    def from_env(cls, source_dir: Path) -> 'StaticAssets':
+        return cls(
+            source_dir,
+            Path(os.getenv('DOCSMITH_ASSET_DIR', str(Path(source_dir) / 'dist'))),
+            build_on_start=os.getenv('DOCSMITH_BUILD_ASSETS', '1').lower() not in ('0', 'false', 'no')
+        )
+
+    def load(self) -> 'StaticAssets':
+        """Read the manifest, rebuilding it first if a static file changed since the last build"""
+        manifest = self._read_manifest()
+        if self.build_on_start and not self._is_current(manifest):
+            try:
+                manifest = build_assets(self.source_dir, self.output_dir)
+            except OSError as e:
+                print(f"Could not build static assets: {str(e)}")
+        self.assets = (manifest or {}).get('assets', {})
+        self.by_path = {entry['path']: entry for entry in self.assets.values()}
+        return self
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(self.output_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_current(self, manifest: Optional[Dict]) -> bool:
+        if manifest is None:
+            return False
+        assets = manifest.get('assets', {})
+        sources = {
+            path.relative_to(self.source_dir).as_posix(): path
+            for path in _source_files(self.source_dir, self.output_dir)
+        }
+        if set(sources) != set(assets):
+            return False
+        return all(
+            assets[name]['sha256'] == _digest(path) and (self.output_dir / assets[name]['path']).exists()
+            for name, path in sources.items()
+        )
+
+    def fingerprinted(self, filename: str) -> Optional[str]:
+        entry = self.assets.get(filename)
+        return entry['path'] if entry else None
+
+    def variant(self, path: str, accept_encodings) -> Optional[tuple]:
+        """(file name under output_dir, content encoding or None) to serve for a fingerprinted path"""
+        entry = self.by_path.get(path)
+        if entry is None:
+            return None
+        for encoding in available_encodings():
+            if encoding in entry['encodings'] and accept_encodings[encoding] > 0:
+                return path + ENCODING_SUFFIXES[encoding], encoding
+        return path, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets')
+    parser.add_argument('--source', default=str(current_dir / 'static'), help='Static files directory')
+    parser.add_argument('--output', default=None, help='Output directory (default: <source>/dist)')
+    args = parser.parse_args()
+
+    source = Path(args.source)
+    output = Path(args.output) if args.output else Path(os.getenv('DOCSMITH_ASSET_DIR', str(source / 'dist')))
+    manifest = build_assets(source, output)
+
+    for name, entry in sorted(manifest['assets'].items()):
+        encodings = ', '.join(entry['encodings']) or 'uncompressed'
+        print(f"{name} -> {entry['path']} ({encodings})")
+    print(f"Manifest written to {output / MANIFEST_NAME}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture(scope='session')
+def flask_app(tmp_path_factory):
+    """The app module with the stub backend, in-process analysis and its state under a temporary directory"""
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    os.environ.update({
+        'DOCSMITH_LLM_BACKEND': 'stub',
+        'DOCSMITH_ANALYSIS_ISOLATION': '0',
+        'DOCSMITH_BUILD_ASSETS': '0',
+        'DOCSMITH_ADMIN_TOKEN': 'test-token',
+    })
+    import flask_app
+    yield flask_app
+    os.chdir(previous)
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.app.test_client()
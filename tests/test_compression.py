@@ -0,0 +1,109 @@
+import gzip
+import json
+
+import pytest
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request, Response
+
+from compression import ResponseCompressor, negotiate
+from static_assets import MANIFEST_NAME, StaticAssets, build_assets
+
+CSS = 'body { color: #333; }\n' * 200
+
+
+def _request(accept_encoding='gzip', method='GET'):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    return Request(EnvironBuilder(method=method, headers=headers).get_environ())
+
+
+def _json_response(size=4000):
+    response = Response(json.dumps({'documentation': 'x' * size}), mimetype='application/json')
+    response.set_etag('abc')
+    return response
+
+
+def test_negotiation_prefers_the_highest_quality():
+    assert negotiate(_request('gzip, br;q=0.5').accept_encodings, ('br', 'gzip')) == 'gzip'
+    assert negotiate(_request('br, gzip;q=0.8').accept_encodings, ('br', 'gzip')) == 'br'
+    assert negotiate(_request('identity').accept_encodings, ('br', 'gzip')) is None
+
+
+def test_large_json_is_compressed_with_a_weak_etag():
+    response = ResponseCompressor().apply(_request(), _json_response())
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert response.get_etag() == ('abc', True)
+    assert json.loads(gzip.decompress(response.get_data()))['documentation'] == 'x' * 4000
+
+
+@pytest.mark.parametrize('request_args, response', [
+    ({'accept_encoding': None}, _json_response()),
+    ({'method': 'HEAD'}, _json_response()),
+    ({}, _json_response(size=10)),
+    ({}, Response(b'\x89PNG' * 1000, mimetype='image/png')),
+    ({}, Response(iter([b'{}\n'] * 1000), mimetype='application/json')),
+])
+def test_responses_left_alone(request_args, response):
+    body = None if response.is_streamed else response.get_data()
+    response = ResponseCompressor().apply(_request(**request_args), response)
+    assert 'Content-Encoding' not in response.headers
+    if body is not None:
+        assert response.get_data() == body
+
+
+def test_disabled_compressor_changes_nothing():
+    assert 'Content-Encoding' not in ResponseCompressor(enabled=False).apply(_request(), _json_response()).headers
+
+
+def _static(tmp_path):
+    source = tmp_path / 'static'
+    (source / 'css').mkdir(parents=True)
+    (source / 'css' / 'main.css').write_text(CSS)
+    (source / 'logo.png').write_bytes(b'\x89PNG' * 10)
+    return source
+
+
+def test_build_fingerprints_and_precompresses(tmp_path):
+    source = _static(tmp_path)
+    manifest = build_assets(source, source / 'dist')
+
+    entry = manifest['assets']['css/main.css']
+    assert entry['path'].startswith('css/main.') and entry['path'].endswith('.css')
+    assert 'gzip' in entry['encodings'] and manifest['assets']['logo.png']['encodings'] == []
+    assert gzip.decompress((source / 'dist' / (entry['path'] + '.gz')).read_bytes()).decode() == CSS
+    assert json.loads((source / 'dist' / MANIFEST_NAME).read_text()) == manifest
+
+
+def test_assets_rebuild_when_a_source_changes(tmp_path):
+    source = _static(tmp_path)
+    assets = StaticAssets(source, source / 'dist').load()
+    before = assets.fingerprinted('css/main.css')
+
+    (source / 'css' / 'main.css').write_text(CSS + 'p { margin: 0; }\n')
+    assert StaticAssets(source, source / 'dist').load().fingerprinted('css/main.css') != before
+    assert StaticAssets(source, source / 'dist', build_on_start=False).load().fingerprinted('missing.css') is None
+
+
+def test_variant_follows_accept_encoding(tmp_path):
+    source = _static(tmp_path)
+    assets = StaticAssets(source, source / 'dist').load()
+    path = assets.fingerprinted('css/main.css')
+
+    assert assets.variant(path, _request('gzip').accept_encodings) == (path + '.gz', 'gzip')
+    assert assets.variant(path, _request(None).accept_encodings) == (path, None)
+    assert assets.variant('css/main.css', _request().accept_encodings) is None
+
+
+def test_assets_are_served_precompressed_and_immutable(client, flask_app, tmp_path, monkeypatch):
+    source = _static(tmp_path)
+    monkeypatch.setattr(flask_app, 'static_assets', StaticAssets(source, source / 'dist').load())
+    path = flask_app.static_assets.fingerprinted('css/main.css')
+
+    response = client.get(f'/assets/{path}', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200 and response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control'] and 'max-age=31536000' in response.headers['Cache-Control']
+    assert gzip.decompress(response.get_data()).decode() == CSS
+
+    assert client.get(f'/assets/{path}').get_data(as_text=True) == CSS
+    assert client.get('/assets/css/main.css').status_code == 404
@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+import claude_integration
+from claude_integration import PARTIAL_NOTE, ClaudeDocGenerator
+from deadline import DeadlineExceeded, budget, deadline, remaining
+from llm_backends import AnthropicBackend, LLMCancelled, LLMResponse, LLMTimeout, StubBackend
+from model_router import ModelRouter
+
+
+class _SlowFirstBackend(StubBackend):
+    """The first call hangs until cancelled; later calls answer at once"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.cancelled = threading.Event()
+
+    def complete(self, prompt, model, max_tokens, timeout=None, cancel=None):
+        self.calls += 1
+        if self.calls == 1:
+            if cancel is not None and cancel.wait(timeout):
+                self.cancelled.set()
+                raise LLMCancelled("Completion cancelled")
+            raise LLMTimeout("Completion exceeded timeout", 'partial')
+        return super().complete(prompt, model, max_tokens, timeout, cancel)
+
+
+class _FakeStream:
+    """Yields one chunk, then blocks like a stalled connection until closed"""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        yield 'Hello'
+        self.closed.wait(5)
+        raise ConnectionError('stream closed')
+
+    def close(self):
+        self.closed.set()
+
+
+@pytest.fixture
+def fresh_completions(monkeypatch):
+    monkeypatch.setattr(claude_integration, '_completions', OrderedDict())
+
+
+def test_nested_deadlines_never_extend_the_outer_one():
+    assert remaining() is None and budget(5) == 5
+    with deadline(1):
+        with deadline(10):
+            assert remaining() <= 1
+        with deadline(0.5):
+            assert remaining() <= 0.5
+        assert 0.5 < budget(30) <= 1
+    assert remaining() is None
+
+
+def test_budget_raises_once_spent():
+    with deadline(0.01):
+        time.sleep(0.02)
+        with pytest.raises(DeadlineExceeded):
+            budget(5)
+
+
+def test_timeouts_fall_back_to_the_partial_text(fresh_completions):
+    generator = ClaudeDocGenerator(backend=StubBackend(latency=3), router=ModelRouter())
+    with deadline(0.5):
+        text = generator.generate_from_prompt('developer_guide', 'Write a guide')
+    partial = text[:-len(PARTIAL_NOTE)]
+    assert text.endswith(PARTIAL_NOTE) and partial
+    assert partial.startswith('# Write a guide') or '# Write a guide'.startswith(partial)
+
+    with deadline(0.5), pytest.raises(LLMTimeout):
+        generator.generate_from_prompt('developer_guide', 'Write a guide', allow_partial=False)
+
+
+def test_spent_deadline_skips_the_call(fresh_completions):
+    generator = ClaudeDocGenerator(backend=StubBackend(), router=ModelRouter())
+    with deadline(0.01):
+        time.sleep(0.02)
+        text = generator.generate_from_prompt('developer_guide', 'Write a guide')
+    assert 'ran out of time' in text
+
+
+def test_slow_calls_are_hedged_and_the_loser_cancelled(fresh_completions):
+    router = ModelRouter()
+    route = router.route('developer_guide', 10)
+    for _ in range(20):
+        router.record(route, 0.05, 10, 10)
+    backend = _SlowFirstBackend()
+    generator = ClaudeDocGenerator(backend=backend, router=router)
+
+    started = time.monotonic()
+    text = generator.generate_from_prompt('developer_guide', 'Write a guide')
+    assert text.startswith('# Write a guide') and time.monotonic() - started < 2
+    assert backend.calls == 2 and backend.cancelled.wait(2)
+
+
+def test_anthropic_stream_is_closed_at_the_timeout():
+    backend = AnthropicBackend(api_key='test-key')
+    stream = _FakeStream()
+    backend.client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kwargs: stream))
+
+    started = time.monotonic()
+    with pytest.raises(LLMTimeout) as error:
+        backend.complete('Prompt', model='m', max_tokens=10, timeout=0.2)
+    assert error.value.partial == 'Hello'
+    assert stream.closed.is_set() and time.monotonic() - started < 2
+
+
+def test_anthropic_stream_is_closed_on_cancel():
+    backend = AnthropicBackend(api_key='test-key')
+    stream = _FakeStream()
+    backend.client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kwargs: stream))
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+
+    with pytest.raises(LLMCancelled):
+        backend.complete('Prompt', model='m', max_tokens=10, timeout=5, cancel=cancel)
+    assert stream.closed.is_set()
+
+
+def test_anthropic_response_uses_the_streamed_text_and_usage():
+    class _Finished(_FakeStream):
+        @property
+        def text_stream(self):
+            yield from ('Hel', 'lo')
+
+        def get_final_message(self):
+            return SimpleNamespace(usage=SimpleNamespace(input_tokens=3, output_tokens=2), content=[])
+
+    backend = AnthropicBackend(api_key='test-key')
+    backend.client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kwargs: _Finished()))
+    response = backend.complete('Prompt', model='m', max_tokens=10)
+    assert isinstance(response, LLMResponse)
+    assert (response.text, response.input_tokens, response.output_tokens) == ('Hello', 3, 2)
@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+
+import pytest
+
+import claude_integration
+from claude_integration import ClaudeDocGenerator, ExplanationTooLarge, _group_by_tokens
+from code_analyzer import count_tokens
+from code_chunking import split_code
+from llm_backends import StubBackend
+from model_router import ModelRouter
+
+CHUNK = 'Explain this part of a larger source file'
+SYNTHESIS = 'These are explanations of consecutive parts'
+
+
+class _RecordingBackend(StubBackend):
+    def __init__(self):
+        super().__init__(output_tokens=60)
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def complete(self, prompt, model, max_tokens, timeout=None, cancel=None):
+        with self._lock:
+            self.prompts.append(prompt)
+        return super().complete(prompt, model, max_tokens, timeout, cancel)
+
+    def count(self, first_line, scope=''):
+        return sum(1 for prompt in self.prompts if prompt.strip().startswith(first_line) and scope in prompt)
+
+
+def _source(functions):
+    return '\n\n'.join(
+        f"def handler_{index}(request, payload):\n"
+        f"    value = payload.get('field_{index}', {index})\n"
+        f"    return request.respond(value * {index}, status=200)\n"
+        for index in range(functions)
+    )
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    monkeypatch.setattr(claude_integration, 'EXPLAIN_CHUNK_TOKENS', 60)
+    monkeypatch.setattr(claude_integration, 'HEDGE_PERCENTILE', 0)
+    monkeypatch.setattr(claude_integration, '_completions', OrderedDict())
+    return ClaudeDocGenerator(backend=_RecordingBackend(), router=ModelRouter())
+
+
+def test_group_by_tokens_packs_consecutive_items():
+    assert _group_by_tokens([5, 5, 5, 5], 10) == [(0, 2), (2, 4)]
+    assert _group_by_tokens([3, 3, 3], 100) == [(0, 3)]
+    # Every group merges at least two items, even over the budget
+    assert _group_by_tokens([50, 50, 50], 10) == [(0, 2), (2, 3)]
+
+
+def test_split_code_packs_whole_definitions():
+    code = _source(6)
+    chunks = split_code(code, 'python', 60, count_tokens)
+    assert [(chunk.name, chunk.start_line, chunk.end_line) for chunk in chunks] == [
+        ('handler_0', 1, 10), ('handler_2', 11, 20), ('handler_4', 21, 29)
+    ]
+    assert '\n'.join(chunk.text for chunk in chunks).split() == code.split()
+
+
+def test_split_code_cuts_oversized_definitions_by_lines():
+    code = 'def big():\n' + ''.join(f'    value_{index} = compute({index})\n' for index in range(40))
+    chunks = split_code(code, 'python', 60, count_tokens)
+    assert len(chunks) > 1
+    assert [chunk.start_line for chunk in chunks] == sorted(chunk.start_line for chunk in chunks)
+
+
+def test_short_code_is_explained_in_one_call(generator):
+    generator.explain_code_section('x = 1', language='python')
+    assert len(generator.backend.prompts) == 1
+
+
+def test_long_code_is_explained_per_chunk_and_merged(generator):
+    code = _source(6)
+    chunks = split_code(code, 'python', 60, count_tokens)
+    explanation = generator.explain_code_section(code, language='python')
+
+    assert generator.backend.count(CHUNK) == len(chunks)
+    assert generator.backend.count(SYNTHESIS, 'What the whole file does') == 1
+    assert explanation.startswith(f'# {SYNTHESIS}')
+    assert explanation.count('### Lines ') == len(chunks)
+    assert '### Lines 1-10: `handler_0`' in explanation
+
+    # Chunk explanations are reused from the completion cache
+    generator.explain_code_section(code.replace("'field_5', 5", "'field_5', 7"), language='python')
+    assert generator.backend.count(CHUNK) == len(chunks) + 1
+
+
+def test_many_explanations_are_merged_in_rounds(generator, monkeypatch):
+    monkeypatch.setattr(claude_integration, 'SYNTHESIS_TOKENS', 240)
+    generator.explain_code_section(_source(12), language='python')
+
+    assert generator.backend.count(SYNTHESIS, 'What these parts do together') >= 2
+    assert generator.backend.count(SYNTHESIS, 'What the whole file does') == 1
+
+
+def test_too_many_chunks_are_refused_before_any_call(generator, monkeypatch):
+    monkeypatch.setattr(claude_integration, 'EXPLAIN_MAX_CHUNKS', 2)
+    with pytest.raises(ExplanationTooLarge):
+        generator.explain_code_section(_source(12), language='python')
+    assert generator.backend.prompts == []
@@ -0,0 +1,79 @@
+import os
+import pickle
+
+from file_records import FileStats, FileStatsCache, FileTable, LazyFileContents
+
+
+def _reader(path, max_chars):
+    try:
+        text = path.read_text(encoding='utf-8')
+    except OSError:
+        return None
+    return text[:max_chars] if max_chars else text
+
+
+def test_file_table_interns_languages_and_keeps_columns():
+    table = FileTable('/repo')
+    table.add('a.py', 'Python', 120, 10, 30)
+    table.add('b.js', 'JavaScript', 900, 50, 200)
+    table.add('c.py', 'Python', 40, 2, 8)
+
+    assert len(table) == 3
+    assert table.languages == ['Python', 'JavaScript']
+    assert [record.language for record in table] == ['Python', 'JavaScript', 'Python']
+    assert [record.path for record in table.largest(2)] == ['b.js', 'a.py']
+    assert table.nbytes() == 3 * (4 + 2 + 8 + 4 + 4)
+    assert table.to_dict()['files'][1] == {'path': 'b.js', 'language': 'JavaScript', 'size': 900,
+                                           'lines': 50, 'tokens': 200}
+
+
+def test_file_table_reads_contents_on_demand(tmp_path):
+    (tmp_path / 'a.py').write_text('print(1)\n')
+    table = FileTable(str(tmp_path))
+    path_id = table.add('a.py', 'Python', 9, 1, 3)
+    assert table.read_text(path_id, _reader, max_chars=5) == 'print'
+
+
+def test_stats_cache_evicts_least_recently_used():
+    cache = FileStatsCache(max_entries=2)
+    stats = FileStats(1, 0, 0, 10, 3)
+    cache.put((1, 1, 10, 0, 'Python'), stats)
+    cache.put((1, 2, 10, 0, 'Python'), stats)
+    assert cache.get((1, 1, 10, 0, 'Python')) == stats
+    cache.put((1, 3, 10, 0, 'Python'), stats)
+
+    assert cache.get((1, 2, 10, 0, 'Python')) is None
+    assert len(cache) == 2
+    assert sorted(cache.items_for({(1, 1), (1, 2), (1, 3)})) == [
+        ((1, 1, 10, 0, 'Python'), stats), ((1, 3, 10, 0, 'Python'), stats)
+    ]
+    assert cache.items_for({(1, 2)}) == []
+
+
+def test_stats_cache_key_changes_when_a_file_is_edited(tmp_path):
+    path = tmp_path / 'a.py'
+    path.write_text('x = 1\n')
+    before = FileStatsCache.key(os.stat(path), 'Python')
+    os.utime(path, ns=(0, 10**9))
+    assert FileStatsCache.key(os.stat(path), 'Python') != before
+
+
+def test_disabled_stats_cache_stores_nothing():
+    cache = FileStatsCache(max_entries=0)
+    cache.put((1, 1, 10, 0, 'Python'), FileStats(1, 0, 0, 10, 3))
+    assert len(cache) == 0 and cache.items_for({(1, 1)}) == []
+
+
+def test_lazy_contents_render_like_a_dict_and_pickle_without_the_reader(tmp_path):
+    (tmp_path / 'a.py').write_text('abcdef')
+    (tmp_path / 'b.py').write_text('xyz')
+    contents = LazyFileContents(str(tmp_path), _reader)
+    contents.add('a.py', max_chars=3)
+    contents.add('b.py')
+    contents.add('missing.py')
+
+    assert 'a.py' in contents and len(contents) == 3
+    assert str(contents) == str({'a.py': 'abc', 'b.py': 'xyz', 'missing.py': ''})
+
+    restored = pickle.loads(pickle.dumps(contents))
+    assert dict(restored) == {'a.py': 'abc', 'b.py': 'xyz', 'missing.py': ''}
@@ -0,0 +1,78 @@
+import base64
+import random
+
+import pytest
+
+from code_analyzer import CodebaseAnalyzer
+from file_sniffer import BINARY, GENERATED, MAX_LINE_LENGTH, MINIFIED, TEXT, classify, classify_name
+
+SOURCE = b''.join(
+    b'def handler_%d(request):\n    """Handle request %d"""\n    return render(request, "page.html")\n\n' % (i, i)
+    for i in range(40)
+)
+
+
+def _blob(size):
+    data = base64.b64encode(random.Random(7).randbytes(size))
+    return b'\n'.join(data[i:i + 76] for i in range(0, len(data), 76))
+
+
+@pytest.mark.parametrize('name, kind', [
+    ('app.min.js', MINIFIED), ('vendor.bundle.js', MINIFIED), ('package-lock.json', GENERATED),
+    ('Cargo.lock', GENERATED), ('service_pb2.py', GENERATED), ('api.pb.go', GENERATED),
+    ('models.g.dart', GENERATED), ('main.py', TEXT), ('locksmith.py', TEXT)
+])
+def test_names(name, kind):
+    assert classify_name(name) == kind
+    assert classify(SOURCE, name) == kind
+
+
+def test_source_code_is_text():
+    assert classify(SOURCE, 'views.py') == TEXT
+    assert classify(b'', 'empty.py') == TEXT
+
+
+def test_binary_data():
+    assert classify(b'PK\x03\x04\0\0' + SOURCE) == BINARY
+    assert classify(bytes(range(1, 8)) * 200 + SOURCE[:200]) == BINARY
+
+
+def test_long_lines_are_minified():
+    assert classify(b'var a=1;' * (MAX_LINE_LENGTH // 4)) == MINIFIED
+    # Many lines just under the limit still average far above a third of it
+    line = b'x' * (MAX_LINE_LENGTH - 1) + b'\n'
+    assert classify(line * 3) == MINIFIED
+
+
+def test_cut_off_last_line_is_ignored_when_truncated():
+    head = SOURCE[:400] + b'"' + b'a' * (MAX_LINE_LENGTH + 100)
+    assert classify(head, truncated=True) == TEXT
+    assert classify(head, truncated=False) == MINIFIED
+
+
+def test_generated_markers_are_only_read_from_the_header():
+    assert classify(b'// Code generated by protoc-gen-go. DO NOT EDIT.\n' + SOURCE) == GENERATED
+    assert classify(b'# @generated by tooling\n' + SOURCE) == GENERATED
+    assert classify(b'# please do not edit the tests\n' + SOURCE) == TEXT
+    assert classify(SOURCE[:2000] + b'# This file was generated\n') == TEXT
+
+
+def test_dense_text_is_embedded_data():
+    assert classify(b'DATA = """\n' + _blob(3000) + b'\n"""\n', 'fixtures.py') == GENERATED
+    assert classify(_blob(300), 'short.py') == TEXT
+
+
+def test_statistics_skip_sniffed_files(tmp_path):
+    (tmp_path / 'views.py').write_bytes(SOURCE)
+    clean = CodebaseAnalyzer().analyze_codebase(str(tmp_path))['statistics']
+    (tmp_path / 'app.min.js').write_bytes(b'var a=1;' * 10)
+    (tmp_path / 'fixtures.py').write_bytes(b'DATA = """\n' + _blob(3000) + b'\n"""\n')
+    (tmp_path / 'blob.py').write_bytes(b'\0\1\2' * 100)
+
+    statistics = CodebaseAnalyzer().analyze_codebase(str(tmp_path))['statistics']
+    assert statistics['skipped_files'] == {BINARY: 1, MINIFIED: 1, GENERATED: 1}
+    assert statistics['file_count_by_language'] == {'python': 1}
+    assert statistics['total_lines'] == clean['total_lines']
+    assert {entry['path']: entry['kind'] for entry in statistics['skipped_paths']} == {
+        'app.min.js': MINIFIED, 'fixtures.py': GENERATED, 'blob.py': BINARY
+    }
@@ -0,0 +1,79 @@
+import pytest
+
+from github_handler import GitHubHandler
+from load_test import build_fixtures, compare_baseline, percentile, saturation_points
+
+
+@pytest.fixture(scope='module')
+def fixture_repo(tmp_path_factory):
+    # Spaces and non-ASCII characters are percent-encoded in the file:// URL
+    root = tmp_path_factory.mktemp('load test') / 'dépôts'
+    root.mkdir()
+    return build_fixtures(root, 1, 6)[0]
+
+
+@pytest.mark.parametrize('url', [
+    'https://github.com/octo/docs', 'https://github.com/octo/docs.git', 'git@github.com:octo/docs.git',
+    'github.com/octo/docs', 'octo/docs'
+])
+def test_github_urls_are_normalized(url):
+    assert GitHubHandler(allow_local=False).extract_repo_details_from_url(url) == {
+        'owner': 'octo', 'repo': 'docs', 'url': 'https://github.com/octo/docs.git'
+    }
+
+
+def test_local_repositories_need_the_test_hook(fixture_repo, monkeypatch):
+    assert not GitHubHandler(allow_local=False).is_valid_github_url(fixture_repo['url'])
+    assert GitHubHandler(allow_local=True).is_valid_github_url(fixture_repo['url'])
+    assert not GitHubHandler(allow_local=True).is_valid_github_url('relative/repo.git/extra')
+
+    monkeypatch.setenv('DOCSMITH_ALLOW_LOCAL_REPOS', '1')
+    assert GitHubHandler().allow_local
+
+
+def test_fixture_url_round_trips_through_clone(fixture_repo, tmp_path):
+    assert fixture_repo['url'].startswith('file://') and '%20' in fixture_repo['url']
+    handler = GitHubHandler(allow_local=True)
+
+    path = handler.clone_repository(fixture_repo['url'], 'main', dest_dir=str(tmp_path / 'clone'))
+    assert path == str(tmp_path / 'clone')
+    assert handler.resolve_commit(fixture_repo['url'], 'main') == handler.get_head_commit(path)
+
+    info = handler.get_repository_info(path)
+    assert (info['owner'], info['repo_name'], info['branch']) == ('local', 'repo_0', 'main')
+    assert info['last_commit']['message'] == 'Synthetic fixture'
+
+
+def test_fixture_carries_an_archive_and_a_snippet(fixture_repo):
+    assert fixture_repo['zip'][:2] == b'PK'
+    assert fixture_repo['snippet'].strip()
+
+
+def test_unknown_branch_does_not_resolve(fixture_repo):
+    handler = GitHubHandler(allow_local=True)
+    assert handler.resolve_commit(fixture_repo['url'], 'no-such-branch') is None
+    assert handler.resolve_commit('file:///no/such/repo.git', 'main') is None
+
+
+def test_percentile():
+    assert percentile([], 95) == 0.0
+    assert percentile(list(range(1, 101)), 50) == 51
+    assert percentile([3.0, 1.0, 2.0], 95) == 3.0
+
+
+def _level(rps):
+    return {'stage': {'throughput_rps': rps, 'p95_s': 1.0}}
+
+
+def test_saturation_is_the_last_level_that_still_scaled():
+    levels = {1: _level(10), 2: _level(19), 4: _level(20), 8: _level(40)}
+    assert saturation_points(levels, ['stage']) == {'stage': 2}
+    assert saturation_points({1: _level(10), 2: _level(20)}, ['stage']) == {'stage': None}
+
+
+def test_baseline_regressions_beyond_the_tolerance():
+    baseline = {'levels': {'4': {'stage': {'throughput_rps': 20.0, 'p95_s': 1.0}}}}
+    report = {'levels': {'4': {'stage': {'throughput_rps': 17.0, 'p95_s': 1.3}}, '8': _level(1)}}
+    assert len(compare_baseline(report, baseline, 0.2)) == 1
+    assert len(compare_baseline(report, baseline, 0.1)) == 2
+    assert compare_baseline(report, baseline, 0.5) == []
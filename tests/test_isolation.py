@@ -0,0 +1,128 @@
+import threading
+import time
+from io import BytesIO
+
+import pytest
+
+import admission
+from admission import MAX_RETRY_AFTER, AdmissionController, Overloaded, StageLimiter
+from isolation import DEFAULT_START_METHOD, IsolatedRunner, ResourceLimitExceeded
+from metrics import metrics
+
+
+def _square(value):
+    metrics.inc('test_isolated_calls_total')
+    return value * value
+
+
+def _fail():
+    raise KeyError('missing')
+
+
+def _allocate():
+    return len(bytearray(512 * 1024 * 1024))
+
+
+def _sleep():
+    time.sleep(10)
+
+
+@pytest.fixture(scope='module')
+def runner():
+    runner = IsolatedRunner('test', timeout=5, memory_bytes=256 * 1024 * 1024)
+    runner.warm()
+    return runner
+
+
+def test_results_and_child_metrics_come_back(runner):
+    before = metrics.get('test_isolated_calls_total')
+    assert runner.run(_square, 7) == 49
+    assert metrics.get('test_isolated_calls_total') == before + 1
+
+
+def test_child_exceptions_are_reraised(runner):
+    with pytest.raises(KeyError):
+        runner.run(_fail)
+
+
+def test_memory_limit_stops_the_child(runner):
+    with pytest.raises(ResourceLimitExceeded, match='memory'):
+        runner.run(_allocate)
+
+
+def test_time_limit_kills_the_child():
+    runner = IsolatedRunner('test', timeout=0.5)
+    started = time.monotonic()
+    with pytest.raises(ResourceLimitExceeded, match='longer than 0.5 seconds'):
+        runner.run(_sleep)
+    assert time.monotonic() - started < 5
+
+
+def test_disabled_runner_calls_in_process():
+    runner = IsolatedRunner('test', enabled=False)
+    assert runner.run(threading.get_ident) == threading.get_ident()
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv('DOCSMITH_ANALYSIS_ISOLATION', 'false')
+    monkeypatch.setenv('DOCSMITH_ANALYSIS_MEMORY_MB', '0')
+    runner = IsolatedRunner.from_env('analysis', preload=['analysis_warmup'])
+    assert not runner.enabled and runner.memory_bytes is None
+    assert runner.start_method == DEFAULT_START_METHOD and runner.preload == ['analysis_warmup']
+
+
+def test_full_stage_rejects_with_retry_after():
+    limiter = StageLimiter('llm', concurrency=1, max_queue=1, max_wait=0.1)
+    with limiter.slot():
+        # One caller may queue, and gives up after max_wait
+        with pytest.raises(Overloaded) as error:
+            with limiter.slot():
+                pass
+        assert error.value.stage == 'llm' and error.value.retry_after >= 1
+    with limiter.slot():
+        assert limiter.to_dict()['active'] == 1
+    assert limiter.to_dict()['active'] == 0
+
+
+def test_full_queue_rejects_without_waiting():
+    limiter = StageLimiter('clone', concurrency=1, max_queue=1, max_wait=5)
+    release = threading.Event()
+
+    def hold():
+        with limiter.slot():
+            release.wait(5)
+
+    holders = [threading.Thread(target=hold) for _ in range(2)]
+    for holder in holders:
+        holder.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    with pytest.raises(Overloaded):
+        with limiter.slot():
+            pass
+    assert time.monotonic() - started < 1
+    release.set()
+    for holder in holders:
+        holder.join(5)
+
+
+def test_retry_after_grows_with_the_queue():
+    limiter = StageLimiter('analysis', concurrency=2, max_queue=8, max_wait=1)
+    limiter._average_seconds = 10
+    assert limiter.retry_after(0) == 5
+    assert limiter.retry_after(3) == 20
+    assert limiter.retry_after(1000) == MAX_RETRY_AFTER
+    with pytest.raises(Overloaded):
+        limiter.check(8)
+    limiter.check(7)
+
+
+def test_overloaded_requests_get_429(client, monkeypatch):
+    stages = {'analysis': StageLimiter('analysis', concurrency=1, max_queue=0, max_wait=0)}
+    monkeypatch.setattr(admission, '_admission', AdmissionController(stages))
+    response = client.post('/upload-files', data={'files[]': [(BytesIO(b'x = 1\n'), 'a.py')]},
+                           content_type='multipart/form-data')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
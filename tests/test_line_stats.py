@@ -0,0 +1,61 @@
+import pytest
+
+import line_stats
+from file_sniffer import BINARY
+from line_stats import HEAD_BYTES, scan_line_stats
+
+PYTHON = b'# header\n\nimport os\n    # indented comment\n  \ndef f():\n    return 1\n'
+
+
+def _text_counts(text: str, comment_prefixes):
+    lines = text.split('\n')
+    blank = sum(1 for line in lines if not line.strip())
+    comments = sum(1 for line in lines if line.lstrip(' \t').startswith(comment_prefixes))
+    return len(lines), blank, comments
+
+
+@pytest.mark.parametrize('mmap_threshold', [10**9, 1])
+def test_counts_match_the_text_path(tmp_path, monkeypatch, mmap_threshold):
+    monkeypatch.setattr(line_stats, 'MMAP_THRESHOLD', mmap_threshold)
+    path = tmp_path / 'a.py'
+    path.write_bytes(PYTHON)
+
+    stats = scan_line_stats(path, len(PYTHON), 'python')
+    assert (stats.lines, stats.blank_lines, stats.comment_lines) == _text_counts(PYTHON.decode(), ('#',))
+    assert stats.bytes_read == len(PYTHON) and stats.head == PYTHON
+
+
+def test_slash_comments_and_crlf(tmp_path):
+    source = b'// a\r\n/* b\r\n * c\r\n */\r\n\r\nint x;\r\n'
+    path = tmp_path / 'a.c'
+    path.write_bytes(source)
+    stats = scan_line_stats(path, len(source), 'c')
+    assert (stats.lines, stats.blank_lines, stats.comment_lines) == (7, 2, 4)
+
+
+def test_unknown_language_counts_no_comments(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_bytes(b'# not a comment here\n')
+    assert scan_line_stats(path, 21, 'text').comment_lines == 0
+
+
+def test_large_file_keeps_only_the_head(tmp_path, monkeypatch):
+    monkeypatch.setattr(line_stats, 'MMAP_THRESHOLD', 1024)
+    source = b'x = 1\n' * 10000
+    path = tmp_path / 'big.py'
+    path.write_bytes(source)
+
+    stats = scan_line_stats(path, len(source), 'python')
+    assert stats.lines == 10001
+    assert stats.head == source[:HEAD_BYTES]
+
+
+@pytest.mark.parametrize('mmap_threshold', [10**9, 1])
+def test_binary_files_are_not_counted(tmp_path, monkeypatch, mmap_threshold):
+    monkeypatch.setattr(line_stats, 'MMAP_THRESHOLD', mmap_threshold)
+    path = tmp_path / 'data.py'
+    path.write_bytes(b'\0\1\2' * 1000)
+
+    stats = scan_line_stats(path, 3000, 'python')
+    assert stats.kind == BINARY and stats.lines == 0 and stats.head == b''
+    assert scan_line_stats(path, 3000, 'python', sniff=False).lines == 1
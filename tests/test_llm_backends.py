@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from benchmark import generate_synthetic_repo
+from llm_backends import LLMCancelled, LLMTimeout, StubBackend, get_backend
+
+
+def test_stub_is_deterministic_per_prompt():
+    backend = StubBackend(output_tokens=50)
+    first = backend.complete('Explain this', model='m', max_tokens=100)
+    again = backend.complete('Explain this', model='m', max_tokens=100)
+    other = backend.complete('Explain that', model='m', max_tokens=100)
+
+    assert first.text == again.text != other.text
+    assert first.text.startswith('# Explain this')
+    assert (first.model, first.output_tokens) == ('m', 50)
+    assert first.input_tokens == max(1, len('Explain this') // 4)
+
+
+def test_stub_output_is_capped_by_max_tokens():
+    assert StubBackend(output_tokens=400).complete('p', model='m', max_tokens=20).output_tokens == 20
+
+
+def test_stub_timeout_returns_partial_text():
+    backend = StubBackend(latency=0.5)
+    with pytest.raises(LLMTimeout) as error:
+        backend.complete('Prompt', model='m', max_tokens=100, timeout=0.1)
+    full = backend._render('Prompt', 100)
+    assert 0 < len(error.value.partial) < len(full)
+    assert full.startswith(error.value.partial)
+
+
+def test_stub_cancel_stops_the_call():
+    cancel = threading.Event()
+    threading.Timer(0.05, cancel.set).start()
+    started = time.monotonic()
+    with pytest.raises(LLMCancelled):
+        StubBackend(latency=5).complete('p', model='m', max_tokens=10, cancel=cancel)
+    assert time.monotonic() - started < 1
+
+
+def test_stub_stalls_every_call_at_rate_one():
+    backend = StubBackend(stall_rate=1.0, stall_seconds=0.2)
+    started = time.monotonic()
+    backend.complete('p', model='m', max_tokens=10)
+    assert time.monotonic() - started >= 0.2
+
+
+def test_get_backend_reads_the_environment(monkeypatch):
+    monkeypatch.setenv('DOCSMITH_LLM_BACKEND', 'stub')
+    monkeypatch.setenv('DOCSMITH_STUB_OUTPUT_TOKENS', '7')
+    backend = get_backend()
+    assert isinstance(backend, StubBackend)
+    assert backend.output_tokens == 7
+
+    with pytest.raises(ValueError):
+        get_backend('nope')
+
+
+def test_synthetic_repo_is_reproducible(tmp_path):
+    first = generate_synthetic_repo(tmp_path / 'a', 60)
+    second = generate_synthetic_repo(tmp_path / 'b', 60)
+
+    files = sorted(path.relative_to(first) for path in first.rglob('*') if path.is_file())
+    assert len(files) == 60
+    assert files == sorted(path.relative_to(second) for path in second.rglob('*') if path.is_file())
+    assert all((first / name).read_bytes() == (second / name).read_bytes() for name in files)
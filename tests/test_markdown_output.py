@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+from doc_generator import OUTPUT_MANIFEST, DocumentationGenerator
+
+
+@pytest.fixture
+def generator():
+    return DocumentationGenerator()
+
+
+def _mtimes(path):
+    return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(path)}
+
+
+def _backdate(path):
+    for entry in os.scandir(path):
+        os.utime(entry.path, ns=(0, 10**9))
+
+
+def test_publish_writes_stable_files_and_a_manifest(generator, tmp_path):
+    result = generator.publish_markdown_docs({'developer_guide': 'Guide', 'api_documentation': 'API'}, str(tmp_path))
+
+    assert sorted(result['written']) == ['api_documentation', 'developer_guide'] and result['index_changed']
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'api_documentation.md', 'developer_guide.md', 'index.md', OUTPUT_MANIFEST
+    ]
+    manifest = json.loads((tmp_path / OUTPUT_MANIFEST).read_text())
+    assert manifest['documents']['developer_guide']['file'] == 'developer_guide.md'
+    assert '(developer_guide.md)' in (tmp_path / 'index.md').read_text()
+
+
+def test_unchanged_documents_are_not_rewritten(generator, tmp_path):
+    documentation = {'developer_guide': 'Guide', 'api_documentation': 'API'}
+    generator.publish_markdown_docs(documentation, str(tmp_path))
+    _backdate(tmp_path)
+    before = _mtimes(tmp_path)
+
+    result = generator.publish_markdown_docs(documentation, str(tmp_path))
+    assert result['written'] == [] and not result['index_changed']
+    assert _mtimes(tmp_path) == before
+
+
+def test_changed_documents_update_the_index(generator, tmp_path):
+    generator.publish_markdown_docs({'developer_guide': 'Guide', 'api_documentation': 'API'}, str(tmp_path))
+    _backdate(tmp_path)
+    before = _mtimes(tmp_path)
+
+    result = generator.publish_markdown_docs({'developer_guide': 'New guide'}, str(tmp_path))
+    after = _mtimes(tmp_path)
+    assert result['written'] == ['developer_guide'] and result['index_changed']
+    assert after['api_documentation.md'] == before['api_documentation.md']
+    assert after['developer_guide.md'] != before['developer_guide.md']
+    # Doc types not regenerated keep their files
+    assert set(result['files']) == {'developer_guide', 'api_documentation'}
+
+
+def test_edited_or_deleted_files_are_rewritten(generator, tmp_path):
+    generator.publish_markdown_docs({'developer_guide': 'Guide'}, str(tmp_path))
+    (tmp_path / 'developer_guide.md').write_text('edited by hand, longer than before')
+    assert generator.publish_markdown_docs({'developer_guide': 'Guide'}, str(tmp_path))['written'] == [
+        'developer_guide'
+    ]
+
+    (tmp_path / 'developer_guide.md').unlink()
+    assert generator.publish_markdown_docs({'developer_guide': 'Guide'}, str(tmp_path))['written'] == [
+        'developer_guide'
+    ]
+
+
+def test_incremental_mode_of_generate_markdown_docs(generator, tmp_path):
+    files = generator.generate_markdown_docs({'developer_guide': 'Guide'}, str(tmp_path), incremental=True)
+    assert files == {'developer_guide': str(tmp_path / 'developer_guide.md')}
+    first = (tmp_path / 'developer_guide.md').read_text()
+    generator.generate_markdown_docs({'developer_guide': 'Guide'}, str(tmp_path), incremental=True)
+    assert (tmp_path / 'developer_guide.md').read_text() == first
@@ -0,0 +1,85 @@
+import os
+import time
+
+import pytest
+
+import markdown_renderer
+from markdown_renderer import _render, evict_rendered, is_safe_url, load_rendered, render_markdown
+
+
+@pytest.mark.parametrize('payload', [
+    '[x](javascript:alert(1))',
+    '[x](&#106;avascript:alert(1))',
+    '[x](java&#x09;script:alert(1))',
+    '[a](JaVaScRiPt&colon;alert(1))',
+    '[a](&#x6A;avascript&#x3A;alert(1))',
+    '[a]( \x01javascript:alert(1))',
+    '![i](data:text/html;base64,PHNjcmlwdD4=)',
+    '[v](vbscript:msgbox(1))'
+])
+def test_unsafe_links_are_dropped(payload):
+    html = ''.join(_render(payload)['sections'])
+    assert 'href="#"' in html or 'src="#"' in html
+    assert 'script' not in html and 'data:' not in html
+
+
+@pytest.mark.parametrize('url', [
+    'https://example.com/?a=1&b=2', 'http://example.com', 'mailto:docs@example.com',
+    '#usage', '/docs', './README.md', '../api.md', 'docs/setup.md#install'
+])
+def test_safe_links_are_kept(url):
+    assert is_safe_url(url)
+    assert f'href="{url.replace("&", "&amp;")}"' in ''.join(_render(f'[x]({url})')['sections'])
+
+
+def test_evict_rendered_by_ttl_and_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(markdown_renderer, 'RENDER_DIR', str(tmp_path))
+    old, recent = render_markdown('# Old'), render_markdown('# Recent')
+    stale = time.time() - 3600
+    for path in tmp_path.glob(f'{old}.*'):
+        os.utime(path, (stale, stale))
+
+    assert evict_rendered(ttl=600) == 1
+    assert not list(tmp_path.glob(f'{old}.*'))
+    assert load_rendered(recent) is not None
+
+    assert evict_rendered(ttl=600, max_bytes=0) == 1
+    assert not any(tmp_path.iterdir())
+
+
+def test_sections_split_before_top_level_headings_with_a_toc():
+    rendered = _render('# Guide\nIntro\n## Setup\n### Install\nSteps\n## Usage\nRun it')
+    assert [entry['title'] for entry in rendered['toc']] == ['Guide', 'Setup', 'Install', 'Usage']
+    assert [entry['level'] for entry in rendered['toc']] == [1, 2, 3, 2]
+    assert len(rendered['sections']) == 3
+    assert rendered['sections'][1].startswith('<h2 id="setup">') and '<h3' in rendered['sections'][1]
+
+
+def test_raw_html_is_escaped():
+    html = ''.join(_render('<script>alert(1)</script>\n\nText <b onclick="x()">bold</b>')['sections'])
+    assert '<script>' not in html and '<b ' not in html and '&lt;script&gt;' in html
+
+
+def test_renderings_are_shared_through_the_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(markdown_renderer, 'RENDER_DIR', str(tmp_path))
+    digest = render_markdown('# Title\n\nBody')
+    assert render_markdown('# Title\n\nBody') == digest != render_markdown('# Other')
+    assert (tmp_path / f'{digest}.md').read_text() == '# Title\n\nBody'
+
+    # Another worker process starts with an empty memory cache
+    monkeypatch.setattr(markdown_renderer, '_memory', markdown_renderer.OrderedDict())
+    rendered = load_rendered(digest)
+    assert rendered['digest'] == digest and rendered['toc'][0]['title'] == 'Title'
+    assert load_rendered('0' * 64) is None
+
+
+def test_rendered_endpoint_serves_immutable_etags(client, flask_app):
+    digest = render_markdown('# Served')
+    response = client.get(f'/rendered/{digest}')
+    assert response.status_code == 200 and response.get_json()['digest'] == digest
+    assert response.headers['ETag'] == f'"{digest}"'
+    assert 'immutable' in response.headers['Cache-Control']
+
+    assert client.get(f'/rendered/{digest}', headers={'If-None-Match': f'"{digest}"'}).status_code == 304
+    assert client.get('/rendered/not-a-digest').status_code == 400
+    assert client.get(f'/rendered/{"0" * 64}').status_code == 404
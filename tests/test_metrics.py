@@ -0,0 +1,102 @@
+import multiprocessing
+
+from metrics import (
+    MetricsRegistry, MetricsStore, UsageMeter, current_trace, end_trace, meter_usage, record_file_read,
+    record_llm_usage, span, start_trace
+)
+
+
+def _worker(directory, started, finish):
+    registry = MetricsRegistry()
+    registry.inc('docsmith_llm_requests_total', 2, model='m')
+    registry.observe('docsmith_phase_duration_seconds', 0.2, phase='p')
+    registry.set('docsmith_workspaces', 3)
+    MetricsStore(registry, directory).flush()
+    started.set()
+    finish.wait(10)
+
+
+def test_store_sums_live_and_exited_workers(tmp_path):
+    context = multiprocessing.get_context('fork')
+    started, finish = context.Event(), context.Event()
+    worker = context.Process(target=_worker, args=(str(tmp_path), started, finish))
+    worker.start()
+    assert started.wait(10)
+
+    registry = MetricsRegistry()
+    registry.inc('docsmith_llm_requests_total', 1, model='m')
+    store = MetricsStore(registry, str(tmp_path))
+
+    live = store.collect()
+    assert live.get('docsmith_llm_requests_total', model='m') == 3
+    assert f'docsmith_workspaces{{pid="{worker.pid}"}} 3' in live.render_prometheus()
+
+    finish.set()
+    worker.join(10)
+    # The exited worker's counters and histograms stay; its gauges go
+    for _ in range(2):
+        exited = store.collect()
+        assert exited.get('docsmith_llm_requests_total', model='m') == 3
+        rendered = exited.render_prometheus()
+        assert 'docsmith_phase_duration_seconds_count{phase="p"} 1' in rendered
+        assert 'docsmith_workspaces' not in rendered
+    assert [path.name for path in tmp_path.glob('*-*.json')] == []
+
+
+def test_usage_meter_collects_calls_in_its_block():
+    record_llm_usage('outside', 1, 1)
+    with meter_usage() as usage:
+        record_llm_usage('m', 100, 20)
+        record_llm_usage('m', 50, 10)
+    record_llm_usage('after', 1, 1)
+    assert isinstance(usage, UsageMeter)
+    assert usage.calls == [('m', 100, 20), ('m', 50, 10)]
+    assert usage.tokens == 180
+
+
+def test_counters_and_histograms_render_in_prometheus_format():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.inc('docsmith_llm_requests_total', model='a"b')
+    registry.inc('docsmith_llm_requests_total', 2, model='a"b')
+    registry.observe('docsmith_phase_duration_seconds', 0.5, phase='scan')
+    registry.observe('docsmith_phase_duration_seconds', 2.0, phase='scan')
+
+    lines = registry.render_prometheus().splitlines()
+    assert '# TYPE docsmith_llm_requests_total counter' in lines
+    assert 'docsmith_llm_requests_total{model="a\\"b"} 3' in lines
+    assert 'docsmith_phase_duration_seconds_bucket{phase="scan",le="0.1"} 0' in lines
+    assert 'docsmith_phase_duration_seconds_bucket{phase="scan",le="1"} 1' in lines
+    assert 'docsmith_phase_duration_seconds_bucket{phase="scan",le="+Inf"} 2' in lines
+    assert 'docsmith_phase_duration_seconds_sum{phase="scan"} 2.500000' in lines
+
+
+def test_merge_adds_another_registry_snapshot():
+    parent, child = MetricsRegistry(), MetricsRegistry()
+    parent.inc('docsmith_files_read_total', 2)
+    child.inc('docsmith_files_read_total', 3)
+    child.observe('docsmith_phase_duration_seconds', 0.01, phase='p')
+    child.set('docsmith_workspaces', 9)
+
+    parent.merge(child.snapshot())
+    assert parent.get('docsmith_files_read_total') == 5
+    rendered = parent.render_prometheus()
+    assert 'docsmith_phase_duration_seconds_count{phase="p"} 1' in rendered
+    assert 'docsmith_workspaces' not in rendered
+
+
+def test_span_records_phase_into_the_request_trace():
+    trace = start_trace()
+    try:
+        with span('analyze.structure'):
+            pass
+        with span('docs.generate', doc_type='api'):
+            pass
+        record_file_read(100)
+    finally:
+        end_trace()
+
+    summary = trace.to_dict()
+    assert summary['phases']['analyze.structure']['count'] == 1
+    assert summary['phases']['docs.generate[doc_type=api]']['count'] == 1
+    assert summary['counters'] == {'files_read': 1, 'bytes_read': 100}
+    assert current_trace() is None
@@ -0,0 +1,58 @@
+import pytest
+
+from model_router import FREE_TIER_MAX_TOKENS, ModelRouter, Route, estimate_cost
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(small_model='small', large_model='large', small_task_tokens=1000)
+
+
+def test_fixed_routes(router):
+    assert router.route('explain_chunk', 50000) == Route('explain_chunk', 'small', 1200)
+    assert router.route('architecture_overview', 10) == Route('architecture_overview', 'large', 4000)
+    assert router.route('unknown_task', 10) == Route('unknown_task', 'large', 4000)
+
+
+@pytest.mark.parametrize('prompt_tokens, tier, expected', [
+    (1000, 'standard', ('small', 1500)),
+    (1001, 'standard', ('large', 3000)),
+    (10, 'pro', ('large', 3000)),
+    (5000, 'free', ('small', FREE_TIER_MAX_TOKENS)),
+])
+def test_auto_routes_pick_by_prompt_size_and_tier(router, prompt_tokens, tier, expected):
+    route = router.route('explanation', prompt_tokens, tier)
+    assert (route.model, route.max_tokens) == expected
+
+
+def test_free_tier_only_uses_the_small_model(router):
+    assert router.route('developer_guide', 10, 'free') == Route('developer_guide', 'small', FREE_TIER_MAX_TOKENS)
+
+
+def test_routes_from_the_environment(monkeypatch):
+    monkeypatch.setenv('DOCSMITH_SMALL_MODEL', 'tiny')
+    monkeypatch.setenv('DOCSMITH_MODEL_ROUTES', '{"developer_guide": {"model": "small"}, '
+                                                '"changelog": {"model": "custom-model", "max_tokens": 500}}')
+    router = ModelRouter.from_env()
+    assert router.route('developer_guide', 10) == Route('developer_guide', 'tiny', 4000)
+    assert router.route('changelog', 10) == Route('changelog', 'custom-model', 500)
+
+
+def test_latency_percentile_needs_enough_samples(router):
+    route = router.route('explain_chunk', 10)
+    for index in range(19):
+        router.record(route, index / 10, 100, 50)
+    assert router.latency_percentile(route, 95) is None
+
+    router.record(route, 1.9, 100, 50)
+    assert router.latency_percentile(route, 95) == 1.9
+    assert router.latency_percentile(route, 50) == 1.0
+    assert router.latency_percentile(router.route('explain_chunk', 10, 'pro'), 95) == 1.9
+
+    latencies, outputs = router.usage_history(route)
+    assert len(latencies) == 20 and outputs == [50] * 20
+
+
+def test_estimate_cost_uses_per_million_prices():
+    assert estimate_cost('claude-3-5-sonnet-20241022', 1_000_000, 100_000) == pytest.approx(4.5)
+    assert estimate_cost('unknown', 1_000_000, 1_000_000) == 0
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+from preanalysis import PreAnalysisPool
+
+
+def _prepared(path):
+    return {'project_summary': f'summary of {path}', 'prompt_tokens': 42}
+
+
+def test_finished_job_reports_its_result():
+    pool = PreAnalysisPool(_prepared)
+    finished = threading.Event()
+    job = pool.submit('w1', '/repo', on_finish=finished.set)
+
+    assert job.result(timeout=5) == _prepared('/repo')
+    assert finished.wait(5)
+    status = job.status()
+    assert status['state'] == 'done' and status['prompt_tokens'] == 42
+    assert pool.get(job.id) is job and pool.get(None) is None
+    pool.shutdown()
+
+
+def test_running_job_is_joined_by_the_same_key():
+    release = threading.Event()
+    calls = []
+
+    def prepare(path):
+        calls.append(path)
+        release.wait(5)
+        return _prepared(path)
+
+    pool = PreAnalysisPool(prepare)
+    first = pool.submit('w1', '/repo')
+    joined = []
+    second = pool.submit('w1', '/repo', on_finish=lambda: joined.append(True))
+    release.set()
+
+    assert second is first and joined == [True]
+    first.result(timeout=5)
+    assert calls == ['/repo']
+    assert pool.submit('w1', '/other').id != first.id
+    pool.shutdown()
+
+
+def test_finished_jobs_of_changing_directories_are_not_reused():
+    calls = []
+    pool = PreAnalysisPool(lambda path: calls.append(path) or _prepared(path))
+    first = pool.submit('/repo', '/repo', reuse_finished=False)
+    first.result(timeout=5)
+
+    again = pool.submit('/repo', '/repo', reuse_finished=False)
+    again.result(timeout=5)
+    assert again is not first and calls == ['/repo', '/repo']
+    assert pool.submit('/repo', '/repo') is again
+    pool.shutdown()
+
+
+def test_failed_jobs_report_the_error_and_are_retried():
+    attempts = []
+
+    def prepare(path):
+        attempts.append(path)
+        if len(attempts) == 1:
+            raise ValueError('unreadable')
+        return _prepared(path)
+
+    pool = PreAnalysisPool(prepare)
+    failed = pool.submit('w1', '/repo')
+    with pytest.raises(ValueError):
+        failed.result(timeout=5)
+    assert failed.status() == {'job_id': failed.id, 'state': 'failed', 'error': 'unreadable'}
+
+    retried = pool.submit('w1', '/repo')
+    assert retried is not failed and retried.result(timeout=5) == _prepared('/repo')
+    pool.shutdown()
+
+
+def test_only_the_most_recent_jobs_are_kept():
+    pool = PreAnalysisPool(_prepared, max_jobs=2)
+    jobs = [pool.submit(f'w{index}', f'/repo{index}') for index in range(3)]
+    for job in jobs:
+        job.result(timeout=5)
+
+    assert pool.get(jobs[0].id) is None
+    assert [job['key'] for job in pool.jobs()] == ['w1', 'w2']
+    pool.shutdown()
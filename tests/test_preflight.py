@@ -0,0 +1,102 @@
+import pytest
+
+from code_analyzer import count_tokens
+from model_router import ModelRouter, estimate_cost
+from preflight import INSTRUCTIONS_MARKER, PreflightPlanner, TenantLedger, trim_prompt
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return TenantLedger(daily_tokens=1000, daily_cost=1.0, path=str(tmp_path / 'ledger.sqlite3'))
+
+
+def test_reserve_refuses_what_does_not_fit(ledger):
+    assert ledger.reserve('t', 800, 0.5)
+    assert not ledger.reserve('t', 300, 0.1)
+    assert ledger.remaining('t') == {'tokens': 200, 'cost_usd': pytest.approx(0.5)}
+
+
+def test_settle_refunds_unused_reservation(ledger):
+    ledger.reserve('t', 800, 0.5)
+    ledger.settle('t', 800, 0.5, 100, 0.05)
+    assert ledger.remaining('t') == {'tokens': 900, 'cost_usd': pytest.approx(0.95)}
+
+
+def test_settle_charges_overrun_past_the_budget(ledger):
+    ledger.reserve('t', 800, 0.5)
+    ledger.settle('t', 800, 0.5, 1500, 0.7)
+    assert ledger.remaining('t') == {'tokens': 0, 'cost_usd': pytest.approx(0.3)}
+    assert not ledger.reserve('t', 1, 0.0)
+
+
+def test_settle_without_usage_refunds_everything(ledger):
+    ledger.reserve('t', 800, 0.5)
+    ledger.settle('t', 800, 0.5, 0, 0.0)
+    assert ledger.remaining('t') == {'tokens': 1000, 'cost_usd': pytest.approx(1.0)}
+
+
+def test_ledger_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'ledger.sqlite3')
+    first = TenantLedger(daily_tokens=1000, path=path)
+    second = TenantLedger(daily_tokens=1000, path=path)
+    assert first.reserve('t', 600, 0.0)
+    assert not second.reserve('t', 600, 0.0)
+    assert second.remaining('t')['tokens'] == 400
+
+
+def _prompt(context_words):
+    return "\n        Document this codebase:\n" + "module handler " * context_words + INSTRUCTIONS_MARKER + \
+        "\n        1. An overview\n        2. Setup steps\n"
+
+
+def _route_for(router):
+    return lambda doc_type, prompt: router.route(doc_type, count_tokens(prompt))
+
+
+def test_trim_prompt_keeps_the_instructions_within_budget():
+    prompt = _prompt(3000)
+    trimmed = trim_prompt(prompt, 500)
+    assert count_tokens(trimmed) <= 500
+    assert trimmed.endswith(prompt[prompt.rfind(INSTRUCTIONS_MARKER):])
+    assert 'tokens of codebase context omitted' in trimmed
+    assert count_tokens(trim_prompt('no instructions ' * 1000, 100)) <= 100
+
+
+def test_plan_sends_trims_and_rejects():
+    router = ModelRouter()
+    planner = PreflightPlanner(router, max_prompt_tokens=1500, min_trimmed_tokens=200)
+    prompts = {'developer_guide': _prompt(100), 'api_documentation': _prompt(3000)}
+    plan = planner.plan(prompts, ['developer_guide', 'api_documentation', 'missing'], _route_for(router))
+
+    assert plan['doc_types'] == ['developer_guide', 'api_documentation']
+    assert plan['sections']['developer_guide']['action'] == 'send'
+    assert plan['prompts']['developer_guide'] == prompts['developer_guide']
+    assert plan['sections']['api_documentation']['action'] == 'trim'
+    assert count_tokens(plan['prompts']['api_documentation']) <= 1500
+    assert plan['totals']['input_tokens'] == sum(count_tokens(prompt) for prompt in plan['prompts'].values())
+
+
+def test_plan_spends_the_tenant_budget_in_order():
+    router = ModelRouter()
+    planner = PreflightPlanner(router, min_trimmed_tokens=200)
+    prompts = {'developer_guide': _prompt(100), 'api_documentation': _prompt(100)}
+    first = planner.plan(prompts, ['developer_guide'], _route_for(router))['totals']
+    remaining = {'tokens': first['input_tokens'] + first['output_tokens'] + 100, 'cost_usd': 10.0}
+
+    plan = planner.plan(prompts, ['developer_guide', 'api_documentation'], _route_for(router), remaining)
+    assert plan['doc_types'] == ['developer_guide']
+    assert plan['sections']['api_documentation']['action'] == 'reject'
+
+
+def test_estimates_use_recorded_history():
+    router = ModelRouter()
+    planner = PreflightPlanner(router, tokens_per_second=100)
+    route = router.route('developer_guide', 10)
+    assert planner.estimate(route, 1000)['output_tokens'] == route.max_tokens // 2
+    assert planner.estimate(route, 1000)['estimate_source'] == 'default'
+
+    for _ in range(5):
+        router.record(route, 4.0, 1000, 800)
+    estimate = planner.estimate(route, 1000)
+    assert (estimate['output_tokens'], estimate['latency_seconds'], estimate['estimate_source']) == (800, 4.0, 'history')
+    assert estimate['cost_usd'] == round(estimate_cost(route.model, 1000, 800), 6)
@@ -0,0 +1,54 @@
+import json
+
+from profiling import ProfileRun, is_valid_run_id, list_profiles, profile_path, profile_summary
+
+
+def _busy():
+    return sum(i * i for i in range(20000))
+
+
+def test_profile_run_saves_profile_and_metadata(tmp_path):
+    with ProfileRun('analysis', profile_dir=str(tmp_path), metadata={'doc_types': ['api']}) as run:
+        _busy()
+
+    assert is_valid_run_id(run.run_id)
+    assert profile_path(run.run_id, str(tmp_path)) == tmp_path / f'{run.run_id}.prof'
+    metadata = json.loads((tmp_path / f'{run.run_id}.json').read_text())
+    assert metadata['label'] == 'analysis' and metadata['doc_types'] == ['api'] and not metadata['failed']
+    assert [profile['run_id'] for profile in list_profiles(str(tmp_path))] == [run.run_id]
+
+    summary = profile_summary(run.run_id, top=3, sort='calls', profile_dir=str(tmp_path))
+    assert len(summary['functions']) == 3
+    calls = [row['calls'] for row in summary['functions']]
+    assert calls == sorted(calls, reverse=True)
+
+
+def test_only_one_profile_runs_at_a_time(tmp_path):
+    with ProfileRun('outer', profile_dir=str(tmp_path)) as outer:
+        with ProfileRun('inner', profile_dir=str(tmp_path)) as inner:
+            pass
+    assert outer.run_id is not None and inner.run_id is None
+    assert len(list_profiles(str(tmp_path))) == 1
+
+
+def test_malformed_run_ids_are_rejected(tmp_path):
+    (tmp_path / 'secret.prof').write_text('x')
+    for run_id in ('../secret', 'secret', '', 'ABCDEF12'):
+        assert profile_path(run_id, str(tmp_path)) is None
+    assert profile_summary('0123456789abcdef', profile_dir=str(tmp_path)) is None
+
+
+def test_admin_endpoints_need_the_token(client):
+    assert client.get('/admin/profiles').status_code == 403
+    assert client.get('/admin/profiles', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get('/admin/profiles', headers={'X-Admin-Token': 'test-token'}).status_code == 200
+
+
+def test_loopback_is_not_trusted_without_a_token_in_production(client, flask_app, monkeypatch):
+    monkeypatch.delenv('DOCSMITH_ADMIN_TOKEN')
+    monkeypatch.setattr(flask_app, 'TRUSTED_PROXIES', 0)
+    assert client.get('/admin/profiles', environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code == 403
+
+    monkeypatch.setattr(flask_app.app, 'debug', True)
+    assert client.get('/admin/profiles', environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code == 200
+    assert client.get('/admin/profiles', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 403
@@ -0,0 +1,44 @@
+from benchmark import generate_synthetic_repo
+from code_analyzer import CodebaseAnalyzer
+from project_preview import ProjectPreviewer
+
+
+def _analysis(path):
+    analysis = CodebaseAnalyzer().analyze_codebase(str(path))
+    return analysis['structure'], analysis['statistics'], analysis['technologies']
+
+
+def test_sampling_every_file_gives_the_exact_summary(tmp_path):
+    repo = generate_synthetic_repo(tmp_path / 'repo', 80)
+    structure, statistics, technologies = _analysis(repo)
+
+    preview = ProjectPreviewer(CodebaseAnalyzer(), budget_seconds=60, samples_per_language=1000).preview(str(repo))
+    assert preview['enumeration_complete']
+    assert preview['total_files'] == structure['total_files']
+    assert preview['sampled_files'] == sum(statistics['file_count_by_language'].values())
+    assert preview['total_lines'] == statistics['total_lines']
+    assert preview['total_lines_interval'] == [statistics['total_lines']] * 2
+    assert preview['estimated_tokens'] == statistics['estimated_tokens']
+    assert preview['lines_by_language'] == statistics['lines_by_language']
+    assert preview['technologies'] == sorted(technologies)
+
+
+def test_sampled_estimate_is_reproducible_and_brackets_the_total(tmp_path):
+    repo = generate_synthetic_repo(tmp_path / 'repo', 300)
+    _, statistics, _ = _analysis(repo)
+    previewer = ProjectPreviewer(CodebaseAnalyzer(), budget_seconds=60, samples_per_language=10)
+
+    preview = previewer.preview(str(repo))
+    assert preview['sampled_files'] < 300
+    low, high = preview['total_lines_interval']
+    assert low < preview['total_lines'] < high
+    # The sample (seeded by the path) misses a 95% interval now and then; twice the margin practically never
+    assert abs(statistics['total_lines'] - preview['total_lines']) <= 2 * (high - preview['total_lines'])
+    assert previewer.preview(str(repo))['total_lines'] == preview['total_lines']
+
+
+def test_spent_budget_reports_incomplete_enumeration(tmp_path):
+    repo = generate_synthetic_repo(tmp_path / 'repo', 40)
+    preview = ProjectPreviewer(CodebaseAnalyzer(), budget_seconds=0).preview(str(repo))
+    assert not preview['enumeration_complete']
+    assert preview['sampled_files'] == 0
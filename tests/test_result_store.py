@@ -0,0 +1,97 @@
+import hashlib
+import io
+import os
+import time
+import zipfile
+
+from result_store import ResultStore
+
+DOCUMENTS = {'developer_guide': '# Guide\n', 'api_documentation': '# API\n'}
+
+
+def _names(data: bytes):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        return {name: archive.read(name).decode() for name in archive.namelist()}
+
+
+def test_save_writes_documents_with_their_hashes(tmp_path):
+    store = ResultStore(str(tmp_path))
+    result_id = store.save(dict(DOCUMENTS, **{'../escape': 'x'}), {'project_name': 'demo'})
+
+    manifest = store.manifest(result_id)
+    assert manifest['project_summary'] == {'project_name': 'demo'}
+    assert manifest['documents']['developer_guide']['sha256'] == hashlib.sha256(b'# Guide\n').hexdigest()
+    assert store.load(result_id) == DOCUMENTS
+    assert [path.name for path in tmp_path.iterdir()] == [result_id]
+
+    for result_id in (None, '', '../x', 'A' * 32):
+        assert store.manifest(result_id) is None and store.load(result_id) is None
+
+
+def test_archive_is_built_once_and_reused(tmp_path):
+    store = ResultStore(str(tmp_path))
+    result_id = store.save(DOCUMENTS)
+    assert store.cached_archive(result_id) is None
+
+    path = store.build_archive(result_id)
+    assert store.cached_archive(result_id) == path
+    assert _names(path.read_bytes()) == {f'{name}.md': text for name, text in DOCUMENTS.items()}
+    assert store.archive_etag(store.manifest(result_id)) == store.archive_etag(store.manifest(store.save(DOCUMENTS)))
+
+
+def test_streamed_archive_is_cached_only_when_complete(tmp_path):
+    store = ResultStore(str(tmp_path))
+    result_id = store.save(DOCUMENTS)
+
+    abandoned = store.stream_archive(result_id)
+    next(abandoned)
+    abandoned.close()
+    assert store.cached_archive(result_id) is None
+    assert not list((tmp_path / result_id).glob('*.tmp'))
+
+    data = b''.join(store.stream_archive(result_id))
+    assert store.archive_path(result_id).read_bytes() == data
+    assert set(_names(data)) == {'developer_guide.md', 'api_documentation.md'}
+
+
+def test_should_stream_above_the_threshold(tmp_path):
+    store = ResultStore(str(tmp_path), stream_threshold=10)
+    assert not store.should_stream(store.manifest(store.save({'a': '123'})))
+    assert store.should_stream(store.manifest(store.save({'a': '123', 'b': '4567890'})))
+
+
+def test_expired_results_are_removed(tmp_path):
+    store = ResultStore(str(tmp_path), ttl=60)
+    old, recent = store.save(DOCUMENTS), store.save(DOCUMENTS)
+    stale = time.time() - 120
+    os.utime(tmp_path / old, (stale, stale))
+
+    assert store.evict_expired() == 1
+    assert store.manifest(old) is None and store.manifest(recent) is not None
+
+
+def test_downloads_honour_if_none_match(client, flask_app):
+    result_id = flask_app.results.save(DOCUMENTS)
+    url = f'/results/{result_id}/developer_guide.md'
+
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert response.status_code == 200 and response.get_data(as_text=True) == '# Guide\n'
+    assert etag == '"%s"' % hashlib.sha256(b'# Guide\n').hexdigest()
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(f'/results/{result_id}/missing.md').status_code == 302
+
+
+def test_archive_downloads_are_cached_and_conditional(client, flask_app, monkeypatch):
+    monkeypatch.setattr(flask_app.results, 'stream_threshold', 0)
+    result_id = flask_app.results.save(DOCUMENTS)
+    url = f'/results/{result_id}/documentation.zip'
+
+    streamed = client.get(url)
+    assert streamed.status_code == 200 and streamed.mimetype == 'application/zip'
+    assert set(_names(streamed.get_data())) == {'developer_guide.md', 'api_documentation.md'}
+    assert flask_app.results.cached_archive(result_id) is not None
+
+    cached = client.get(url)
+    assert cached.get_data() == streamed.get_data()
+    assert client.get(url, headers={'If-None-Match': cached.headers['ETag']}).status_code == 304
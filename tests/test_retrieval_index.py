@@ -0,0 +1,86 @@
+import os
+import time
+
+from retrieval_index import RetrievalIndex, evict_indexes, index_path_for, split_chunks, tokenize
+
+AUTH = '''import hashlib
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+class SessionStore:
+    def get_session(self, token):
+        return self.sessions.get(token)
+'''
+
+BILLING = '''def create_invoice(customer, amount):
+    return {'customer': customer, 'amount': amount}
+'''
+
+
+def _reader(path, max_chars):
+    try:
+        return path.read_text(encoding='utf-8')
+    except OSError:
+        return None
+
+
+def _index(tmp_path):
+    (tmp_path / 'auth.py').write_text(AUTH)
+    (tmp_path / 'billing.py').write_text(BILLING)
+    (tmp_path / 'README.md').write_text('hash password session invoice')
+    files = [('auth.py', 'python'), ('billing.py', 'python'), ('README.md', 'markdown')]
+    return RetrievalIndex.build(str(tmp_path), files, _reader)
+
+
+def test_tokenize_splits_identifiers_and_drops_stopwords():
+    assert list(tokenize('def getSessionToken(self):')) == ['getsessiontoken', 'get', 'session', 'token']
+    assert list(tokenize('hash_password')) == ['hash_password', 'hash', 'password']
+
+
+def test_chunks_start_at_definitions():
+    assert split_chunks(AUTH) == [(0, 3), (3, 7), (7, 8), (8, 11)]
+    assert split_chunks('x = 1\n' * 200) == [(0, 80), (80, 160), (160, 201)]
+
+
+def test_search_ranks_the_defining_chunk_first(tmp_path):
+    index = _index(tmp_path)
+    assert index.paths == ['auth.py', 'billing.py']
+
+    doc_id, _ = index.search('how are passwords hashed? hash_password')[0]
+    assert index.paths[index.doc_paths[doc_id]] == 'auth.py'
+    assert (index.doc_starts[doc_id], index.doc_ends[doc_id]) == (3, 7)
+    assert index.search('nothing matches here') == []
+
+
+def test_retrieve_formats_snippets_within_the_budget(tmp_path):
+    index = _index(tmp_path)
+    snippets = index.retrieve('create_invoice', 1000, _reader, count_tokens=len)
+    assert snippets.startswith('File: billing.py (lines 1-3)\ndef create_invoice')
+    assert index.retrieve('create_invoice', 10, _reader, count_tokens=len) == ''
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = _index(tmp_path)
+    path = index_path_for(str(tmp_path), str(tmp_path / 'indexes'))
+    index.save(path)
+
+    loaded = RetrievalIndex.load(path)
+    assert loaded.search('invoice') == index.search('invoice')
+    assert RetrievalIndex.load(tmp_path / 'missing.idx') is None
+
+
+def test_evict_indexes_keeps_live_codebases(tmp_path):
+    index_dir = str(tmp_path / 'indexes')
+    index = _index(tmp_path)
+    for codebase in ('live', 'gone', 'recent'):
+        index.save(index_path_for(codebase, index_dir))
+    old = time.time() - 120
+    for codebase in ('live', 'gone'):
+        os.utime(index_path_for(codebase, index_dir), (old, old))
+
+    assert evict_indexes(['live'], ttl=60, index_dir=index_dir) == 1
+    assert not index_path_for('gone', index_dir).exists()
+    assert index_path_for('live', index_dir).exists() and index_path_for('recent', index_dir).exists()
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+import pytest
+
+from deadline import deadline
+from singleflight import SingleFlight
+
+
+def _blocking(release, calls, result='done'):
+    def fn():
+        calls.append(threading.current_thread().name)
+        release.wait(5)
+        return result
+    return fn
+
+
+def _run_in_thread(target):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(target()))
+    thread.start()
+    return thread, results
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    calls = []
+    leader, leader_results = _run_in_thread(lambda: flight.do('k', _blocking(release, calls)))
+    time.sleep(0.05)
+    follower, follower_results = _run_in_thread(lambda: flight.do('k', _blocking(release, calls, 'other')))
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert leader_results == follower_results == ['done']
+
+
+def test_follower_stops_waiting_at_the_deadline():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    leader, _ = _run_in_thread(lambda: flight.do('k', _blocking(release, [])))
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    with deadline(0.1):
+        assert flight.do('k', lambda: 'own') == 'own'
+    assert time.monotonic() - started < 1
+    release.set()
+    leader.join(5)
+
+
+def test_follower_waits_at_most_max_wait():
+    flight = SingleFlight('test', max_wait=0.1)
+    release = threading.Event()
+    leader, _ = _run_in_thread(lambda: flight.do('k', _blocking(release, [])))
+    time.sleep(0.05)
+    assert flight.do('k', lambda: 'own') == 'own'
+    release.set()
+    leader.join(5)
+
+
+def test_errors_are_not_published(tmp_path):
+    flight = SingleFlight('test', store_dir=str(tmp_path))
+
+    def fail():
+        raise ValueError('clone failed')
+
+    with pytest.raises(ValueError):
+        flight.do('k', fail)
+    assert flight.do('k', lambda: 'retried') == 'retried'
+
+
+def test_results_are_shared_through_the_store(tmp_path):
+    first = SingleFlight('test', store_dir=str(tmp_path))
+    second = SingleFlight('test', store_dir=str(tmp_path))
+    assert first.do('k', lambda: {'id': 1}) == {'id': 1}
+    assert second.do('k', lambda: {'id': 2}) == {'id': 1}
+    assert second.do('other', lambda: {'id': 3}) == {'id': 3}
+
+
+def test_published_results_expire(tmp_path):
+    flight = SingleFlight('test', store_dir=str(tmp_path), result_ttl=60)
+    flight.do('k', lambda: 1)
+    for path in tmp_path.glob('*.json'):
+        os.utime(path, (time.time() - 120, time.time() - 120))
+    assert flight.do('k', lambda: 2) == 2
+
+
+def test_unserializable_results_are_returned_but_not_shared(tmp_path):
+    flight = SingleFlight('test', store_dir=str(tmp_path))
+    value = object()
+    assert flight.do('k', lambda: value) is value
+    assert list(tmp_path.glob('*.json')) == [] and list(tmp_path.glob('*.tmp')) == []
+
+
+def test_prune_removes_old_results_and_unused_locks(tmp_path):
+    flight = SingleFlight('test', store_dir=str(tmp_path), result_ttl=60)
+    flight.do('old', lambda: 1)
+    flight.do('new', lambda: 2)
+    old = time.time() - 120
+    for path in tmp_path.iterdir():
+        os.utime(path, (old, old))
+    flight.do('new', lambda: 3)
+    flight._prune()
+
+    assert len(list(tmp_path.glob('*.json'))) == 1
+    assert len(list(tmp_path.glob('*.lock'))) == 1
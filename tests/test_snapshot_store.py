@@ -0,0 +1,90 @@
+import pytest
+
+from code_analyzer import CodebaseAnalyzer
+from snapshot_store import SnapshotStore
+
+REPO = 'https://github.com/example/app'
+OTHER = 'https://github.com/example/lib'
+
+
+def _analysis(path, files):
+    path.mkdir(parents=True)
+    for name, text in files.items():
+        (path / name).write_text(text)
+    analysis = CodebaseAnalyzer().analyze_codebase(str(path))
+    return analysis, {'project_name': path.name, 'estimated_complexity': 'Low'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / 'snapshots.sqlite3'))
+
+
+@pytest.fixture
+def app_v1(tmp_path):
+    return _analysis(tmp_path / 'v1', {'app.py': 'import flask\n' * 10, 'util.js': 'let x = 1;\n' * 3})
+
+
+def test_summary_matches_the_analysis(store, app_v1):
+    analysis, summary = app_v1
+    store.save(REPO, 'c1', analysis, summary)
+
+    stored = store.summary(REPO, 'c1')
+    assert stored['total_files'] == analysis['structure']['total_files']
+    assert stored['total_lines'] == analysis['statistics']['total_lines'] == 15
+    assert stored['main_languages'] == ['python', 'javascript']
+    assert sorted(stored['technologies']) == sorted(set(analysis['technologies']))
+    assert (stored['project_name'], stored['commit']) == ('v1', 'c1')
+    assert store.has(REPO, 'c1') and not store.has(REPO, 'c2')
+    assert store.summary(OTHER) is None and store.languages(OTHER) is None
+
+
+def test_languages_and_largest_files(store, app_v1):
+    store.save(REPO, 'c1', *app_v1)
+    assert store.languages(REPO) == [
+        {'language': 'python', 'files': 1, 'lines': 11},
+        {'language': 'javascript', 'files': 1, 'lines': 4},
+    ]
+    largest = store.largest_files(REPO, limit=1)
+    assert [row['path'] for row in largest] == ['app.py'] and largest[0]['size'] == 130
+
+
+def test_saving_a_commit_again_replaces_it(store, app_v1, tmp_path):
+    store.save(REPO, 'c1', *app_v1)
+    smaller = _analysis(tmp_path / 'v2', {'app.py': 'x = 1\n'})
+    store.save(REPO, 'c1', *smaller)
+
+    assert store.summary(REPO, 'c1')['total_lines'] == 2
+    assert store.languages(REPO, 'c1') == [{'language': 'python', 'files': 1, 'lines': 2}]
+    assert len(store.repos()) == 1
+
+
+def test_rollup_counts_only_the_newest_snapshot_of_each_repo(store, app_v1, tmp_path):
+    store.save(REPO, 'c1', *app_v1)
+    store.save(REPO, 'c2', *_analysis(tmp_path / 'v2', {'app.py': 'x = 1\n'}))
+    store.save(OTHER, 'c1', *_analysis(tmp_path / 'lib', {'lib.py': 'y = 2\n' * 4}))
+
+    assert store.summary(REPO)['commit'] == 'c2'
+    assert [repo['repo'] for repo in store.repos()] == [OTHER, REPO]
+    rollup = store.rollup()
+    assert (rollup['repos'], rollup['total_files'], rollup['total_lines']) == (2, 2, 7)
+    assert rollup['languages'] == [{'language': 'python', 'repos': 2, 'files': 2, 'lines': 7}]
+    assert rollup['complexity'] == {'Low': 2}
+
+
+def test_other_processes_read_the_same_database(store, app_v1, tmp_path):
+    store.save(REPO, 'c1', *app_v1)
+    assert SnapshotStore(store.path).summary(REPO, 'c1') == store.summary(REPO, 'c1')
+
+
+def test_admin_queries(client, flask_app, app_v1):
+    flask_app.snapshots.save(REPO, 'c1', *app_v1)
+    headers = {'X-Admin-Token': 'test-token'}
+
+    assert client.get('/admin/snapshots').status_code == 403
+    assert REPO in [repo['repo'] for repo in client.get('/admin/snapshots', headers=headers).get_json()['repos']]
+    response = client.get('/admin/snapshots/languages', query_string={'repo': REPO}, headers=headers)
+    assert response.get_json()['languages'][0]['language'] == 'python'
+    assert client.get('/admin/snapshots/summary', headers=headers).status_code == 400
+    assert client.get('/admin/snapshots/other', query_string={'repo': REPO}, headers=headers).status_code == 404
+    assert client.get('/admin/snapshots/summary', query_string={'repo': OTHER}, headers=headers).status_code == 404
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from preload import preload, preload_requested
+
+ROOT = Path(__file__).parent.parent
+HEAVY_MODULES = ('anthropic', 'git', 'chardet', 'langdetect')
+
+
+def test_importing_the_app_defers_heavy_dependencies(tmp_path):
+    env = dict(os.environ, PYTHONPATH=str(ROOT), DOCSMITH_LLM_BACKEND='stub', DOCSMITH_ANALYSIS_ISOLATION='0',
+               DOCSMITH_BUILD_ASSETS='0', DOCSMITH_PRELOAD='0')
+    script = f"import sys, flask_app; print('loaded:', [m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert 'loaded: []' in result.stdout.splitlines()
+
+
+def test_preload_warms_the_tokenizer_imports_and_backend(monkeypatch):
+    monkeypatch.setenv('DOCSMITH_LLM_BACKEND', 'stub')
+    assert set(preload()) == {'tiktoken', 'imports', 'llm_backend'}
+    assert 'git' in sys.modules and 'chardet' in sys.modules
+
+
+def test_preload_skips_the_client_without_credentials(monkeypatch):
+    monkeypatch.delenv('ANTHROPIC_API_KEY', raising=False)
+    monkeypatch.setenv('DOCSMITH_LLM_BACKEND', 'anthropic')
+    assert 'llm_backend' not in preload()
+
+
+@pytest.mark.parametrize('value, expected', [('1', True), ('yes', True), ('', False), ('0', False)])
+def test_preload_is_requested_from_the_environment(monkeypatch, value, expected):
+    monkeypatch.setenv('DOCSMITH_PRELOAD', value)
+    assert preload_requested() is expected
@@ -0,0 +1,66 @@
+import json
+from io import BytesIO
+
+SOURCE = b'def greet(name):\n    """Say hello"""\n    return f"Hello {name}"\n'
+
+
+def _upload(client):
+    response = client.post('/upload-files', data={
+        'files[]': [(BytesIO(SOURCE), 'app/greet.py'), (BytesIO(b'# Greeter\n'), 'README.md')]
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def _events(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def test_sections_stream_as_they_are_generated(client, flask_app):
+    _upload(client)
+    with client.session_transaction() as session:
+        workspace_id = session['workspace_id']
+
+    response = client.post('/generate-docs/stream', data={'doc_types': ['developer_guide', 'api_documentation']})
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['X-Accel-Buffering'] == 'no'
+    events = _events(response)
+    response.close()
+
+    assert [event['event'] for event in events] == ['analysis', 'preflight', 'section', 'section', 'done']
+    assert events[0]['project_summary']['total_files'] == 2
+    assert {event['doc_type'] for event in events if event['event'] == 'section'} == {
+        'developer_guide', 'api_documentation'
+    }
+    section = events[2]
+    assert section['content']
+    assert client.get(f"/rendered/{section['rendered']}").status_code == 200
+
+    result_id = events[-1]['result_id']
+    download = client.get(f"/results/{result_id}/{section['doc_type']}.md")
+    assert download.status_code == 200 and download.get_data(as_text=True) == section['content']
+    assert flask_app.workspaces.get(workspace_id).refcount == 0
+
+
+def test_closing_the_stream_early_releases_the_workspace(client, flask_app):
+    _upload(client)
+    with client.session_transaction() as session:
+        workspace_id = session['workspace_id']
+
+    response = client.post('/generate-docs/stream', data={'doc_types': ['developer_guide']}, buffered=False)
+    first = next(response.response)
+    assert json.loads(first)['event'] == 'analysis'
+    response.close()
+    assert flask_app.workspaces.get(workspace_id).refcount == 0
+
+    # A client that leaves before the first event never starts the generator
+    response = client.post('/generate-docs/stream', data={'doc_types': ['developer_guide']}, buffered=False)
+    assert flask_app.workspaces.get(workspace_id).refcount == 1
+    response.close()
+    assert flask_app.workspaces.get(workspace_id).refcount == 0
+
+
+def test_stream_needs_a_codebase_and_doc_types(client):
+    assert client.post('/generate-docs/stream', data={'doc_types': ['developer_guide']}).status_code == 400
+    _upload(client)
+    assert client.post('/generate-docs/stream', data={}).status_code == 400
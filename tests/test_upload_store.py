@@ -0,0 +1,79 @@
+import hashlib
+
+import pytest
+
+from upload_store import EMPTY_SHA256, UploadStore, safe_relative_path
+
+
+def _entry(path, data):
+    return {'path': path, 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+
+
+def test_empty_files_need_no_chunks(tmp_path):
+    store = UploadStore(root=str(tmp_path / 'blobs'))
+    source = b'print("hello")\n'
+    upload = store.begin([_entry('pkg/__init__.py', b''), _entry('pkg/main.py', source)])
+
+    assert [blob['sha256'] for blob in upload['missing']] == [hashlib.sha256(source).hexdigest()]
+    store.write_chunk(upload['upload_id'], hashlib.sha256(source).hexdigest(), 0, source)
+
+    destination = tmp_path / 'workspace'
+    assert store.complete(upload['upload_id'], str(destination)) == 2
+    assert (destination / 'pkg' / '__init__.py').read_bytes() == b''
+    assert (destination / 'pkg' / 'main.py').read_bytes() == source
+
+
+def test_empty_chunk_for_empty_file_completes(tmp_path):
+    store = UploadStore(root=str(tmp_path / 'blobs'))
+    upload = store.begin([_entry('empty.py', b'')])
+    assert store.write_chunk(upload['upload_id'], EMPTY_SHA256, 0, b'') == {'received': 0, 'complete': True}
+
+    # Even if the blob was evicted after the upload began
+    store.blob_path(EMPTY_SHA256).unlink()
+    assert store.write_chunk(upload['upload_id'], EMPTY_SHA256, 0, b'') == {'received': 0, 'complete': True}
+    assert store.complete(upload['upload_id'], str(tmp_path / 'workspace')) == 1
+
+
+def test_empty_file_with_wrong_hash_is_rejected(tmp_path):
+    store = UploadStore(root=str(tmp_path / 'blobs'))
+    with pytest.raises(ValueError):
+        store.begin([{'path': 'empty.py', 'size': 0, 'sha256': '0' * 64}])
+
+
+@pytest.mark.parametrize('path', [
+    '.github/workflows/ci.yml',
+    '.eslintrc.js',
+    '文件.py',
+    'a b/c.py',
+    'docs/日本語/読む.md',
+    'pkg/__init__.py',
+])
+def test_paths_are_kept_as_given(path):
+    assert safe_relative_path(path) == path
+
+
+def test_dot_components_and_backslashes_are_normalized():
+    assert safe_relative_path('./src/main.py') == 'src/main.py'
+    assert safe_relative_path('src\\lib\\util.py') == 'src/lib/util.py'
+
+
+@pytest.mark.parametrize('path', [
+    '', '/etc/passwd', '\\server\\share.py', 'C:/Windows/win.ini', 'c:evil.py',
+    '../outside.py', 'src/../../outside.py', 'src//main.py', 'src/', 'bad\0name.py', '.',
+])
+def test_unsafe_paths_are_rejected(path):
+    with pytest.raises(ValueError):
+        safe_relative_path(path)
+
+
+def test_distinct_names_stay_distinct(tmp_path):
+    store = UploadStore(root=str(tmp_path / 'blobs'))
+    files = {'.env': b'A=1\n', 'env': b'B=2\n', '文件.py': b'x = 1\n', 'py': b'y = 2\n'}
+    upload = store.begin([_entry(path, data) for path, data in files.items()])
+    for path, data in files.items():
+        store.write_chunk(upload['upload_id'], hashlib.sha256(data).hexdigest(), 0, data)
+
+    destination = tmp_path / 'workspace'
+    assert store.complete(upload['upload_id'], str(destination)) == 4
+    for path, data in files.items():
+        assert (destination / path).read_bytes() == data
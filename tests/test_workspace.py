@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+import time
+
+from workspace import WorkspaceManager
+
+
+def _manager(root, **kwargs):
+    kwargs.setdefault('sweep_interval', 0)
+    return WorkspaceManager(root=str(root), **kwargs)
+
+
+def _populated(manager, size=1000, **kwargs):
+    workspace = manager.create('upload', **kwargs)
+    with open(os.path.join(workspace.path, 'a.py'), 'wb') as f:
+        f.write(b'x' * size)
+    manager.finalize(workspace)
+    return workspace
+
+
+def _age(workspace, seconds):
+    past = time.time() - seconds
+    os.utime(workspace.path, (past, past))
+
+
+def test_idle_workspaces_expire_after_the_ttl(tmp_path):
+    manager = _manager(tmp_path, ttl=60)
+    idle = _populated(manager)
+    recent = _populated(manager)
+    manager.release(idle)
+    manager.release(recent)
+    _age(idle, 120)
+
+    assert manager.evict_expired() == 1
+    assert not os.path.exists(idle.path) and not (tmp_path / f'{idle.id}.json').exists()
+    assert manager.get(idle.id) is None
+    assert manager.get(recent.id) is recent
+
+
+def test_held_workspaces_are_never_expired(tmp_path):
+    manager = _manager(tmp_path, ttl=60)
+    workspace = _populated(manager)
+    _age(workspace, 120)
+    assert manager.evict_expired() == 0
+
+    with manager.lease(workspace.id) as leased:
+        manager.release(workspace)
+        _age(workspace, 120)
+        assert leased is workspace and manager.evict_expired() == 0
+    assert workspace.refcount == 0
+
+
+def test_quota_evicts_the_least_recently_used_first(tmp_path):
+    manager = _manager(tmp_path, quota_bytes=2500)
+    oldest = _populated(manager)
+    manager.release(oldest)
+    _age(oldest, 30)
+    newer = _populated(manager)
+    manager.release(newer)
+    _age(newer, 20)
+
+    held = _populated(manager)
+    assert not os.path.exists(oldest.path)
+    assert os.path.exists(newer.path) and os.path.exists(held.path)
+    assert manager.total_bytes() == 2000
+
+
+def test_another_worker_adopts_finalized_workspaces(tmp_path):
+    first = _manager(tmp_path)
+    workspace = _populated(first, repo_url='https://github.com/o/r', commit='abc')
+    second = _manager(tmp_path)
+
+    adopted = second.find('https://github.com/o/r', 'abc')
+    assert adopted.id == workspace.id and adopted.size_bytes == 1000
+    assert second.find('https://github.com/o/r', 'def') is None
+    assert second.get('../etc') is None
+
+
+def test_holds_of_other_live_processes_are_respected(tmp_path):
+    first = _manager(tmp_path, ttl=60)
+    workspace = _populated(first)
+    second = _manager(tmp_path, ttl=60)
+    _age(workspace, 120)
+    # The first manager's hold marker belongs to this (live) process
+    assert second.evict_expired() == 0
+
+
+def test_holds_of_exited_processes_are_ignored(tmp_path):
+    manager = _manager(tmp_path, ttl=60)
+    workspace = _populated(manager)
+    manager.release(workspace)
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    marker = tmp_path / '.holds' / f'{workspace.id}.{exited.pid}'
+    marker.touch()
+    _age(workspace, 120)
+
+    assert manager.evict_expired() == 1
+    assert not marker.exists()
+
+
+def test_forced_removal_of_a_held_workspace(tmp_path):
+    manager = _manager(tmp_path)
+    workspace = _populated(manager)
+    assert manager.remove(workspace) is False
+    assert manager.remove(workspace, force=True) is True
+    assert not os.path.exists(workspace.path) and manager.list() == []
@@ -0,0 +1,359 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# A leading drive letter (C:) makes a Windows path absolute
+DRIVE_PATTERN = re.compile(r'^[A-Za-z]:')
+
+COPY_BUFFER = 1024 * 1024
+
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+
+
+class UploadConflict(Exception):
+    """A chunk did not start where the stored part of the blob ends"""
+
+    def __init__(self, received: int):
+        super().__init__(f'Expected offset {received}')
+        self.received = received
+
+
+def safe_relative_path(path: str) -> str:
+    """Validate an uploaded relative path, keeping every component as given
+
+    Dotfiles, spaces and non-ASCII names are kept so that distinct files stay
+    distinct. Raises ValueError for absolute paths, drive letters, NUL bytes,
+    `..` and empty components; `.` components are dropped.
+    """
+    if not path or '\0' in path:
+        raise ValueError(f'Invalid path: {path!r}')
+    if path[0] in '/\\' or DRIVE_PATTERN.match(path):
+        raise ValueError(f'Absolute path: {path}')
+
+    parts = []
+    for part in re.split(r'[\\/]', path):
+        if part == '.':
+            continue
+        if part == '':
+            raise ValueError(f'Empty path component: {path}')
+        if part == '..':
+            raise ValueError(f'Parent directory in path: {path}')
+        parts.append(part)
+    if not parts:
+        raise ValueError(f'Invalid path: {path!r}')
+    return '/'.join(parts)
+
+
+class UploadStore:
+    """Content-addressed blob store with resumable, chunked uploads
+
+    Blobs are stored once under their SHA-256 and hard-linked into workspaces,
+    so files shared between uploads are neither transferred nor stored twice,
+    and keep the same inode (which the per-file analysis cache is keyed on).
+    An upload starts with a manifest of paths, sizes and hashes; the client
+    then sends only the blobs the store does not have, in chunks at explicit
+    offsets, and can ask how much of each blob arrived to resume after a
+    dropped connection.
+    """
+
+    def __init__(self, root: str = 'temp_blobs', chunk_size: int = 8 * 1024 * 1024,
+                 max_bytes: int = 1024**3, max_files: int = 50000, ttl: float = 86400):
+        self.root = Path(root).absolute()
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.ttl = ttl
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._begun = 0
+
+        for directory in ('blobs', 'partial', 'uploads'):
+            (self.root / directory).mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> 'UploadStore':
+        return cls(
+            root=os.getenv('DOCSMITH_BLOB_DIR', 'temp_blobs'),
+            chunk_size=int(float(os.getenv('DOCSMITH_UPLOAD_CHUNK_MB', '8')) * 1024 * 1024),
+            max_bytes=int(float(os.getenv('DOCSMITH_UPLOAD_MAX_MB', '1024')) * 1024 * 1024),
+            max_files=int(os.getenv('DOCSMITH_UPLOAD_MAX_FILES', '50000')),
+            ttl=float(os.getenv('DOCSMITH_UPLOAD_TTL', '86400'))
+        )
+
+    # Blobs
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / 'blobs' / digest[:2] / digest
+
+    def has_blob(self, digest: str) -> bool:
+        return self.blob_path(digest).is_file()
+
+    def _commit_blob(self, temp_path: Path, digest: str):
+        """Move a verified temporary file into place (read-only, since workspaces share it)"""
+        blob_path = self.blob_path(digest)
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(temp_path, 0o444)
+        os.replace(temp_path, blob_path)
+
+    def store_stream(self, stream: BinaryIO) -> Tuple[str, int]:
+        """Store a whole file from a stream and return its (digest, size)"""
+        temp_path = self.root / 'partial' / f"{uuid.uuid4().hex}.tmp"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                while True:
+                    data = stream.read(COPY_BUFFER)
+                    if not data:
+                        break
+                    digest.update(data)
+                    f.write(data)
+                    size += len(data)
+
+            hexdigest = digest.hexdigest()
+            if self.has_blob(hexdigest):
+                metrics.inc('docsmith_upload_bytes_total', size, source='reused')
+                temp_path.unlink()
+            else:
+                metrics.inc('docsmith_upload_bytes_total', size, source='stored')
+                self._commit_blob(temp_path, hexdigest)
+            return hexdigest, size
+        except BaseException:
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+            raise
+
+    def link_blob(self, digest: str, destination: Path):
+        """Hard-link a blob into a workspace, copying if the filesystem does not allow it"""
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        if destination.exists():
+            destination.unlink()
+        try:
+            os.link(self.blob_path(digest), destination)
+        except OSError:
+            shutil.copyfile(self.blob_path(digest), destination)
+
+    # Resumable uploads
+
+    def _manifest_path(self, upload_id: str) -> Path:
+        return self.root / 'uploads' / f"{upload_id}.json"
+
+    def _partial_path(self, upload_id: str, digest: str) -> Path:
+        return self.root / 'partial' / upload_id / f"{digest}.part"
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def begin(self, files: List[Dict]) -> Dict:
+        """Start an upload from a manifest of {path, size, sha256} entries
+
+        Raises ValueError if the manifest is invalid or over the limits.
+        """
+        if not isinstance(files, list) or not files:
+            raise ValueError('No files provided')
+        if len(files) > self.max_files:
+            raise ValueError(f'Too many files (limit {self.max_files})')
+
+        entries = {}
+        total = 0
+        for entry in files:
+            try:
+                path = safe_relative_path(str(entry['path']))
+                size = int(entry['size'])
+                digest = str(entry['sha256']).lower()
+            except (KeyError, TypeError):
+                raise ValueError('Each file needs a path, size and sha256')
+            if size < 0 or not DIGEST_PATTERN.match(digest):
+                raise ValueError(f'Invalid size or sha256 for {path}')
+            if size == 0 and digest != EMPTY_SHA256:
+                raise ValueError(f'Invalid sha256 for empty file {path}')
+            if path in entries:
+                raise ValueError(f'Duplicate path: {path}')
+            entries[path] = {'path': path, 'size': size, 'sha256': digest}
+            total += size
+
+        if total > self.max_bytes:
+            raise ValueError(f'Upload is larger than {self.max_bytes // (1024 * 1024)} MB')
+
+        upload_id = uuid.uuid4().hex
+        manifest = {'upload_id': upload_id, 'created': time.time(), 'files': list(entries.values())}
+        temp_path = self._manifest_path(upload_id).with_suffix('.tmp')
+        temp_path.write_text(json.dumps(manifest), encoding='utf-8')
+        os.replace(temp_path, self._manifest_path(upload_id))
+
+        self._begun += 1
+        if self._begun % 20 == 0:
+            self.evict_expired()
+        return self.status(upload_id)
+
+    def _manifest(self, upload_id: str) -> Dict:
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise KeyError(upload_id)
+        try:
+            with open(self._manifest_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise KeyError(upload_id)
+
+    def _blob_sizes(self, manifest: Dict) -> Dict[str, int]:
+        return {entry['sha256']: entry['size'] for entry in manifest['files']}
+
+    def _store_empty_blob(self):
+        """Empty files have no chunks to send; their blob is known in advance"""
+        if not self.has_blob(EMPTY_SHA256):
+            temp_path = self.root / 'partial' / f"{uuid.uuid4().hex}.tmp"
+            temp_path.touch()
+            self._commit_blob(temp_path, EMPTY_SHA256)
+
+    def status(self, upload_id: str) -> Dict:
+        """Blobs still missing from an upload and how many bytes of each have arrived
+
+        Raises KeyError for unknown or expired uploads.
+        """
+        manifest = self._manifest(upload_id)
+        missing = []
+        reused_bytes = 0
+        for digest, size in self._blob_sizes(manifest).items():
+            if size == 0:
+                self._store_empty_blob()
+            if self.has_blob(digest):
+                reused_bytes += size
+                continue
+            try:
+                received = self._partial_path(upload_id, digest).stat().st_size
+            except OSError:
+                received = 0
+            missing.append({'sha256': digest, 'size': size, 'received': received})
+
+        return {
+            'upload_id': upload_id,
+            'chunk_size': self.chunk_size,
+            'files_count': len(manifest['files']),
+            'missing': missing,
+            'reused_bytes': reused_bytes
+        }
+
+    def write_chunk(self, upload_id: str, digest: str, offset: int, data: bytes) -> Dict:
+        """Append a chunk of a blob at offset and return {'received', 'complete'}
+
+        Chunks that were already stored are accepted again, so a client can
+        simply retry. Raises KeyError for unknown uploads or blobs, UploadConflict
+        if the chunk would leave a gap and ValueError if the finished blob does
+        not match its hash.
+        """
+        manifest = self._manifest(upload_id)
+        size = self._blob_sizes(manifest).get(digest)
+        if size is None:
+            raise KeyError(digest)
+        if self.has_blob(digest):
+            return {'received': size, 'complete': True}
+        if offset < 0 or offset + len(data) > size:
+            raise ValueError('Chunk extends past the end of the file')
+
+        partial_path = self._partial_path(upload_id, digest)
+        with self._lock_for(f"{upload_id}/{digest}"):
+            partial_path.parent.mkdir(parents=True, exist_ok=True)
+            if not partial_path.exists():
+                partial_path.touch()
+            received = partial_path.stat().st_size
+            if offset > received:
+                raise UploadConflict(received)
+
+            if offset + len(data) > received:
+                with open(partial_path, 'r+b') as f:
+                    f.seek(offset)
+                    f.write(data)
+                received = offset + len(data)
+            metrics.inc('docsmith_upload_bytes_total', len(data), source='chunk')
+
+            if received < size:
+                return {'received': received, 'complete': False}
+
+            digest_check = hashlib.sha256()
+            with open(partial_path, 'rb') as f:
+                for block in iter(lambda: f.read(COPY_BUFFER), b''):
+                    digest_check.update(block)
+            if digest_check.hexdigest() != digest:
+                partial_path.unlink()
+                raise ValueError('Uploaded content does not match its sha256; send the file again')
+            self._commit_blob(partial_path, digest)
+
+        with self._locks_lock:
+            self._locks.pop(f"{upload_id}/{digest}", None)
+        return {'received': size, 'complete': True}
+
+    def complete(self, upload_id: str, destination: str) -> int:
+        """Link every file of a finished upload into destination and return the file count
+
+        Raises KeyError for unknown uploads and ValueError if blobs are missing.
+        """
+        manifest = self._manifest(upload_id)
+        if any(size == 0 for size in self._blob_sizes(manifest).values()):
+            self._store_empty_blob()
+        missing = [digest for digest in self._blob_sizes(manifest) if not self.has_blob(digest)]
+        if missing:
+            raise ValueError(f'{len(missing)} files have not been uploaded yet')
+
+        for entry in manifest['files']:
+            self.link_blob(entry['sha256'], Path(destination) / entry['path'])
+
+        self.discard(upload_id)
+        return len(manifest['files'])
+
+    def discard(self, upload_id: str):
+        shutil.rmtree(self.root / 'partial' / upload_id, ignore_errors=True)
+        try:
+            self._manifest_path(upload_id).unlink()
+        except OSError:
+            pass
+
+    def evict_expired(self) -> int:
+        """Remove stale uploads and blobs no workspace links to any more
+
+        A blob's ctime changes whenever a link to it is added or removed, so an
+        unlinked blob is kept for the TTL after its last workspace went away.
+        """
+        cutoff = time.time() - self.ttl
+        removed = 0
+
+        for entry in os.scandir(self.root / 'uploads'):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    self.discard(Path(entry.name).stem)
+                    removed += 1
+            except OSError:
+                pass
+
+        for entry in os.scandir(self.root / 'partial'):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+        for root, dirs, files in os.walk(self.root / 'blobs'):
+            for file in files:
+                blob_path = os.path.join(root, file)
+                try:
+                    stat = os.stat(blob_path)
+                    if stat.st_nlink <= 1 and stat.st_ctime < cutoff:
+                        os.unlink(blob_path)
+                        removed += 1
+                except OSError:
+                    pass
+
+        return removed
@@ -0,0 +1,447 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from metrics import metrics, record_cache
+from singleflight import SingleFlight
+from retrieval_index import index_path_for, evict_indexes
+
+
+def directory_size(path: str) -> int:
+    """Total size in bytes of all regular files below path"""
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class Workspace:
+    """A directory holding one cloned or uploaded codebase"""
+
+    def __init__(self, workspace_id: str, path: str, kind: str,
+                 repo_url: Optional[str] = None, commit: Optional[str] = None):
+        self.id = workspace_id
+        self.path = path
+        self.kind = kind
+        self.repo_url = repo_url
+        self.commit = commit
+        self.refcount = 0
+        self.size_bytes = 0
+        self.created = time.time()
+        self.last_used = self.created
+
+    @property
+    def key(self) -> Optional[Tuple[str, str]]:
+        if self.repo_url and self.commit:
+            return (self.repo_url, self.commit)
+        return None
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'repo_url': self.repo_url,
+            'commit': self.commit,
+            'refcount': self.refcount,
+            'size_bytes': self.size_bytes,
+            'idle_seconds': round(time.time() - self.last_used, 1)
+        }
+
+
+class WorkspaceManager:
+    """Owns clone and upload directories with reference counting, TTL and a disk quota
+
+    Requests hold a lease (reference) while they read a workspace. Workspaces
+    nobody holds are removed once idle for longer than the TTL, and least
+    recently used ones are evicted first when the total size exceeds the quota.
+    GitHub clones are indexed by (repo URL, commit) so each commit is fetched once.
+
+    Several worker processes share the root directory, so everything they must
+    agree on lives on disk: each workspace has a <id>.json metadata file (kind,
+    repo, commit, size), its directory mtime is its last use, and every
+    process holding it has a marker in .holds/. Any worker can adopt a
+    workspace another one created, and the TTL and quota sweep counts all of
+    them, skipping those held by a live process.
+    """
+
+    def __init__(self, root: str = 'temp_workspaces', ttl: float = 3600, quota_bytes: int = 2 * 1024**3,
+                 sweep_interval: float = 300):
+        self.root = Path(root).absolute()
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.sweep_interval = sweep_interval
+        self._workspaces: 'OrderedDict[str, Workspace]' = OrderedDict()
+        self._by_key: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.RLock()
+        # Concurrent requests for the same repository share one clone
+        self._clones = SingleFlight('clone')
+        self._holds = self.root / '.holds'
+        # The sweeper thread does not survive a fork, so each worker starts its own
+        self._sweeper_pid: Optional[int] = None
+
+        self._holds.mkdir(parents=True, exist_ok=True)
+        self.sweep()
+
+    @classmethod
+    def from_env(cls) -> 'WorkspaceManager':
+        return cls(
+            root=os.getenv('DOCSMITH_WORKSPACE_ROOT', 'temp_workspaces'),
+            ttl=float(os.getenv('DOCSMITH_WORKSPACE_TTL', '3600')),
+            quota_bytes=int(float(os.getenv('DOCSMITH_WORKSPACE_QUOTA_MB', '2048')) * 1024 * 1024),
+            sweep_interval=float(os.getenv('DOCSMITH_WORKSPACE_SWEEP_INTERVAL', '300'))
+        )
+
+    def create(self, kind: str, repo_url: Optional[str] = None, commit: Optional[str] = None) -> Workspace:
+        """Allocate an empty workspace directory, returned with one reference held"""
+        self.start_sweeper()
+        self.evict_expired()
+
+        workspace_id = uuid.uuid4().hex
+        path = self.root / workspace_id
+        path.mkdir(parents=True)
+
+        workspace = Workspace(workspace_id, str(path), kind, repo_url, commit)
+        workspace.refcount = 1
+        self._hold_path(workspace.id).touch()
+        with self._lock:
+            self._workspaces[workspace_id] = workspace
+        return workspace
+
+    def finalize(self, workspace: Workspace):
+        """Record the populated workspace's size and index it, then enforce the quota"""
+        workspace.size_bytes = directory_size(workspace.path)
+        self._write_meta(workspace)
+        with self._lock:
+            if workspace.key:
+                self._by_key[workspace.key] = workspace.id
+            self._update_gauges()
+        self._enforce_quota()
+
+    def owns(self, path: str) -> bool:
+        """Whether path is a workspace directory (whose contents never change once finalized)"""
+        return Path(path).absolute().parent == self.root
+
+    def get(self, workspace_id: Optional[str]) -> Optional[Workspace]:
+        """A workspace by id, adopting it from disk if another worker created it"""
+        if not workspace_id:
+            return None
+        with self._lock:
+            workspace = self._workspaces.get(workspace_id)
+            if workspace is None:
+                return self._adopt(workspace_id)
+            if not os.path.isdir(workspace.path):
+                self._forget(workspace)
+                return None
+            return workspace
+
+    def find(self, repo_url: str, commit: str) -> Optional[Workspace]:
+        with self._lock:
+            workspace = self.get(self._by_key.get((repo_url, commit)))
+            if workspace is not None:
+                return workspace
+            # Cloned by another worker?
+            for workspace_id, meta in self._read_all_meta():
+                if meta.get('repo_url') == repo_url and meta.get('commit') == commit:
+                    return self.get(workspace_id)
+            return None
+
+    def acquire(self, workspace_id: Optional[str]) -> Optional[Workspace]:
+        self.start_sweeper()
+        with self._lock:
+            workspace = self.get(workspace_id)
+            if workspace is not None:
+                if workspace.refcount == 0:
+                    self._hold_path(workspace.id).touch()
+                workspace.refcount += 1
+                self._touch(workspace)
+                self._workspaces.move_to_end(workspace.id)
+            return workspace
+
+    def release(self, workspace: Optional[Workspace]):
+        if workspace is None:
+            return
+        with self._lock:
+            workspace.refcount = max(0, workspace.refcount - 1)
+            self._touch(workspace)
+            if workspace.refcount == 0:
+                self._unhold(workspace.id)
+
+    @contextmanager
+    def lease(self, workspace_id: Optional[str]) -> Iterator[Optional[Workspace]]:
+        """Hold a workspace for the duration of a block (yields None if it is gone)"""
+        workspace = self.acquire(workspace_id)
+        try:
+            yield workspace
+        finally:
+            self.release(workspace)
+
+    def acquire_github(self, github_handler, repo_url: str, branch: str = 'main') -> Workspace:
+        """Return a held workspace for the branch head, cloning only if this commit is not present"""
+        normalized_url = github_handler._normalize_github_url(repo_url)
+        commit = github_handler.resolve_commit(repo_url, branch)
+
+        workspace_id = self._clones.do(
+            f"{normalized_url}@{commit or branch}",
+            lambda: self._clone(github_handler, repo_url, branch, normalized_url, commit)
+        )
+        workspace = self.acquire(workspace_id)
+        if workspace is None:
+            raise ValueError("Cloned workspace was removed before it could be used")
+        return workspace
+
+    def _clone(self, github_handler, repo_url: str, branch: str, normalized_url: str, commit: Optional[str]) -> str:
+        if commit:
+            existing = self.find(normalized_url, commit)
+            if existing is not None:
+                record_cache('workspace', True)
+                return existing.id
+        record_cache('workspace', False)
+
+        workspace = self.create('github', repo_url=normalized_url)
+        try:
+            github_handler.clone_repository(repo_url, branch, dest_dir=workspace.path)
+            workspace.commit = github_handler.get_head_commit(workspace.path) or commit
+        except Exception:
+            self.remove(workspace, force=True)
+            raise
+
+        # The branch may have moved onto a commit that is already present
+        existing = self.find(normalized_url, workspace.commit) if workspace.commit else None
+        if existing is not None and existing.id != workspace.id:
+            self.remove(workspace, force=True)
+            return existing.id
+
+        self.finalize(workspace)
+        # Callers take their own references
+        self.release(workspace)
+        return workspace.id
+
+    def remove(self, workspace: Workspace, force: bool = False) -> bool:
+        with self._lock:
+            if workspace.refcount > 0 and not force:
+                return False
+            self._forget(workspace)
+            self._unhold(workspace.id)
+        self._delete(workspace.id)
+        metrics.inc('docsmith_workspace_evictions_total', kind=workspace.kind)
+        return True
+
+    def evict_expired(self) -> int:
+        """Remove workspaces of any worker that nobody holds and that were idle for longer than the TTL"""
+        now = time.time()
+        held = self._held_ids()
+        removed = 0
+        for workspace_id, last_used, size in self._disk_entries(sizes=False):
+            if workspace_id not in held and now - last_used > self.ttl:
+                removed += self._evict(workspace_id)
+
+        # Metadata whose directory is gone (a worker died mid-removal)
+        for path in self.root.glob('*.json'):
+            if not (self.root / path.stem).is_dir():
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        return removed
+
+    def sweep(self) -> int:
+        """Expire idle workspaces, then enforce the quota; runs in every worker process"""
+        removed = self.evict_expired() + self._enforce_quota()
+        # Indexes of workspaces removed by a process that died first, and of old local-path analyses
+        live = [str(self.root / workspace_id) for workspace_id, _, _ in self._disk_entries(sizes=False)]
+        evict_indexes(live, self.ttl)
+        with self._lock:
+            self._update_gauges()
+        return removed
+
+    def total_bytes(self) -> int:
+        """Size of all workspaces on disk, whichever worker created them"""
+        return sum(size for _, _, size in self._disk_entries())
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            return [workspace.to_dict() for workspace in self._workspaces.values()]
+
+    def _enforce_quota(self) -> int:
+        held = self._held_ids()
+        entries = self._disk_entries()
+        total = sum(size for _, _, size in entries)
+        removed = 0
+        # Least recently used first
+        for workspace_id, last_used, size in sorted(entries, key=lambda entry: entry[1]):
+            if total <= self.quota_bytes:
+                break
+            if workspace_id not in held and self._evict(workspace_id):
+                total -= size
+                removed += 1
+        return removed
+
+    def _evict(self, workspace_id: str) -> int:
+        with self._lock:
+            workspace = self._workspaces.get(workspace_id)
+            if workspace is not None:
+                return 1 if self.remove(workspace) else 0
+        self._delete(workspace_id)
+        metrics.inc('docsmith_workspace_evictions_total', kind=self._read_meta(workspace_id).get('kind', 'unknown'))
+        return 1
+
+    def _delete(self, workspace_id: str):
+        shutil.rmtree(self.root / workspace_id, ignore_errors=True)
+        for path in (self.root / f"{workspace_id}.json", index_path_for(str(self.root / workspace_id))):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _forget(self, workspace: Workspace):
+        self._workspaces.pop(workspace.id, None)
+        if workspace.key and self._by_key.get(workspace.key) == workspace.id:
+            del self._by_key[workspace.key]
+
+    def _update_gauges(self):
+        metrics.set('docsmith_workspace_bytes', self.total_bytes())
+        metrics.set('docsmith_workspaces', len(self._disk_entries(sizes=False)))
+
+    # On-disk state shared by worker processes
+
+    def _touch(self, workspace: Workspace):
+        workspace.last_used = time.time()
+        try:
+            os.utime(workspace.path)
+        except OSError:
+            pass
+
+    def _write_meta(self, workspace: Workspace):
+        meta = {
+            'kind': workspace.kind,
+            'repo_url': workspace.repo_url,
+            'commit': workspace.commit,
+            'size_bytes': workspace.size_bytes,
+            'created': workspace.created
+        }
+        path = self.root / f"{workspace.id}.json"
+        temp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        temp_path.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(temp_path, path)
+
+    def _read_meta(self, workspace_id: str) -> Dict:
+        try:
+            with open(self.root / f"{workspace_id}.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _read_all_meta(self) -> Iterator[Tuple[str, Dict]]:
+        for path in self.root.glob('*.json'):
+            meta = self._read_meta(path.stem)
+            if meta:
+                yield path.stem, meta
+
+    def _adopt(self, workspace_id: str) -> Optional[Workspace]:
+        """Register a finalized workspace created by another worker (caller holds the lock)"""
+        if not re.fullmatch(r'[0-9a-f]{32}', workspace_id):
+            return None
+        meta = self._read_meta(workspace_id)
+        path = self.root / workspace_id
+        if not meta or not path.is_dir():
+            return None
+
+        workspace = Workspace(workspace_id, str(path), meta['kind'], meta.get('repo_url'), meta.get('commit'))
+        workspace.size_bytes = meta.get('size_bytes', 0)
+        workspace.created = meta.get('created', workspace.created)
+        self._workspaces[workspace_id] = workspace
+        if workspace.key:
+            self._by_key.setdefault(workspace.key, workspace_id)
+        return workspace
+
+    def _disk_entries(self, sizes: bool = True) -> List[Tuple[str, float, int]]:
+        """(workspace id, last use, size in bytes or 0 without sizes) of every workspace directory"""
+        entries = []
+        try:
+            scan = list(os.scandir(self.root))
+        except OSError:
+            return entries
+        for entry in scan:
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if not entry.is_dir():
+                    continue
+                last_used = entry.stat().st_mtime
+            except OSError:
+                continue
+            size = self._read_meta(entry.name).get('size_bytes', 0) if sizes else 0
+            if sizes and not (self.root / f"{entry.name}.json").exists():
+                # Still being populated, or left behind by a crashed worker
+                size = directory_size(entry.path)
+            entries.append((entry.name, last_used, size))
+        return entries
+
+    def _hold_path(self, workspace_id: str) -> Path:
+        return self._holds / f"{workspace_id}.{os.getpid()}"
+
+    def _unhold(self, workspace_id: str):
+        try:
+            self._hold_path(workspace_id).unlink()
+        except OSError:
+            pass
+
+    def _held_ids(self) -> set:
+        """Workspaces held by a live process; markers of exited workers are removed"""
+        held = set()
+        with self._lock:
+            held.update(workspace.id for workspace in self._workspaces.values() if workspace.refcount > 0)
+        try:
+            markers = list(os.scandir(self._holds))
+        except OSError:
+            return held
+        for marker in markers:
+            workspace_id, _, pid = marker.name.rpartition('.')
+            if pid.isdigit() and _process_alive(int(pid)):
+                held.add(workspace_id)
+            else:
+                try:
+                    os.unlink(marker.path)
+                except OSError:
+                    pass
+        return held
+
+    def start_sweeper(self):
+        """Sweep every sweep_interval seconds in this process (idempotent, and restarted after a fork)"""
+        if self.sweep_interval <= 0 or self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_loop, name='workspace-sweeper', daemon=True).start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Workspace sweep failed: {str(e)}")
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
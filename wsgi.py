@@ -0,0 +1,13 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from flask_app import app  # noqa: E402
+
+application = app